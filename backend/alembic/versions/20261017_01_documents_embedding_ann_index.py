@@ -0,0 +1,44 @@
+"""ANN index on documents.embedding (HNSW or IVFFlat, cosine distance)"""
+
+from alembic import op
+
+from config import settings
+
+# revision identifiers, used by Alembic.
+revision = "20261017_01"
+down_revision = "20250316_01"
+branch_labels = None
+depends_on = None
+
+HNSW_INDEX_NAME = "ix_documents_embedding_hnsw"
+IVFFLAT_INDEX_NAME = "ix_documents_embedding_ivfflat"
+
+
+def upgrade() -> None:
+    index_type = (settings.vector_index_type or "none").lower()
+    if index_type not in ("hnsw", "ivfflat"):
+        return
+
+    # CONCURRENTLY keeps documents writable during the build; it cannot run in a transaction.
+    with op.get_context().autocommit_block():
+        if settings.vector_index_build_mem:
+            op.execute(f"SET maintenance_work_mem = '{settings.vector_index_build_mem}'")
+        if index_type == "hnsw":
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {HNSW_INDEX_NAME} "
+                "ON documents USING hnsw (embedding vector_cosine_ops) "
+                f"WITH (m = {int(settings.hnsw_m)}, ef_construction = {int(settings.hnsw_ef_construction)})"
+            )
+        else:
+            # IVFFlat trains its lists on existing rows; build it after the initial load.
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {IVFFLAT_INDEX_NAME} "
+                "ON documents USING ivfflat (embedding vector_cosine_ops) "
+                f"WITH (lists = {int(settings.ivfflat_lists)})"
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {IVFFLAT_INDEX_NAME}")
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {HNSW_INDEX_NAME}")
@@ -0,0 +1,37 @@
+"""ingestion_jobs table for background PDF ingestion"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "20261017_02"
+down_revision = "20261017_01"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "ingestion_jobs",
+        sa.Column("id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("filename", sa.Text(), nullable=False),
+        sa.Column("path", sa.Text(), nullable=False),
+        sa.Column("status", sa.Text(), nullable=False, server_default="queued"),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("pages_parsed", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("chunks_split", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("chunks_embedded", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("rows_written", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=False), nullable=False),
+        sa.Column("started_at", sa.DateTime(timezone=False), nullable=True),
+        sa.Column("finished_at", sa.DateTime(timezone=False), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_ingestion_jobs_status", "ingestion_jobs", ["status"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_ingestion_jobs_status", table_name="ingestion_jobs")
+    op.drop_table("ingestion_jobs")
@@ -0,0 +1,56 @@
+"""content hash + embedding model on documents for chunk deduplication"""
+
+from alembic import op
+import sqlalchemy as sa
+
+from config import settings
+
+# revision identifiers, used by Alembic.
+revision = "20261017_03"
+down_revision = "20261017_02"
+branch_labels = None
+depends_on = None
+
+UNIQUE_INDEX_NAME = "ux_documents_embedding_model_content_hash"
+
+
+def upgrade() -> None:
+    op.add_column("documents", sa.Column("content_hash", sa.Text(), nullable=True))
+    op.add_column("documents", sa.Column("embedding_model", sa.Text(), nullable=True))
+
+    # Existing rows were embedded by the currently configured model
+    op.execute(
+        sa.text(
+            "UPDATE documents SET "
+            "content_hash = encode(sha256(convert_to(content, 'UTF8')), 'hex'), "
+            "embedding_model = :model"
+        ).bindparams(model=settings.embedding_model)
+    )
+    # Keep one row per duplicated chunk so the unique index can be built
+    op.execute(
+        "DELETE FROM documents d USING documents keep "
+        "WHERE d.embedding_model = keep.embedding_model "
+        "AND d.content_hash = keep.content_hash "
+        "AND d.ctid > keep.ctid"
+    )
+
+    op.alter_column("documents", "content_hash", nullable=False)
+    op.alter_column("documents", "embedding_model", nullable=False)
+    op.create_index(
+        UNIQUE_INDEX_NAME,
+        "documents",
+        ["embedding_model", "content_hash"],
+        unique=True,
+    )
+
+    op.add_column(
+        "ingestion_jobs",
+        sa.Column("chunks_reused", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("ingestion_jobs", "chunks_reused")
+    op.drop_index(UNIQUE_INDEX_NAME, table_name="documents")
+    op.drop_column("documents", "embedding_model")
+    op.drop_column("documents", "content_hash")
@@ -0,0 +1,41 @@
+"""generated tsvector column + GIN index on documents for lexical retrieval"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from config import settings
+
+# revision identifiers, used by Alembic.
+revision = "20261017_04"
+down_revision = "20261017_03"
+branch_labels = None
+depends_on = None
+
+GIN_INDEX_NAME = "ix_documents_content_tsv"
+
+
+def upgrade() -> None:
+    # Adding a stored generated column rewrites the table once
+    op.add_column(
+        "documents",
+        sa.Column(
+            "content_tsv",
+            postgresql.TSVECTOR(),
+            sa.Computed(
+                f"to_tsvector('{settings.text_search_config}'::regconfig, content)",
+                persisted=True,
+            ),
+        ),
+    )
+    with op.get_context().autocommit_block():
+        op.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {GIN_INDEX_NAME} "
+            "ON documents USING gin (content_tsv)"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {GIN_INDEX_NAME}")
+    op.drop_column("documents", "content_tsv")
@@ -0,0 +1,28 @@
+"""expression indexes on documents.metadata for filtered retrieval"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "20261017_05"
+down_revision = "20261017_04"
+branch_labels = None
+depends_on = None
+
+# The indexed expressions must match services.retrieval.RetrievalFilters exactly
+INDEXES = {
+    "ix_documents_metadata_source_page": "((metadata->>'source'), ((metadata->>'page')::int))",
+    "ix_documents_metadata_ingestion_id": "((metadata->>'ingestion_id'))",
+}
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, expr in INDEXES.items():
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON documents {expr}")
+        op.execute("ANALYZE documents")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
@@ -0,0 +1,26 @@
+"""conversation_summaries table for rolling chat history summaries"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "20261017_06"
+down_revision = "20261017_05"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "conversation_summaries",
+        sa.Column("conversation_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("summary", sa.Text(), nullable=False),
+        sa.Column("turns_summarized", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime(timezone=False), nullable=False),
+        sa.PrimaryKeyConstraint("conversation_id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("conversation_summaries")
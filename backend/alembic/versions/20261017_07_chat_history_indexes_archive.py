@@ -0,0 +1,46 @@
+"""chat_history lookup indexes and chat_history_archive for retention"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "20261017_07"
+down_revision = "20261017_06"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "chat_history_archive",
+        sa.Column("id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("conversation_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("question", sa.Text(), nullable=False),
+        sa.Column("answer", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=False), nullable=False),
+        sa.Column("archived_at", sa.DateTime(timezone=False), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_chat_history_archive_conversation_id", "chat_history_archive", ["conversation_id"]
+    )
+    with op.get_context().autocommit_block():
+        # Per-conversation reads and keyset pagination: WHERE conversation_id = ? ORDER BY created_at, id
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chat_history_conversation_created "
+            "ON chat_history (conversation_id, created_at, id)"
+        )
+        # Retention: find turns older than the cutoff without a full scan
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chat_history_created_at "
+            "ON chat_history (created_at)"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_chat_history_created_at")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_chat_history_conversation_created")
+    op.drop_index("ix_chat_history_archive_conversation_id", table_name="chat_history_archive")
+    op.drop_table("chat_history_archive")
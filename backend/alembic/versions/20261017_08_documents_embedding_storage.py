@@ -0,0 +1,89 @@
+"""documents.embedding storage: halfvec column and/or binary-quantized ANN index"""
+
+from alembic import op
+import sqlalchemy as sa
+
+from config import settings
+
+# revision identifiers, used by Alembic.
+revision = "20261017_08"
+down_revision = "20261017_07"
+branch_labels = None
+depends_on = None
+
+# Must match services.vector_index
+HNSW_INDEX_NAME = "ix_documents_embedding_hnsw"
+IVFFLAT_INDEX_NAME = "ix_documents_embedding_ivfflat"
+BINARY_HNSW_INDEX_NAME = "ix_documents_embedding_bit_hnsw"
+BINARY_IVFFLAT_INDEX_NAME = "ix_documents_embedding_bit_ivfflat"
+
+DIM = int(settings.pgvector_dim)
+
+
+def _column_type() -> str:
+    return op.get_bind().execute(
+        sa.text(
+            "SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+            "WHERE attrelid = 'documents'::regclass AND attname = 'embedding'"
+        )
+    ).scalar_one()
+
+
+def _index_params(index_type: str) -> str:
+    if index_type == "hnsw":
+        return f"WITH (m = {int(settings.hnsw_m)}, ef_construction = {int(settings.hnsw_ef_construction)})"
+    return f"WITH (lists = {int(settings.ivfflat_lists)})"
+
+
+def _create_column_index(index_type: str, storage: str) -> None:
+    name = HNSW_INDEX_NAME if index_type == "hnsw" else IVFFLAT_INDEX_NAME
+    op.execute(
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+        f"ON documents USING {index_type} (embedding {storage}_cosine_ops) {_index_params(index_type)}"
+    )
+
+
+def _drop_ann_indexes() -> None:
+    for name in (HNSW_INDEX_NAME, IVFFLAT_INDEX_NAME, BINARY_HNSW_INDEX_NAME, BINARY_IVFFLAT_INDEX_NAME):
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def upgrade() -> None:
+    storage = (settings.vector_storage or "vector").lower()
+    quantization = (settings.vector_quantization or "none").lower()
+    index_type = (settings.vector_index_type or "none").lower()
+    if storage == "vector" and quantization == "none":
+        return
+
+    # Rewriting the column takes an ACCESS EXCLUSIVE lock on documents for the whole table rewrite
+    with op.get_context().autocommit_block():
+        _drop_ann_indexes()
+        if storage == "halfvec" and not _column_type().startswith("halfvec"):
+            op.execute(f"ALTER TABLE documents ALTER COLUMN embedding TYPE halfvec({DIM}) USING embedding::halfvec({DIM})")
+        if index_type not in ("hnsw", "ivfflat"):
+            return
+        if settings.vector_index_build_mem:
+            op.execute(f"SET maintenance_work_mem = '{settings.vector_index_build_mem}'")
+        if quantization == "binary":
+            name = BINARY_HNSW_INDEX_NAME if index_type == "hnsw" else BINARY_IVFFLAT_INDEX_NAME
+            # The expression must match services.vector_index.binary_index_expression()
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON documents USING {index_type} "
+                f"((binary_quantize(embedding)::bit({DIM})) bit_hamming_ops) {_index_params(index_type)}"
+            )
+        else:
+            _create_column_index(index_type, storage)
+        op.execute("ANALYZE documents")
+
+
+def downgrade() -> None:
+    # Back to a float32 column with the index from 20261017_01
+    index_type = (settings.vector_index_type or "none").lower()
+    with op.get_context().autocommit_block():
+        _drop_ann_indexes()
+        if not _column_type().startswith("vector"):
+            op.execute(f"ALTER TABLE documents ALTER COLUMN embedding TYPE vector({DIM}) USING embedding::vector({DIM})")
+        if index_type in ("hnsw", "ivfflat"):
+            if settings.vector_index_build_mem:
+                op.execute(f"SET maintenance_work_mem = '{settings.vector_index_build_mem}'")
+            _create_column_index(index_type, "vector")
@@ -0,0 +1,58 @@
+"""document_ingestions: every upload position of a (deduplicated) chunk, used by retrieval filters"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "20261017_09"
+down_revision = "20261017_08"
+branch_labels = None
+depends_on = None
+
+# From 20261017_05; filters now read document_ingestions instead
+METADATA_INDEXES = {
+    "ix_documents_metadata_source_page": "((metadata->>'source'), ((metadata->>'page')::int))",
+    "ix_documents_metadata_ingestion_id": "((metadata->>'ingestion_id'))",
+}
+
+
+def upgrade() -> None:
+    op.create_table(
+        "document_ingestions",
+        sa.Column("id", sa.BigInteger(), sa.Identity(), nullable=False),
+        sa.Column("document_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("ingestion_id", sa.Text(), nullable=True),
+        sa.Column("source", sa.Text(), nullable=True),
+        sa.Column("filename", sa.Text(), nullable=True),
+        sa.Column("page", sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.ForeignKeyConstraint(["document_id"], ["documents.id"], ondelete="CASCADE"),
+    )
+    # One row per position of a chunk in a file; ingestion writes use ON CONFLICT DO NOTHING
+    op.create_index(
+        "ux_document_ingestions_document_source_page",
+        "document_ingestions",
+        ["document_id", "source", "page"],
+        unique=True,
+    )
+    op.create_index("ix_document_ingestions_ingestion_id", "document_ingestions", ["ingestion_id"])
+    op.create_index("ix_document_ingestions_source_page", "document_ingestions", ["source", "page"])
+    op.create_index("ix_document_ingestions_filename_page", "document_ingestions", ["filename", "page"])
+
+    # Existing chunks: the upload recorded in their metadata (the one that first stored them)
+    op.execute(
+        "INSERT INTO document_ingestions (document_id, ingestion_id, source, filename, page) "
+        "SELECT id, metadata->>'ingestion_id', metadata->>'source', metadata->>'filename', "
+        "(metadata->>'page')::int FROM documents "
+        "ON CONFLICT DO NOTHING"
+    )
+    for name in METADATA_INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+    op.execute("ANALYZE document_ingestions")
+
+
+def downgrade() -> None:
+    for name, expr in METADATA_INDEXES.items():
+        op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON documents {expr}")
+    op.drop_table("document_ingestions")
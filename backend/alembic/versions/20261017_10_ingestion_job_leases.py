@@ -0,0 +1,20 @@
+"""ingestion_jobs owner + lease so replicas only recover jobs whose worker stopped heartbeating"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "20261017_10"
+down_revision = "20261017_09"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("ingestion_jobs", sa.Column("owner", sa.Text(), nullable=True))
+    op.add_column("ingestion_jobs", sa.Column("lease_expires_at", sa.DateTime(timezone=False), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("ingestion_jobs", "lease_expires_at")
+    op.drop_column("ingestion_jobs", "owner")
@@ -2,21 +2,49 @@ import os
 import sys
 from typing import Any
 import uuid
-from fastapi import FastAPI, UploadFile, File, HTTPException, APIRouter, Depends
+from fastapi import FastAPI, UploadFile, File, HTTPException, APIRouter, Depends, Response
 from fastapi.concurrency import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware   
 from sqlalchemy import text
-from services.db import get_session, init_db
-from services.documents import list_documents
-from services.history import append_history, get_history
-from services.ingest import ingest_pdf
-from schemas import UploadResponse, QueryRequest, QueryResponse
-from typing import Any, List, Dict
+from config import settings
+from services.db import dispose_db, get_session, init_db, pool_status
+from services.documents import iter_documents, list_documents, parse_fields
+from services.history import (
+    append_history,
+    cancel_summary_refreshes,
+    get_history_page,
+    get_prompt_history,
+    history_cache,
+    schedule_summary_refresh,
+)
+from services.history_retention import history_retention
+from services.llm import tokenizer
+from services.llm_scheduler import LLMOverloaded, llm_scheduler
+from services.ingest import spool_upload
+from services.jobs import JobQueueFull, get_job, ingestion_jobs
+from services.pdf_parsing import shutdown_parse_pool
+from schemas import IngestJobStatus, UploadResponse, QueryBatchRequest, QueryFilters, QueryRequest, QueryResponse
+from typing import Any, List, Dict, Literal, Optional, Tuple
 from services.db import init_db, get_session
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
+import orjson
 import logging
 from fastapi import Query
-from services.query import answer_question, stream_answer
+from services.query import (
+    answer_question,
+    answer_questions,
+    embedding_model,
+    query_embedding_cache,
+    stream_answer,
+    stream_duration_seconds,
+)
+from services.reranker import reranker
+from services.retrieval import RetrievalFilters
+from services.sse import SSE_HEADERS, SSE_HEARTBEAT, sse_event, with_heartbeats
+from services.vector_store import vector_store
+from services.vector_index import detect_pgvector_version, get_index_status
+from services.answer_cache import answer_cache
+from services.metrics import registry as metrics_registry
 import asyncio
 from starlette.concurrency import run_in_threadpool
 
@@ -32,8 +60,22 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     # Application startup: initialize database (sync)
     init_db()
+    # Decides whether filtered queries may use pgvector iterative scans
+    await asyncio.to_thread(detect_pgvector_version)
+    await ingestion_jobs.start()
+    history_retention.start()
     yield
-    # Application shutdown: (no actions needed currently)
+    # Application shutdown: stop ingestion workers, release pooled async TEI connections
+    await ingestion_jobs.stop()
+    await asyncio.to_thread(shutdown_parse_pool)
+    await history_retention.stop()
+    await vector_store.embeddings.aclose()
+    await embedding_model.aclose()
+    await cancel_summary_refreshes()
+    await tokenizer.aclose()
+    if reranker is not None:
+        await reranker.aclose()
+    await dispose_db()
 
 app = FastAPI(
     title="RAG FastAPI (Postgres)",
@@ -64,6 +106,7 @@ app.add_middleware(
         "Authorization",
         "X-HTTP-Method-Override",
     ],
+    expose_headers=["X-Conversation-Id", "X-Next-Cursor"],
 )
 
 router_v1 = APIRouter(prefix="/v1")
@@ -85,50 +128,137 @@ async def test_db():
 @router_v1.post(
     "/upload",
     response_model=UploadResponse,
+    status_code=202,
     tags=["Ingestion"],
     summary="Upload a PDF document",
-    description="Ingests a PDF, splits into chunks, and stores embeddings in Postgres"
+    description="Stores the PDF and queues a background job that splits it into chunks and stores embeddings in Postgres. Poll /v1/ingest-jobs/{job_id} for progress."
 )
 async def upload_pdf(file: UploadFile = File(...)):
     if not file.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files are supported")
-    
-    contents = await file.read()
-    os.makedirs("pdfs", exist_ok=True)
-    path = os.path.join("pdfs", file.filename)
-    
-    with open(path, "wb") as f:
-        f.write(contents)
+    if ingestion_jobs.is_full():
+        raise HTTPException(status_code=503, detail="Ingestion queue is full", headers={"Retry-After": "30"})
 
-    count = await ingest_pdf(path)
+    # Spool to disk in chunks; never hold the whole upload in memory.
+    # Each job gets its own directory so same-named uploads don't clobber each other.
+    job_id = uuid.uuid4()
+    filename = os.path.basename(file.filename)
+    path = os.path.join(settings.pdf_dir, str(job_id), filename)
+    await spool_upload(file, path)
 
-    logger.info(f"Finished ingestion, inserted {count} chunks.")
+    try:
+        job = await ingestion_jobs.submit(job_id, filename, path)
+    except JobQueueFull:
+        raise HTTPException(status_code=503, detail="Ingestion queue is full", headers={"Retry-After": "30"})
 
     return UploadResponse(
-        message="PDF ingested successfully",
-        inserted_count=count
+        message="PDF queued for ingestion",
+        job_id=str(job.id),
+        status=job.status,
     )
 
+@router_v1.get(
+    "/ingest-jobs/{job_id}",
+    response_model=IngestJobStatus,
+    tags=["Ingestion"],
+    summary="Ingestion job status",
+    description="Status and progress counters (pages parsed, chunks embedded, rows written) for an upload."
+)
+async def ingest_job_status(job_id: str):
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid job_id format (must be UUID)")
+    job = await run_in_threadpool(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return job
+
+def _document_listing_args(fields: Optional[str]) -> Tuple[str, ...]:
+    try:
+        return parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router_v1.get(
     "/documents",
-    summary="List documents with pagination",
-    description="Fetches paginated rows from the Postgres 'documents' table.",
+    summary="List documents with keyset pagination",
+    description=(
+        "Fetches one page of rows from the Postgres 'documents' table, ordered by id. "
+        "When more rows exist, the X-Next-Cursor response header holds the cursor for the next page."
+    ),
     response_model=List[Dict[str, Any]],
 )
-async def get_all_documents(skip: int = Query(0, ge=0), limit: int = Query(10, ge=1, le=100)) -> Any:
-    """
-    Open a single AsyncSession, select all Document rows, and return them.
-    """
+async def get_all_documents(
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    fields: Optional[str] = Query(
+        None, description="Comma-separated subset of id, content, metadata, content_hash, embedding_model"
+    ),
+    embedding: Literal["none", "base64"] = Query(
+        "none", description="Include embeddings as base64 little-endian float32"
+    ),
+) -> Any:
+    selected = _document_listing_args(fields)
     try:
-        logger.info(f"Fetching documents: skip={skip}, limit={limit}")
-        docs = await run_in_threadpool(list_documents, skip=skip, limit=limit)
-        logger.info(f"Received docs from list_documents")
-        return JSONResponse(content=docs)
-
+        docs, next_cursor = await asyncio.wait_for(
+            list_documents(limit=limit, cursor=cursor, fields=selected, embedding_format=embedding),
+            timeout=10.0,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Database request timed out")
     except Exception as e:
-        if isinstance(e, asyncio.TimeoutError):
-            raise HTTPException(status_code=504, detail="Database request timed out")
+        logger.exception("Database error while listing documents")
         raise HTTPException(status_code=500, detail=f"Database error: {e}")
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return ORJSONResponse(content=docs, headers=headers)
+
+@router_v1.get(
+    "/documents/export",
+    summary="Export all documents as NDJSON",
+    description="Streams every row of the 'documents' table as one JSON object per line, in id order.",
+    response_class=StreamingResponse,
+)
+async def export_documents(
+    fields: Optional[str] = Query(
+        None, description="Comma-separated subset of id, content, metadata, content_hash, embedding_model"
+    ),
+    embedding: Literal["none", "base64"] = Query(
+        "none", description="Include embeddings as base64 little-endian float32"
+    ),
+    batch_size: int = Query(1000, ge=1, le=10000),
+):
+    selected = _document_listing_args(fields)
+
+    async def lines():
+        async for batch in iter_documents(selected, embedding, batch_size):
+            yield b"".join(orjson.dumps(doc) + b"\n" for doc in batch)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+def _overloaded(e: LLMOverloaded) -> HTTPException:
+    return HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+
+def _retrieval_filters(filters: Optional[QueryFilters]) -> Optional[RetrievalFilters]:
+    if filters is None:
+        return None
+    if filters.page_min is not None and filters.page_max is not None and filters.page_min > filters.page_max:
+        raise HTTPException(status_code=400, detail="filters.page_min must not exceed filters.page_max")
+    if filters.ingestion_id is not None:
+        try:
+            uuid.UUID(filters.ingestion_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid filters.ingestion_id format (must be UUID)")
+    result = RetrievalFilters(
+        sources=tuple(filters.sources or ()),
+        filenames=tuple(filters.filenames or ()),
+        page_min=filters.page_min,
+        page_max=filters.page_max,
+        ingestion_id=filters.ingestion_id,
+    )
+    return None if result.empty else result
 
 @router_v1.post(
     "/query",
@@ -138,8 +268,45 @@ async def get_all_documents(skip: int = Query(0, ge=0), limit: int = Query(10, g
     description="Retrieval-Augmented Generation over ingested documents."
 )
 async def query_qa(req: QueryRequest):
-    answer, sources = await answer_question(req.question)
-    return QueryResponse(answer=answer, source_docs=sources)
+    try:
+        answer, sources, timings = await answer_question(
+            req.question, req.retrieval_mode, _retrieval_filters(req.filters)
+        )
+    except LLMOverloaded as e:
+        raise _overloaded(e)
+    return QueryResponse(answer=answer, source_docs=sources, retrieval_ms=timings)
+
+@router_v1.post(
+    "/query-batch",
+    response_class=StreamingResponse,
+    tags=["RAG"],
+    summary="Answer many questions",
+    description=(
+        "Answers each question independently, as /v1/query would, and streams NDJSON: one "
+        '{"index", "answer", "source_docs", "retrieval_ms"} object per question as soon as it is answered, '
+        'or {"index", "error", "status_code"} if that question failed. Lines arrive in completion order.'
+    ),
+)
+async def query_batch(req: QueryBatchRequest):
+    if len(req.questions) > settings.query_batch_max_questions:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.query_batch_max_questions} questions per batch",
+        )
+    filters = _retrieval_filters(req.filters)
+
+    async def lines():
+        try:
+            async for result in answer_questions(req.questions, req.retrieval_mode, filters):
+                yield orjson.dumps(result) + b"\n"
+        except HTTPException as e:
+            # Embedding or retrieval failed for the whole batch after the response started
+            yield orjson.dumps({"error": e.detail, "status_code": e.status_code}) + b"\n"
+        except Exception as e:
+            logger.exception("Batch query failed")
+            yield orjson.dumps({"error": str(e) or type(e).__name__, "status_code": 500}) + b"\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 @router_v1.post(
     "/query-stream",
@@ -158,44 +325,154 @@ async def query_stream(req: QueryRequest):
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid conversation_id format (must be UUID)")
 
-    history = await run_in_threadpool(get_history, conversation_id)
+    filters = _retrieval_filters(req.filters)
+    # Reject before retrieval when the LLM queue is already full
+    try:
+        llm_scheduler.check_admission()
+    except LLMOverloaded as e:
+        raise _overloaded(e)
+    # Recent turns verbatim plus a rolling summary of older ones
+    history, summary = await get_prompt_history(conversation_id)
 
-    # 2) stream tokens from OpenAI
+    # 2) stream tokens as Server-Sent Events: sources, token..., done (or error)
     async def event_generator():
-        full_answer = ""
-        try:
-            async for token in stream_answer(req.question, history):
-                full_answer += token
-                yield token
-        except asyncio.CancelledError:
-            logger.warning("Client disconnected during streaming response")
+        answer_parts: List[str] = []
+        completed = False
+        with stream_duration_seconds.time():
+            try:
+                # Comment-line heartbeats keep proxies from closing the connection during prefill
+                events = with_heartbeats(
+                    stream_answer(req.question, history, req.retrieval_mode, filters, summary, conversation_id),
+                    settings.sse_heartbeat_seconds,
+                )
+                async for item in events:
+                    if item is None:
+                        yield SSE_HEARTBEAT
+                        continue
+                    event, data = item
+                    if event == "token":
+                        answer_parts.append(data)
+                        yield sse_event("token", {"text": data})
+                    else:
+                        yield sse_event(event, data)
+                completed = True
+            except asyncio.CancelledError:
+                logger.warning("Client disconnected during streaming response")
+                raise
+            except LLMOverloaded as e:
+                logger.warning("Streaming request not admitted: %s", e.detail)
+                yield sse_event("error", {"detail": e.detail, "retry_after": e.retry_after})
+            except Exception:
+                logger.exception("Error while streaming response")
+                yield sse_event("error", {"detail": "Answer generation failed"})
+        if not completed:
             return
-        except Exception:
-            logger.exception("Error while streaming response")
-            return
-        else:
-            # Only persist history if the stream completed successfully
-            await run_in_threadpool(append_history, conversation_id, req.question, full_answer)
+        full_answer = "".join(answer_parts)
+        yield sse_event("done", {"conversation_id": conversation_id})
+        # Only persist history if the stream completed successfully
+        await append_history(conversation_id, req.question, full_answer)
+        schedule_summary_refresh(conversation_id)
 
     return StreamingResponse(
         event_generator(),
-        media_type="text/plain; charset=utf-8",
-        headers={"x-conversation-id": conversation_id}
+        media_type="text/event-stream",
+        headers={**SSE_HEADERS, "x-conversation-id": conversation_id},
     )
 
+@router_v1.get(
+    "/admin/vector-index",
+    tags=["Admin"],
+    summary="ANN index status for documents.embedding",
+    description="Reports the ANN indexes on documents.embedding, their size, and build progress from pg_stat_progress_create_index."
+)
+async def vector_index_status():
+    try:
+        return await asyncio.wait_for(run_in_threadpool(get_index_status), timeout=10.0)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Database request timed out")
+
+@router_v1.get(
+    "/admin/db-pool",
+    tags=["Admin"],
+    summary="Database connection pool status",
+    description="Checked-out/overflow counts for the sync and async pools, plus async pool wait times."
+)
+async def db_pool_status():
+    return pool_status()
+
+@router_v1.get(
+    "/admin/metrics",
+    tags=["Admin"],
+    summary="In-process histograms",
+    description="JSON snapshot of the in-process histograms; /metrics serves the same data for Prometheus."
+)
+async def metrics_snapshot():
+    return metrics_registry.snapshot()
+
+@router_v1.get(
+    "/admin/llm-scheduler",
+    tags=["Admin"],
+    summary="LLM admission control state",
+    description="Active and queued LLM requests, rejections, queue timeouts and coalesced duplicate requests."
+)
+async def llm_scheduler_stats():
+    return llm_scheduler.stats()
+
+@router_v1.get(
+    "/admin/caches",
+    tags=["Admin"],
+    summary="In-process cache statistics",
+    description="Hit/miss counters and sizes for the in-process query and chat history caches."
+)
+async def cache_stats():
+    return {
+        "query_embeddings": query_embedding_cache.stats(),
+        "answers": answer_cache.stats(),
+        "history": history_cache.stats(),
+    }
+
 @router_v1.get(
     "/history/{conversation_id}",
     response_model=List[Dict[str, str]],
     tags=["History"],
     summary="Get chat history for a conversation",
-    description="Returns an array of { question, answer } for the given conversation_id"
+    description=(
+        "Returns an array of { question, answer } for the given conversation_id, oldest first. "
+        "When more turns exist, the X-Next-Cursor response header holds the cursor for the next page."
+    ),
 )
-async def read_history(conversation_id: str):
-    history = await run_in_threadpool(get_history, conversation_id)
-    return JSONResponse(content=history)
+async def read_history(
+    conversation_id: str,
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+):
+    try:
+        uuid.UUID(conversation_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid conversation_id format (must be UUID)")
+    try:
+        history, next_cursor = await get_history_page(conversation_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return history
 
 app.include_router(router_v1)
 
+@app.get(
+    "/metrics",
+    tags=["Admin"],
+    summary="Prometheus metrics",
+    description="Per-stage latency histograms (TEI, retrieval SQL, LLM, ingestion) in Prometheus text format.",
+    response_class=PlainTextResponse,
+)
+async def prometheus_metrics():
+    return PlainTextResponse(
+        metrics_registry.render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", 8000)))
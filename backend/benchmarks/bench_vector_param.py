@@ -0,0 +1,61 @@
+"""
+Per-query CPU cost in the API process of encoding the query vector:
+the old '%.6f' text literal (bound twice) vs. pgvector's binary encoding of
+a float32 array (bound once). Runs without a database.
+
+Usage (from backend/):
+    python -m benchmarks.bench_vector_param --dim 768 --iterations 20000
+"""
+import argparse
+import json
+import timeit
+
+import numpy as np
+from pgvector import Vector
+
+
+def _text_literal(vec) -> str:
+    # Previous services.query.to_pgvector_literal
+    return f"[{','.join(f'{x:.6f}' for x in vec)}]"
+
+
+def run(dim: int, iterations: int) -> dict:
+    rng = np.random.default_rng(0)
+    as_list = rng.standard_normal(dim).astype(np.float32).tolist()  # TEI returns JSON floats
+    as_array = np.asarray(as_list, dtype=np.float32)
+
+    def old_path() -> None:
+        literal = _text_literal(as_list)
+        literal.encode()  # psycopg sends the text parameter
+        literal.encode()  # ...twice, once per :q reference
+
+    def new_path() -> None:
+        Vector(as_array).to_binary()
+
+    results = {}
+    for name, fn in (("text_literal_x2", old_path), ("binary_float32", new_path)):
+        seconds = min(timeit.repeat(fn, number=iterations, repeat=3))
+        results[name] = {"us_per_query": round(1e6 * seconds / iterations, 3)}
+    results["saved_us_per_query"] = round(
+        results["text_literal_x2"]["us_per_query"] - results["binary_float32"]["us_per_query"], 3
+    )
+    results["payload_bytes"] = {
+        "text_literal_x2": 2 * len(_text_literal(as_list)),
+        "binary_float32": len(Vector(as_array).to_binary()),
+    }
+    results["max_abs_rounding_error"] = float(
+        np.max(np.abs(np.array([float(x) for x in _text_literal(as_list)[1:-1].split(",")]) - as_array))
+    )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.dim, args.iterations), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Recall, latency and on-disk size of the documents.embedding storage modes
+(VECTOR_STORAGE / VECTOR_QUANTIZATION) against the configured Postgres:
+
+    vector          float32 column, HNSW on the column (current default)
+    halfvec         float16 column, HNSW on the column
+    vector+binary   float32 column, HNSW on binary_quantize(embedding), exact re-rank
+    halfvec+binary  float16 column, HNSW on binary_quantize(embedding), exact re-rank
+
+Vectors are synthetic but clustered (unit-norm noise around random centres),
+which is closer to real embeddings than uniform noise; queries are perturbed
+corpus vectors. Recall@k is against exact float32 cosine top-k computed in
+numpy. Everything runs in temp tables inside one rolled-back transaction, so
+the documents table is not touched.
+
+Usage (from backend/):
+    python -m benchmarks.bench_vector_storage --rows 50000 --queries 200 --k 5 --oversample 4,8,16
+"""
+import argparse
+import json
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from config import settings
+from services.db import engine
+
+VARIANTS = (
+    ("vector", "none"),
+    ("halfvec", "none"),
+    ("vector", "binary"),
+    ("halfvec", "binary"),
+)
+
+
+def _corpus(rows: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    centres = rng.standard_normal((clusters, dim), dtype=np.float32)
+    vectors = centres[rng.integers(0, clusters, rows)] + 0.6 * rng.standard_normal((rows, dim), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _queries(corpus: np.ndarray, n: int, rng: np.random.Generator) -> np.ndarray:
+    picks = corpus[rng.integers(0, len(corpus), n)]
+    noisy = picks + 0.05 * rng.standard_normal(picks.shape, dtype=np.float32)
+    return noisy / np.linalg.norm(noisy, axis=1, keepdims=True)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return round(1000 * float(np.percentile(values, q)), 3)
+
+
+def _sizes(cur, table: str) -> Dict[str, int]:
+    cur.execute(
+        "SELECT pg_table_size(%s::regclass), pg_indexes_size(%s::regclass)", (table, table)
+    )
+    table_bytes, index_bytes = cur.fetchone()
+    return {"table_bytes": table_bytes, "index_bytes": index_bytes, "total_bytes": table_bytes + index_bytes}
+
+
+def _search_sql(table: str, storage: str, quantization: str, dim: int) -> str:
+    q = f"%(q)s::{storage}({dim})" if storage != "vector" else "%(q)s"
+    if quantization == "binary":
+        # Same shape as services.retrieval._BINARY_VECTOR_SQL
+        return f"""
+            WITH candidates AS MATERIALIZED (
+                SELECT id, embedding FROM {table}
+                ORDER BY (binary_quantize(embedding)::bit({dim})) <~> binary_quantize({q})
+                LIMIT %(candidates)s
+            )
+            SELECT id FROM candidates ORDER BY embedding <=> {q} LIMIT %(k)s
+        """
+    return f"SELECT id FROM {table} ORDER BY embedding <=> {q} LIMIT %(k)s"
+
+
+def run(rows: int, queries: int, k: int, oversample: List[int], clusters: int) -> dict:
+    dim = settings.pgvector_dim
+    rng = np.random.default_rng(0)
+    corpus = _corpus(rows, dim, clusters, rng)
+    qs = _queries(corpus, queries, rng)
+    truth = [set(np.argsort(-(corpus @ q))[:k].tolist()) for q in qs]
+
+    results: Dict[str, dict] = {}
+    with engine.connect() as conn:
+        raw = conn.connection.driver_connection
+        with raw.cursor() as cur:
+            cur.execute(f"CREATE TEMP TABLE bench_src (id int PRIMARY KEY, embedding vector({dim}))")
+            with cur.copy("COPY bench_src (id, embedding) FROM STDIN WITH (FORMAT BINARY)") as copy:
+                copy.set_types(["int4", "vector"])
+                for i, vec in enumerate(corpus):
+                    copy.write_row((i, vec))
+
+            for storage, quantization in VARIANTS:
+                name = storage if quantization == "none" else f"{storage}+{quantization}"
+                table = f"bench_{storage}_{quantization}"
+                cur.execute(
+                    f"CREATE TEMP TABLE {table} AS "
+                    f"SELECT id, embedding::{storage}({dim}) AS embedding FROM bench_src"
+                )
+                if quantization == "binary":
+                    target = f"(binary_quantize(embedding)::bit({dim})) bit_hamming_ops"
+                else:
+                    target = f"embedding {storage}_cosine_ops"
+                start = time.perf_counter()
+                cur.execute(
+                    f"CREATE INDEX ON {table} USING hnsw ({target}) "
+                    f"WITH (m = {int(settings.hnsw_m)}, ef_construction = {int(settings.hnsw_ef_construction)})"
+                )
+                build_seconds = time.perf_counter() - start
+                cur.execute(f"ANALYZE {table}")
+                sizes = _sizes(cur, table)
+
+                sql = _search_sql(table, storage, quantization, dim)
+                for factor in (oversample if quantization == "binary" else [1]):
+                    candidates = k * factor
+                    cur.execute(f"SET hnsw.ef_search = {max(settings.hnsw_ef_search, candidates)}")
+                    latencies, hits = [], 0
+                    for q, expected in zip(qs, truth):
+                        start = time.perf_counter()
+                        cur.execute(sql, {"q": q, "k": k, "candidates": candidates})
+                        found = [r[0] for r in cur.fetchall()]
+                        latencies.append(time.perf_counter() - start)
+                        hits += len(expected.intersection(found))
+                    key = name if quantization == "none" else f"{name}@x{factor}"
+                    results[key] = {
+                        f"recall@{k}": round(hits / (k * len(qs)), 4),
+                        "p50_ms": _percentile(latencies, 50),
+                        "p95_ms": _percentile(latencies, 95),
+                        "index_build_seconds": round(build_seconds, 2),
+                        **sizes,
+                    }
+        conn.rollback()
+
+    baseline = results["vector"]["total_bytes"]
+    for row in results.values():
+        row["size_vs_vector"] = round(row["total_bytes"] / baseline, 3)
+    return {"rows": rows, "dim": dim, "queries": queries, "k": k, "results": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--oversample", default="4,8,16", help="Comma-separated candidate multipliers for binary")
+    parser.add_argument("--clusters", type=int, default=256)
+    args = parser.parse_args()
+    factors = [int(x) for x in args.oversample.split(",") if x.strip()]
+    print(json.dumps(run(args.rows, args.queries, args.k, factors, args.clusters), indent=2))
+
+
+if __name__ == "__main__":
+    main()
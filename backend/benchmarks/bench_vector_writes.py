@@ -0,0 +1,73 @@
+"""
+Compare rows/sec of the ORM insert path and the binary COPY path in
+PostgresVectorStore.write against the configured Postgres.
+
+Usage (from backend/):
+    python -m benchmarks.bench_vector_writes --rows 5000 --repeat 3
+
+Rows are tagged with a per-run marker in metadata and deleted afterwards.
+"""
+import argparse
+import json
+import time
+import uuid
+
+import numpy as np
+from sqlalchemy import text
+
+from config import settings
+from services.db import get_session
+from services.vector_store import vector_store
+
+
+def _synthetic_rows(n: int, run_id: str, rng: np.random.Generator):
+    # run_id keeps texts unique across runs; identical chunks would be deduplicated
+    texts = [f"synthetic chunk {run_id} {i} " + "lorem ipsum " * 80 for i in range(n)]
+    metadatas = [{"source": "benchmark", "page": i // 4, "benchmark_run": run_id} for i in range(n)]
+    vectors = rng.standard_normal((n, settings.pgvector_dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return texts, metadatas, list(vectors)
+
+
+def _cleanup(run_id: str) -> None:
+    with get_session() as session:
+        session.execute(
+            text("DELETE FROM documents WHERE metadata->>'benchmark_run' = :run"),
+            {"run": run_id},
+        )
+        session.commit()
+
+
+def run(rows: int, repeat: int) -> dict:
+    rng = np.random.default_rng(0)
+    results = {}
+    for name, use_copy in (("orm", False), ("copy", True)):
+        timings = []
+        for _ in range(repeat):
+            run_id = f"bench-{uuid.uuid4()}"
+            texts, metadatas, vectors = _synthetic_rows(rows, run_id, rng)
+            start = time.perf_counter()
+            vector_store.write(texts, metadatas, vectors, use_copy=use_copy)
+            timings.append(time.perf_counter() - start)
+            _cleanup(run_id)
+        best = min(timings)
+        results[name] = {
+            "rows": rows,
+            "best_seconds": round(best, 4),
+            "rows_per_sec": round(rows / best, 1),
+        }
+    results["speedup"] = round(results["copy"]["rows_per_sec"] / results["orm"]["rows_per_sec"], 2)
+    results["write_batch_size"] = settings.ingest_write_batch_size
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Compare two load_test result files scenario by scenario.
+
+Usage (from backend/):
+    python -m benchmarks.compare results/base.json results/head.json
+
+Prints one JSON line per (endpoint, concurrency) with the relative change
+of p50/p95/p99 latency, throughput and peak RSS (negative latency = faster).
+"""
+import argparse
+import json
+from typing import Any, Dict, Optional, Tuple
+
+
+def _load(path: str) -> Tuple[Dict[str, Any], Dict[Tuple[str, int], Dict[str, Any]]]:
+    with open(path) as f:
+        data = json.load(f)
+    return data, {(s["endpoint"], s["concurrency"]): s for s in data["scenarios"]}
+
+
+def _change(old: Optional[float], new: Optional[float]) -> Optional[float]:
+    if old in (None, 0) or new is None:
+        return None
+    return round(100.0 * (new - old) / old, 1)
+
+
+def compare(base_path: str, head_path: str) -> list:
+    base, base_scenarios = _load(base_path)
+    head, head_scenarios = _load(head_path)
+    rows = []
+    for key in sorted(set(base_scenarios) & set(head_scenarios)):
+        b, h = base_scenarios[key], head_scenarios[key]
+        row = {"endpoint": key[0], "concurrency": key[1]}
+        for q in ("p50", "p95", "p99"):
+            row[f"{q}_ms"] = [b["latency_ms"][q], h["latency_ms"][q]]
+            row[f"{q}_change_pct"] = _change(b["latency_ms"][q], h["latency_ms"][q])
+        row["throughput_rps"] = [b["throughput_rps"], h["throughput_rps"]]
+        row["throughput_change_pct"] = _change(b["throughput_rps"], h["throughput_rps"])
+        row["peak_rss_mb"] = [b.get("peak_rss_mb"), h.get("peak_rss_mb")]
+        row["errors"] = [sum(b["errors"].values()), sum(h["errors"].values())]
+        rows.append(row)
+    return [{"base": base.get("commit"), "head": head.get("commit")}] + rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("head")
+    args = parser.parse_args()
+    for row in compare(args.base, args.head):
+        print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Synthetic corpora for the load test: seeded documents rows (embedded with
+the stub's feature hashing, written through PostgresVectorStore), question
+sets drawn from the same vocabulary, and small text PDFs for /v1/upload.
+"""
+import random
+from typing import List, Union
+
+from sqlalchemy import text
+
+from config import settings
+
+# Kubernetes-flavoured vocabulary so lexical and vector retrieval both find matches
+VOCABULARY = (
+    "pod deployment service ingress node cluster namespace replica container image "
+    "volume secret configmap rollout rollback scheduler kubelet probe liveness readiness "
+    "crashloopbackoff restart taint toleration affinity autoscaler hpa quota limit request "
+    "cpu memory storage persistentvolume claim statefulset daemonset job cronjob network "
+    "policy dns endpoint label selector annotation helm chart operator controller etcd "
+    "apiserver kubectl logs describe apply delete drain cordon upgrade version manifest"
+).split()
+
+
+def synthetic_text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(VOCABULARY) for _ in range(words))
+
+
+def synthetic_questions(n: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    return [f"How do I {synthetic_text(rng, 6)}?" for _ in range(n)]
+
+
+def seed_corpus(chunks: int, run_id: str, batch: int = 1000, words_per_chunk: int = 150) -> int:
+    """Insert `chunks` synthetic rows tagged with run_id; returns rows written."""
+    from benchmarks.stubs import stub_embedding
+    from services.vector_store import content_hash, vector_store
+
+    rng = random.Random(run_id)
+    written = 0
+    for start in range(0, chunks, batch):
+        n = min(batch, chunks - start)
+        # run_id keeps texts unique across runs; identical chunks would be deduplicated
+        texts = [f"{run_id} {start + i} {synthetic_text(rng, words_per_chunk)}" for i in range(n)]
+        metadatas = [
+            {"source": f"benchmark/{run_id}/manual-{(start + i) % 10}.pdf", "page": (start + i) // 10 % 500,
+             "benchmark_run": run_id}
+            for i in range(n)
+        ]
+        vectors = [stub_embedding(t, settings.pgvector_dim) for t in texts]
+        written += vector_store.write(texts, metadatas, vectors)
+        # So metadata filters match the seeded rows
+        vector_store.link_occurrences([(content_hash(t), m) for t, m in zip(texts, metadatas)])
+    return written
+
+
+def cleanup(run_id: str, conversation_ids: List[str], job_ids: List[str]) -> None:
+    from services.db import get_session
+
+    with get_session() as session:
+        session.execute(
+            text("DELETE FROM documents WHERE metadata->>'benchmark_run' = :run"), {"run": run_id}
+        )
+        if job_ids:
+            session.execute(
+                text("DELETE FROM document_ingestions WHERE ingestion_id = ANY(:ids)"), {"ids": job_ids}
+            )
+            session.execute(
+                text("DELETE FROM documents WHERE metadata->>'ingestion_id' = ANY(:ids)"), {"ids": job_ids}
+            )
+            session.execute(text("DELETE FROM ingestion_jobs WHERE id::text = ANY(:ids)"), {"ids": job_ids})
+        if conversation_ids:
+            for table in ("chat_history", "conversation_summaries"):
+                session.execute(
+                    text(f"DELETE FROM {table} WHERE conversation_id::text = ANY(:ids)"),
+                    {"ids": conversation_ids},
+                )
+        session.commit()
+
+
+def _pdf_escape(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages: int, lines_per_page: int = 40, seed: Union[int, str] = 0) -> bytes:
+    """Minimal valid PDF with Helvetica text pages (no external dependencies)."""
+    rng = random.Random(seed)
+    objects: List[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",  # pages tree, filled in once the kids are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for _ in range(pages):
+        lines = [synthetic_text(rng, 12) for _ in range(lines_per_page)]
+        stream = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(f"({_pdf_escape(l)}) '" for l in lines) + " ET"
+        content = stream.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % k for k in kids), len(kids)
+    )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (i, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
@@ -0,0 +1,338 @@
+"""
+End-to-end load test: starts the TEI and LLM stubs and the FastAPI app
+(uvicorn subprocesses), seeds a synthetic corpus into the configured
+Postgres+pgvector, then drives /v1/query, /v1/query-stream and /v1/upload
+at each concurrency level. Writes p50/p95/p99 latency, throughput, error
+counts and the app's peak RSS per scenario as JSON, tagged with the git
+commit so runs can be compared (see benchmarks.compare).
+
+Usage (from backend/, POSTGRES_URL pointing at a scratch database):
+    python -m benchmarks.load_test --chunks 20000 --concurrency 1,8,32 \\
+        --requests 200 --out results/$(git rev-parse --short HEAD).json
+
+Seeded rows, uploads and conversations are removed afterwards.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ("query", "query-stream", "upload")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _proc_status_kb(pid: int, field: str) -> Optional[int]:
+    """VmRSS / VmHWM from /proc (Linux); None elsewhere."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+@contextmanager
+def _server(target: str, port: int, env: Dict[str, str], factory: bool = False) -> Iterator[subprocess.Popen]:
+    cmd = [sys.executable, "-m", "uvicorn", target, "--host", "127.0.0.1", "--port", str(port),
+           "--log-level", "warning"]
+    if factory:
+        cmd.append("--factory")
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env)
+    try:
+        yield proc
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+async def _wait_ready(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url, timeout=2.0)).status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"{url} did not become ready within {timeout:.0f}s")
+
+
+def _percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    arr = np.asarray(samples) * 1000.0
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {
+        "p50": round(float(p50), 2),
+        "p95": round(float(p95), 2),
+        "p99": round(float(p99), 2),
+        "mean": round(float(arr.mean()), 2),
+        "max": round(float(arr.max()), 2),
+    }
+
+
+class _RssSampler:
+    """Tracks the app process's peak RSS while a scenario runs."""
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        self.pid = pid
+        self.interval = interval
+        self.peak_kb = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            self.peak_kb = max(self.peak_kb, _proc_status_kb(self.pid, "VmRSS") or 0)
+            await asyncio.sleep(self.interval)
+
+    def __enter__(self) -> "_RssSampler":
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._task.cancel()
+        self.peak_kb = max(self.peak_kb, _proc_status_kb(self.pid, "VmRSS") or 0)
+
+
+class LoadTest:
+    def __init__(self, base_url: str, questions: List[str], pdf_pages: int, run_id: str, wait_ingest: bool):
+        self.base_url = base_url
+        self.questions = questions
+        self.pdf_pages = pdf_pages
+        self.run_id = run_id
+        self.wait_ingest = wait_ingest
+        # Counts uploads across scenarios so every upload gets its own PDF
+        self._uploads = itertools.count()
+        self.conversation_ids: List[str] = []
+        self.job_ids: List[str] = []
+
+    async def _query(self, client: httpx.AsyncClient, i: int) -> Dict[str, float]:
+        start = time.perf_counter()
+        r = await client.post("/v1/query", json={"question": self.questions[i % len(self.questions)]})
+        r.raise_for_status()
+        return {"latency": time.perf_counter() - start}
+
+    async def _query_stream(self, client: httpx.AsyncClient, i: int) -> Dict[str, float]:
+        conversation_id = str(uuid.uuid4())
+        self.conversation_ids.append(conversation_id)
+        body = {"question": self.questions[i % len(self.questions)], "conversation_id": conversation_id}
+        start = time.perf_counter()
+        ttfb = None
+        async with client.stream("POST", "/v1/query-stream", json=body) as r:
+            r.raise_for_status()
+            # Time to the first answer token; heartbeats and the sources event arrive earlier
+            async for line in r.aiter_lines():
+                if ttfb is None and line == "event: token":
+                    ttfb = time.perf_counter() - start
+                elif line == "event: error":
+                    raise RuntimeError("stream ended with an error event")
+        result = {"latency": time.perf_counter() - start}
+        if ttfb is not None:
+            result["ttfb"] = ttfb
+        return result
+
+    async def _upload(self, client: httpx.AsyncClient, i: int) -> Dict[str, float]:
+        # Distinct text per upload: identical chunks are deduplicated by content hash,
+        # so re-posting one PDF would only measure hash lookups, not embedding and writes
+        from benchmarks.corpus import make_pdf
+
+        n = next(self._uploads)
+        pdf = make_pdf(self.pdf_pages, seed=f"{self.run_id}-{n}")
+        start = time.perf_counter()
+        files = {"file": (f"bench-{n}.pdf", pdf, "application/pdf")}
+        r = await client.post("/v1/upload", files=files)
+        r.raise_for_status()
+        accepted = time.perf_counter() - start
+        job_id = r.json()["job_id"]
+        self.job_ids.append(job_id)
+        result = {"latency": accepted}
+        if self.wait_ingest:
+            while True:
+                status = (await client.get(f"/v1/ingest-jobs/{job_id}")).json()
+                if status["status"] in ("succeeded", "failed"):
+                    break
+                await asyncio.sleep(0.1)
+            if status["status"] == "failed":
+                raise RuntimeError(status.get("error") or "ingestion failed")
+            result["ingest"] = time.perf_counter() - start
+        return result
+
+    async def scenario(self, endpoint: str, concurrency: int, requests: int, app_pid: int) -> Dict[str, Any]:
+        op = {"query": self._query, "query-stream": self._query_stream, "upload": self._upload}[endpoint]
+        samples: Dict[str, List[float]] = {}
+        errors: Dict[str, int] = {}
+        counter = iter(range(requests))
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=600.0, limits=limits) as client:
+            async def worker() -> None:
+                for i in counter:
+                    try:
+                        for name, value in (await op(client, i)).items():
+                            samples.setdefault(name, []).append(value)
+                    except Exception as exc:  # noqa: BLE001 - counted and reported
+                        key = type(exc).__name__
+                        if isinstance(exc, httpx.HTTPStatusError):
+                            key = f"http_{exc.response.status_code}"
+                        errors[key] = errors.get(key, 0) + 1
+
+            with _RssSampler(app_pid) as rss:
+                start = time.perf_counter()
+                await asyncio.gather(*(worker() for _ in range(concurrency)))
+                elapsed = time.perf_counter() - start
+
+        ok = len(samples.get("latency", []))
+        result: Dict[str, Any] = {
+            "endpoint": endpoint,
+            "concurrency": concurrency,
+            "requests": requests,
+            "ok": ok,
+            "errors": errors,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(ok / elapsed, 3) if elapsed else None,
+            "latency_ms": _percentiles(samples.get("latency", [])),
+            "peak_rss_mb": round(rss.peak_kb / 1024, 1) if rss.peak_kb else None,
+        }
+        for extra in ("ttfb", "ingest"):
+            if extra in samples:
+                result[f"{extra}_ms"] = _percentiles(samples[extra])
+        return result
+
+
+async def _run(args: argparse.Namespace) -> Dict[str, Any]:
+    from benchmarks.corpus import cleanup, seed_corpus, synthetic_questions
+
+    run_id = f"bench-{uuid.uuid4()}"
+    tei_port, llm_port, app_port = _free_port(), _free_port(), _free_port()
+    base_env = dict(os.environ)
+    stub_env = {
+        **base_env,
+        "STUB_TEI_LATENCY_MS": str(args.tei_latency_ms),
+        "STUB_LLM_TTFT_MS": str(args.llm_ttft_ms),
+        "STUB_LLM_TOKENS_PER_SEC": str(args.llm_tokens_per_sec),
+        "STUB_LLM_ANSWER_TOKENS": str(args.llm_answer_tokens),
+        "STUB_LLM_PARALLEL": str(args.llm_parallel),
+    }
+    pdf_dir = tempfile.mkdtemp(prefix="rag-bench-pdfs-")
+    app_env = {
+        **base_env,
+        "TEI_BASE_URL": f"http://127.0.0.1:{tei_port}",
+        "LOCAL_LLM_BASE_URL": f"http://127.0.0.1:{llm_port}/v1",
+        "LOCAL_LLM_STREAMING": "true",
+        "PDF_DIR": pdf_dir,
+        "ANSWER_CACHE_ENABLED": "true" if args.answer_cache else "false",
+        "HISTORY_RETENTION_DAYS": "0",
+        # Admission control matches the stub's slots, as it should match llama.cpp -np
+        "LLM_MAX_CONCURRENCY": str(args.llm_parallel),
+    }
+    if args.rerank:
+        # The TEI stub also serves /rerank
+        app_env["RERANKER_BASE_URL"] = f"http://127.0.0.1:{tei_port}"
+
+    seed_start = time.perf_counter()
+    seeded = seed_corpus(args.chunks, run_id) if args.chunks else 0
+    seed_seconds = time.perf_counter() - seed_start
+    questions = synthetic_questions(args.questions)
+
+    results: Dict[str, Any] = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {k: v for k, v in vars(args).items() if k != "out"},
+        "corpus": {"chunks": seeded, "seed_seconds": round(seed_seconds, 2)},
+        "scenarios": [],
+    }
+    test: Optional[LoadTest] = None
+    try:
+        with _server("benchmarks.stubs:tei_app", tei_port, stub_env, factory=True), \
+                _server("benchmarks.stubs:llm_app", llm_port, stub_env, factory=True), \
+                _server("app:app", app_port, app_env) as app_proc:
+            await _wait_ready(f"http://127.0.0.1:{tei_port}/health")
+            await _wait_ready(f"http://127.0.0.1:{llm_port}/v1/models")
+            await _wait_ready(f"http://127.0.0.1:{app_port}/v1/test-db")
+            test = LoadTest(f"http://127.0.0.1:{app_port}", questions, args.pdf_pages, run_id, args.wait_ingest)
+            for endpoint in args.endpoints:
+                for concurrency in args.concurrency:
+                    requests = args.upload_requests if endpoint == "upload" else args.requests
+                    scenario = await test.scenario(endpoint, concurrency, requests, app_proc.pid)
+                    results["scenarios"].append(scenario)
+                    print(json.dumps(scenario), file=sys.stderr)
+            peak = _proc_status_kb(app_proc.pid, "VmHWM")
+            results["app_peak_rss_mb"] = round(peak / 1024, 1) if peak else None
+    finally:
+        if not args.keep_data:
+            cleanup(run_id, test.conversation_ids if test else [], test.job_ids if test else [])
+    return results
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=10000, help="synthetic documents rows to seed")
+    parser.add_argument("--questions", type=int, default=200, help="distinct questions to cycle through")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="requests per query scenario")
+    parser.add_argument("--upload-requests", type=int, default=10, help="requests per upload scenario")
+    parser.add_argument("--endpoints", type=lambda v: [e for e in v.split(",") if e], default=list(ENDPOINTS))
+    parser.add_argument("--pdf-pages", type=int, default=20)
+    parser.add_argument("--wait-ingest", action="store_true", help="also time uploads until ingestion finishes")
+    parser.add_argument("--answer-cache", action="store_true", help="leave the semantic answer cache on")
+    parser.add_argument("--rerank", action="store_true", help="re-rank retrieval candidates with the stub /rerank")
+    parser.add_argument("--tei-latency-ms", type=float, default=5.0)
+    parser.add_argument("--llm-ttft-ms", type=float, default=200.0)
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=30.0)
+    parser.add_argument("--llm-answer-tokens", type=int, default=64)
+    parser.add_argument("--llm-parallel", type=int, default=4)
+    parser.add_argument("--keep-data", action="store_true", help="skip cleanup of seeded rows")
+    parser.add_argument("--out", help="write results JSON here (default: stdout)")
+    args = parser.parse_args()
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+
+    results = asyncio.run(_run(args))
+    payload = json.dumps(results, indent=2)
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+
+
+if __name__ == "__main__":
+    main()
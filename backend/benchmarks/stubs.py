@@ -0,0 +1,200 @@
+"""
+Local stand-ins for the TEI server (embeddings and re-ranking) and the llama.cpp
+OpenAI-compatible server, so the API can be load-tested without models.
+
+Both are uvicorn app factories configured through environment variables:
+
+    STUB_DIM                      embedding dimension (default: PGVECTOR_DIM or 768)
+    STUB_TEI_LATENCY_MS           fixed latency per /embed or /rerank request (default 5)
+    STUB_TEI_PER_INPUT_MS         extra latency per input text (default 0.5)
+    STUB_LLM_TTFT_MS              latency before the first token (default 200)
+    STUB_LLM_TOKENS_PER_SEC       generation rate (default 30)
+    STUB_LLM_PREFILL_TOKENS_PER_SEC  prompt processing rate, 0 = free (default 0)
+    STUB_LLM_ANSWER_TOKENS        tokens per answer (default 64)
+    STUB_LLM_PARALLEL             concurrent generations, like llama.cpp -np (default 4)
+
+The LLM stub mimics llama.cpp's prompt cache: leading messages identical to
+the previous request on the same id_slot skip prefill, and responses carry
+llama.cpp-style `timings` (prompt_n, cache_n).
+
+Usage (from backend/):
+    uvicorn benchmarks.stubs:tei_app --factory --port 7071
+    uvicorn benchmarks.stubs:llm_app --factory --port 8082
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import time
+import uuid
+from typing import Any, Dict, List
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+_WORD = re.compile(r"\w+")
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+def stub_dim() -> int:
+    return int(os.getenv("STUB_DIM") or os.getenv("PGVECTOR_DIM") or 768)
+
+
+def stub_embedding(text: str, dim: int) -> np.ndarray:
+    """
+    Deterministic bag-of-words feature hashing: texts sharing words get
+    similar vectors, so retrieval over a seeded corpus behaves plausibly.
+    """
+    vec = np.zeros(dim, dtype=np.float32)
+    for word in _WORD.findall(text.lower()):
+        h = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+        vec[h % dim] += 1.0 if (h >> 32) & 1 else -1.0
+    norm = float(np.linalg.norm(vec))
+    if norm == 0.0:
+        vec[0] = 1.0
+        return vec
+    return vec / norm
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, math.ceil(len(text) / 4))
+
+
+def tei_app() -> FastAPI:
+    dim = stub_dim()
+    latency = _env_float("STUB_TEI_LATENCY_MS", 5.0) / 1000.0
+    per_input = _env_float("STUB_TEI_PER_INPUT_MS", 0.5) / 1000.0
+    app = FastAPI(title="TEI stub")
+
+    @app.post("/embed")
+    async def embed(payload: Dict[str, Any]):
+        inputs = payload.get("inputs", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        await asyncio.sleep(latency + per_input * len(inputs))
+        return [stub_embedding(t, dim).tolist() for t in inputs]
+
+    @app.post("/rerank")
+    async def rerank(payload: Dict[str, Any]):
+        # Cosine of the bag-of-words vectors, squashed to [0, 1] like TEI's sigmoid scores
+        texts = payload.get("texts", [])
+        await asyncio.sleep(latency + per_input * len(texts))
+        query = stub_embedding(payload.get("query", ""), dim)
+        scores = [(float(stub_embedding(t, dim) @ query) + 1.0) / 2.0 for t in texts]
+        order = sorted(range(len(texts)), key=lambda i: scores[i], reverse=True)
+        return [{"index": i, "score": scores[i]} for i in order]
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    return app
+
+
+def llm_app() -> FastAPI:
+    ttft = _env_float("STUB_LLM_TTFT_MS", 200.0) / 1000.0
+    rate = max(_env_float("STUB_LLM_TOKENS_PER_SEC", 30.0), 1e-3)
+    prefill_rate = _env_float("STUB_LLM_PREFILL_TOKENS_PER_SEC", 0.0)
+    answer_tokens = int(_env_float("STUB_LLM_ANSWER_TOKENS", 64))
+    slots = asyncio.Semaphore(max(1, int(_env_float("STUB_LLM_PARALLEL", 4))))
+    app = FastAPI(title="OpenAI-compatible LLM stub")
+
+    # Last prompt per slot, to simulate llama.cpp's prompt cache (cache_prompt + id_slot)
+    slot_prompts: Dict[Any, List[str]] = {}
+
+    def _prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+        return sum(estimate_tokens(str(m.get("content") or "")) for m in messages)
+
+    def _cached_tokens(body: Dict[str, Any]) -> int:
+        """Tokens of the leading messages identical to the previous prompt on the same slot."""
+        contents = [str(m.get("content") or "") for m in body.get("messages", [])]
+        if not body.get("cache_prompt", True):
+            return 0
+        slot = body.get("id_slot", -1)
+        previous = slot_prompts.get(slot, [])
+        slot_prompts[slot] = contents
+        cached = 0
+        for old, new in zip(previous, contents):
+            if old != new:
+                break
+            cached += estimate_tokens(new)
+        return cached
+
+    def _prefill_seconds(prompt_tokens: int) -> float:
+        return ttft + (prompt_tokens / prefill_rate if prefill_rate > 0 else 0.0)
+
+    @app.post("/tokenize")
+    async def tokenize(payload: Dict[str, Any]):
+        return {"tokens": list(range(estimate_tokens(payload.get("content", ""))))}
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "stub", "object": "model"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat(request: Request):
+        body = await request.json()
+        model = body.get("model", "stub")
+        prompt_tokens = _prompt_tokens(body.get("messages", []))
+        cached_tokens = _cached_tokens(body)
+        timings = {"prompt_n": prompt_tokens - cached_tokens, "cache_n": cached_tokens}
+        n_tokens = min(answer_tokens, int(body.get("max_tokens") or answer_tokens))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            async with slots:
+                await asyncio.sleep(_prefill_seconds(prompt_tokens - cached_tokens) + n_tokens / rate)
+            return JSONResponse(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": "token " * n_tokens},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": n_tokens,
+                        "total_tokens": prompt_tokens + n_tokens,
+                    },
+                    "timings": timings,
+                }
+            )
+
+        def _chunk(delta: Dict[str, Any], finish_reason=None) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            if finish_reason is not None:
+                payload["timings"] = timings
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def events():
+            async with slots:
+                await asyncio.sleep(_prefill_seconds(prompt_tokens - cached_tokens))
+                yield _chunk({"role": "assistant", "content": ""})
+                for _ in range(n_tokens):
+                    yield _chunk({"content": "token "})
+                    await asyncio.sleep(1.0 / rate)
+                yield _chunk({}, finish_reason="stop")
+                yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
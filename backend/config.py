@@ -13,18 +13,112 @@ class Settings(BaseSettings):
     local_llm_model: str = Field("qwen2.5-1.5b-instruct", env="LOCAL_LLM_MODEL")
     # If backend runs in a container (Docker), use host.docker.internal; if running locally, use http://localhost:8081/v1
     local_llm_base_url: str = Field("http://host.docker.internal:8081/v1", env="LOCAL_LLM_BASE_URL")
-    # Some llama.cpp server builds have unstable SSE streaming; allow disabling
-    local_llm_streaming: bool = Field(False, env="LOCAL_LLM_STREAMING")
+    # Stream tokens from llama.cpp as they are generated; a broken upstream stream falls back to a
+    # non-streaming completion of the remainder. Set False for builds whose SSE streaming is unusable
+    local_llm_streaming: bool = Field(True, env="LOCAL_LLM_STREAMING")
+    # Seconds of silence on /v1/query-stream (e.g. during prefill) before an SSE heartbeat comment is sent
+    sse_heartbeat_seconds: float = Field(10.0, env="SSE_HEARTBEAT_SECONDS")
+    # LLM admission control: concurrent requests (match the server's parallel slots, llama.cpp -np),
+    # requests allowed to wait for a slot, and how long each may wait before a 503
+    llm_max_concurrency: int = Field(1, env="LLM_MAX_CONCURRENCY")
+    llm_max_queue: int = Field(16, env="LLM_MAX_QUEUE")
+    llm_queue_timeout_seconds: float = Field(120.0, env="LLM_QUEUE_TIMEOUT_SECONDS")
+    # /v1/query-batch: questions per request and answers generated at once (each still waits for an LLM slot)
+    query_batch_max_questions: int = Field(256, env="QUERY_BATCH_MAX_QUESTIONS")
+    query_batch_concurrency: int = Field(2, env="QUERY_BATCH_CONCURRENCY")
+    # Pin each conversation to one llama.cpp slot (id_slot = hash % LLM_MAX_CONCURRENCY) so its
+    # cached prompt prefix is reused; a busy pinned slot makes the request wait for it
+    llm_slot_affinity: bool = Field(True, env="LLM_SLOT_AFFINITY")
+    # Prompt budget: the served context window (llama.cpp -c) minus tokens reserved for the answer
+    llm_context_tokens: int = Field(4096, env="LLM_CONTEXT_TOKENS")
+    llm_max_answer_tokens: int = Field(768, env="LLM_MAX_ANSWER_TOKENS")
+    # Chat history: turns sent verbatim (capped in tokens), older turns folded into a rolling summary.
+    # Folding happens once 2x HISTORY_WINDOW_TURNS are unsummarized and keeps the newest HISTORY_WINDOW_TURNS,
+    # so the prompt prefix only changes every HISTORY_WINDOW_TURNS turns
+    history_window_turns: int = Field(4, env="HISTORY_WINDOW_TURNS")
+    history_max_tokens: int = Field(1024, env="HISTORY_MAX_TOKENS")
+    history_summary_max_tokens: int = Field(256, env="HISTORY_SUMMARY_MAX_TOKENS")
+    # In-process cache of each conversation's newest turns + summary (per replica; keep the TTL short
+    # unless clients are pinned to one replica)
+    history_cache_conversations: int = Field(2048, env="HISTORY_CACHE_CONVERSATIONS")
+    history_cache_ttl_seconds: float = Field(300.0, env="HISTORY_CACHE_TTL_SECONDS")
+    # Retention: conversations idle for this many days are moved to chat_history_archive (0 disables)
+    history_retention_days: int = Field(90, env="HISTORY_RETENTION_DAYS")
+    # False deletes expired conversations instead of archiving them
+    history_archive_enabled: bool = Field(True, env="HISTORY_ARCHIVE_ENABLED")
+    history_retention_batch_size: int = Field(200, env="HISTORY_RETENTION_BATCH_SIZE")
+    history_retention_interval_seconds: float = Field(3600.0, env="HISTORY_RETENTION_INTERVAL_SECONDS")
 
     # TEI embeddings service
     # If running locally, not in container, than use: http://localhost:7070
     tei_base_url: str = Field("http://host.docker.internal:7070", env="TEI_BASE_URL")
+    # Max texts per /embed request
+    tei_batch_size: int = Field(32, env="TEI_BATCH_SIZE")
+    # Max total characters per /embed request (halved automatically on 413 responses)
+    tei_max_batch_chars: int = Field(32000, env="TEI_MAX_BATCH_CHARS")
+    # Concurrent /embed requests kept in flight by the async client
+    tei_max_concurrency: int = Field(4, env="TEI_MAX_CONCURRENCY")
 
     # RAG params
     top_k: int = Field(5, env="TOP_K")
+    # Default retrieval mode: "vector", "lexical" (Postgres full-text) or "hybrid" (both, fused with RRF)
+    retrieval_mode: str = Field("vector", env="RETRIEVAL_MODE")
+    # Text search configuration for documents.content_tsv (fixed when the migration runs)
+    text_search_config: str = Field("english", env="TEXT_SEARCH_CONFIG")
+    # Hybrid: candidates fetched per leg, and the reciprocal-rank-fusion constant
+    hybrid_candidates: int = Field(20, env="HYBRID_CANDIDATES")
+    rrf_k: int = Field(60, env="RRF_K")
+
+    # Cross-encoder re-ranking via TEI POST /rerank (unset disables). Retrieval oversamples
+    # RERANK_CANDIDATES chunks, keeps those scoring >= RERANK_MIN_SCORE, at most TOP_K of them
+    reranker_base_url: Optional[str] = Field(None, env="RERANKER_BASE_URL")
+    rerank_candidates: int = Field(20, env="RERANK_CANDIDATES")
+    rerank_min_score: float = Field(0.2, env="RERANK_MIN_SCORE")
+    rerank_timeout_seconds: float = Field(5.0, env="RERANK_TIMEOUT_SECONDS")
+    # Max characters of retrieved context handed to the prompt builder (0 = token budget only)
+    context_max_chars: int = Field(0, env="CONTEXT_MAX_CHARS")
+
+    # Query embedding micro-batching: max questions per /embed call and max time to wait for more
+    query_embed_batch_max_size: int = Field(32, env="QUERY_EMBED_BATCH_MAX_SIZE")
+    query_embed_batch_max_wait_ms: float = Field(5.0, env="QUERY_EMBED_BATCH_MAX_WAIT_MS")
+
+    # In-process cache of question embeddings (entries, seconds); size 0 disables
+    query_embedding_cache_size: int = Field(1024, env="QUERY_EMBEDDING_CACHE_SIZE")
+    query_embedding_cache_ttl_seconds: float = Field(3600.0, env="QUERY_EMBEDDING_CACHE_TTL_SECONDS")
+
+    # Semantic answer cache: reuse an answer when a new question's embedding is this close (cosine)
+    answer_cache_enabled: bool = Field(True, env="ANSWER_CACHE_ENABLED")
+    answer_cache_size: int = Field(512, env="ANSWER_CACHE_SIZE")
+    answer_cache_similarity_threshold: float = Field(0.95, env="ANSWER_CACHE_SIMILARITY_THRESHOLD")
+    answer_cache_ttl_seconds: float = Field(86400.0, env="ANSWER_CACHE_TTL_SECONDS")
 
     pdf_dir: str = Field("pdfs/", env="PDF_DIR")
 
+    # Upload spooling: bytes read from the request per write to disk
+    upload_chunk_bytes: int = Field(1024 * 1024, env="UPLOAD_CHUNK_BYTES")
+    # Ingestion pipeline: chunks per embed/write batch and max batches queued between stages
+    ingest_pipeline_batch_size: int = Field(128, env="INGEST_PIPELINE_BATCH_SIZE")
+    ingest_pipeline_queue_depth: int = Field(2, env="INGEST_PIPELINE_QUEUE_DEPTH")
+    # PDF parsing/splitting: worker processes (0 parses in a thread instead) and pages per shard sent to a worker
+    ingest_parse_processes: int = Field(2, env="INGEST_PARSE_PROCESSES")
+    ingest_parse_pages_per_shard: int = Field(8, env="INGEST_PARSE_PAGES_PER_SHARD")
+
+    # Background ingestion jobs: worker count, max queued jobs, per-job timeout, progress flush interval
+    ingest_workers: int = Field(2, env="INGEST_WORKERS")
+    ingest_max_pending_jobs: int = Field(32, env="INGEST_MAX_PENDING_JOBS")
+    ingest_job_timeout_seconds: float = Field(3600.0, env="INGEST_JOB_TIMEOUT_SECONDS")
+    ingest_progress_interval_seconds: float = Field(2.0, env="INGEST_PROGRESS_INTERVAL_SECONDS")
+    # A running job's lease; renewed on every progress flush. Only jobs whose lease expired (their
+    # process died) are recovered at startup, so replicas never re-run each other's jobs
+    ingest_job_lease_seconds: float = Field(60.0, env="INGEST_JOB_LEASE_SECONDS")
+    # Jobs interrupted by a restart are resumed until they have been started this many times
+    ingest_max_attempts: int = Field(3, env="INGEST_MAX_ATTEMPTS")
+
+    # Ingestion writes: stream rows with binary COPY (False falls back to ORM inserts)
+    ingest_use_copy: bool = Field(True, env="INGEST_USE_COPY")
+    # Rows per COPY batch; each batch is committed separately to keep transactions short
+    ingest_write_batch_size: int = Field(500, env="INGEST_WRITE_BATCH_SIZE")
+
     ## PostgreSQL (metadata) credentials, read from .env
     POSTGRES_SERVER: str  = Field("localhost", env="POSTGRES_SERVER")
     POSTGRES_PORT: int    = Field(5432, env="POSTGRES_PORT")
@@ -36,6 +130,32 @@ class Settings(BaseSettings):
     # PGVector
     pgvector_dim: int = Field(768, env="PGVECTOR_DIM")
 
+    # ANN index on documents.embedding (created by Alembic): "hnsw", "ivfflat" or "none"
+    vector_index_type: str = Field("hnsw", env="VECTOR_INDEX_TYPE")
+    # HNSW build parameters (graph degree / build-time candidate list)
+    hnsw_m: int = Field(16, env="HNSW_M")
+    hnsw_ef_construction: int = Field(64, env="HNSW_EF_CONSTRUCTION")
+    # HNSW query-time candidate list; must be >= top_k, higher = better recall, slower
+    hnsw_ef_search: int = Field(40, env="HNSW_EF_SEARCH")
+    # IVFFlat build parameter (rows / 1000 is a good start up to 1M rows)
+    ivfflat_lists: int = Field(100, env="IVFFLAT_LISTS")
+    # IVFFlat query-time number of lists to probe
+    ivfflat_probes: int = Field(10, env="IVFFLAT_PROBES")
+    # Optional maintenance_work_mem for index builds (e.g. "1GB"); HNSW builds much faster when the graph fits
+    vector_index_build_mem: Optional[str] = Field(None, env="VECTOR_INDEX_BUILD_MEM")
+    # Column type of documents.embedding (migration 20261017_08): "vector" (float32) or "halfvec" (float16,
+    # half the heap and index size). Changing it needs `alembic downgrade 20261017_07 && alembic upgrade head`
+    vector_storage: str = Field("vector", env="VECTOR_STORAGE")
+    # "binary" replaces the ANN index with an HNSW index over binary_quantize(embedding) (Hamming distance,
+    # 1 bit per dimension); candidates are then re-ranked exactly on the stored embeddings. "none" keeps
+    # the index on the embedding column itself
+    vector_quantization: str = Field("none", env="VECTOR_QUANTIZATION")
+    # Binary quantization: candidates fetched from the Hamming index per requested result
+    vector_rerank_oversample: int = Field(8, env="VECTOR_RERANK_OVERSAMPLE")
+    # pgvector >= 0.8 iterative index scans for metadata-filtered queries: "relaxed_order", "strict_order" (HNSW only;
+    # IVFFlat uses relaxed_order) or "off". Disabled automatically when the installed pgvector is older than 0.8
+    vector_iterative_scan: str = Field("relaxed_order", env="VECTOR_ITERATIVE_SCAN")
+
     # Database URL (alternative connection string)
     database_url: Optional[str] = Field(None, env="DATABASE_URL")
 
@@ -1,21 +1,64 @@
+from datetime import datetime
 from pydantic import BaseModel, Field
-from typing import Any, List, Dict, Optional
+from typing import Any, List, Dict, Literal, Optional
 
 class UploadResponse(BaseModel):
     message: str
-    inserted_count: int
+    job_id: str
+    status: str
+
+class IngestJobStatus(BaseModel):
+    id: str
+    filename: str
+    status: str = Field(..., description="queued | running | succeeded | failed")
+    attempts: int
+    pages_parsed: int
+    chunks_split: int
+    chunks_embedded: int
+    chunks_reused: int = Field(..., description="Chunks already stored (same content hash and model); not re-embedded")
+    rows_written: int = Field(..., description="New chunks inserted into documents")
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class QueryFilters(BaseModel):
+    sources: Optional[List[str]] = Field(
+        None, description="Only chunks whose metadata.source is one of these (as returned in source_docs)"
+    )
+    filenames: Optional[List[str]] = Field(
+        None, description="Only chunks from uploads with one of these original file names (e.g. \"k8s.pdf\")"
+    )
+    page_min: Optional[int] = Field(None, ge=0, description="Lowest metadata.page (0-based, inclusive)")
+    page_max: Optional[int] = Field(None, ge=0, description="Highest metadata.page (0-based, inclusive)")
+    ingestion_id: Optional[str] = Field(None, description="Only chunks from this upload job")
 
 class QueryRequest(BaseModel):
     question: str
     conversation_id: Optional[str] = Field(None, description="Conversation UUID")
+    retrieval_mode: Optional[Literal["vector", "lexical", "hybrid"]] = Field(
+        None, description="Retrieval strategy; defaults to the server's RETRIEVAL_MODE"
+    )
+    filters: Optional[QueryFilters] = None
+
+class QueryBatchRequest(BaseModel):
+    questions: List[str] = Field(..., min_length=1, description="Questions to answer independently (no conversation history)")
+    retrieval_mode: Optional[Literal["vector", "lexical", "hybrid"]] = Field(
+        None, description="Retrieval strategy for every question; defaults to the server's RETRIEVAL_MODE"
+    )
+    filters: Optional[QueryFilters] = None
 
 
 class SourceDoc(BaseModel):
     page_content: Optional[str] = None  # optional if not used
     metadata: Dict[str, Any]
     similarity: Optional[float] = None
+    rerank_score: Optional[float] = Field(None, description="Cross-encoder relevance in [0, 1] when re-ranking is on")
     id: str
 
 class QueryResponse(BaseModel):
     answer: str
-    source_docs: List[SourceDoc]
\ No newline at end of file
+    source_docs: List[SourceDoc]
+    retrieval_ms: Dict[str, float] = Field(
+        default_factory=dict, description="Per-leg retrieval latency, plus rerank when enabled (empty on answer-cache hits)"
+    )
\ No newline at end of file
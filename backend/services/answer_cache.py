@@ -0,0 +1,189 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+import copy
+import itertools
+import threading
+import time
+
+import numpy as np
+
+from config import settings
+
+# Misses whose best similarity falls within this margin of the threshold are
+# counted separately; a high count suggests the threshold is too strict.
+_NEAR_MISS_MARGIN = 0.05
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    sources: List[Dict[str, Any]]
+    similarity: float = 1.0
+
+
+class SemanticAnswerCache:
+    """
+    In-memory semantic cache for generated answers.
+
+    Question embeddings are kept L2-normalized in a preallocated float32
+    matrix, so a lookup is one matrix-vector product; the best match above
+    the cosine threshold is returned. Entries expire by TTL, the least
+    recently used slot is recycled when full, and invalidate() drops
+    everything (called after documents are ingested). A generation counter
+    keeps answers computed before an invalidation from being stored after it.
+    Entries only match lookups with the same scope (retrieval mode etc.).
+    """
+
+    def __init__(self, capacity: int, threshold: float, ttl_seconds: float):
+        self.capacity = max(0, capacity)
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None
+        self._expires = np.zeros(self.capacity, dtype=np.float64)
+        self._last_used = np.zeros(self.capacity, dtype=np.float64)
+        self._scope_ids = np.full(self.capacity, -1, dtype=np.int32)
+        # Scope string -> id, reference-counted by the slots holding it, so at
+        # most `capacity` client-chosen scopes (filter combinations) are kept
+        self._scopes: Dict[str, int] = {}
+        self._scope_refs: Dict[int, int] = {}
+        self._next_scope_id = itertools.count()
+        self._entries: List[Optional[CachedAnswer]] = [None] * self.capacity
+        self.hits = 0
+        self.misses = 0
+        self.near_misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm else v
+
+    def _acquire_scope(self, scope: str) -> int:
+        scope_id = self._scopes.get(scope)
+        if scope_id is None:
+            scope_id = self._scopes[scope] = next(self._next_scope_id)
+        self._scope_refs[scope_id] = self._scope_refs.get(scope_id, 0) + 1
+        return scope_id
+
+    def _release_slot_scope(self, idx: int) -> None:
+        scope_id = int(self._scope_ids[idx])
+        self._scope_ids[idx] = -1
+        if scope_id < 0:
+            return
+        refs = self._scope_refs[scope_id] - 1
+        if refs:
+            self._scope_refs[scope_id] = refs
+            return
+        del self._scope_refs[scope_id]
+        for name, sid in self._scopes.items():
+            if sid == scope_id:
+                del self._scopes[name]
+                break
+
+    def _clear_scopes(self) -> None:
+        self._scope_ids[:] = -1
+        self._scopes.clear()
+        self._scope_refs.clear()
+
+    def lookup(self, vector, scope: str = "") -> Optional[CachedAnswer]:
+        if self.capacity == 0:
+            return None
+        q = self._normalize(vector)
+        now = time.monotonic()
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != q.shape[0]:
+                self.misses += 1
+                return None
+            scope_id = self._scopes.get(scope)
+            if scope_id is None:
+                # No cached entry was ever stored under this scope
+                self.misses += 1
+                return None
+            sims = self._matrix @ q
+            sims[(self._expires <= now) | (self._scope_ids != scope_id)] = -np.inf
+            idx = int(np.argmax(sims))
+            best = float(sims[idx])
+            if best < self.threshold:
+                self.misses += 1
+                if best >= self.threshold - _NEAR_MISS_MARGIN:
+                    self.near_misses += 1
+                return None
+            entry = self._entries[idx]
+            self._last_used[idx] = now
+            self.hits += 1
+        return CachedAnswer(
+            question=entry.question,
+            answer=entry.answer,
+            sources=copy.deepcopy(entry.sources),
+            similarity=best,
+        )
+
+    def put(
+        self,
+        vector,
+        question: str,
+        answer: str,
+        sources: List[Dict[str, Any]],
+        generation: int,
+        scope: str = "",
+    ) -> bool:
+        if self.capacity == 0:
+            return False
+        q = self._normalize(vector)
+        now = time.monotonic()
+        with self._lock:
+            if generation != self.generation:
+                return False  # corpus changed while this answer was generated
+            if self._matrix is None or self._matrix.shape[1] != q.shape[0]:
+                self._matrix = np.zeros((self.capacity, q.shape[0]), dtype=np.float32)
+                self._expires[:] = 0.0
+                self._entries = [None] * self.capacity
+                self._clear_scopes()
+            expired = np.flatnonzero(self._expires <= now)
+            idx = int(expired[0]) if expired.size else int(np.argmin(self._last_used))
+            self._matrix[idx] = q
+            self._expires[idx] = now + self.ttl_seconds
+            self._last_used[idx] = now
+            self._release_slot_scope(idx)
+            self._scope_ids[idx] = self._acquire_scope(scope)
+            self._entries[idx] = CachedAnswer(
+                question=question, answer=answer, sources=copy.deepcopy(sources)
+            )
+        return True
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            self._expires[:] = 0.0
+            self._entries = [None] * self.capacity
+            self._clear_scopes()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": int(np.count_nonzero(self._expires > now)),
+                "capacity": self.capacity,
+                "threshold": self.threshold,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "near_misses": self.near_misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "invalidations": self.invalidations,
+                "scopes": len(self._scopes),
+                "generation": self.generation,
+            }
+
+
+answer_cache = SemanticAnswerCache(
+    capacity=settings.answer_cache_size if settings.answer_cache_enabled else 0,
+    threshold=settings.answer_cache_similarity_threshold,
+    ttl_seconds=settings.answer_cache_ttl_seconds,
+)
@@ -1,14 +1,23 @@
 import os
-from contextlib import contextmanager
-from sqlalchemy import create_engine
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlmodel import Session as SQLModelSession
+from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.pool import QueuePool
 from dotenv import load_dotenv
+from pgvector.psycopg import register_vector, register_vector_async
 from config import settings
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 def _build_sync_dsn(raw: str) -> str:
     dsn = raw or ""
     if "+asyncpg" in dsn:
@@ -32,11 +41,74 @@ engine = create_engine(
     future=True,
 )
 
+@event.listens_for(engine, "connect")
+def _register_pgvector(dbapi_connection, connection_record) -> None:
+    """Teach each new psycopg connection the pgvector types (needed for binary COPY)."""
+    try:
+        register_vector(dbapi_connection)
+    except Exception as exc:  # noqa: BLE001 - extension is created by the first migration
+        logger.warning("pgvector types not registered on connection: %s", exc)
+    finally:
+        dbapi_connection.rollback()
+
 SessionLocal = sessionmaker(bind=engine, class_=SQLModelSession, expire_on_commit=False)
 
+# Async engine (psycopg3 async driver) for request hot paths, so DB waits don't
+# occupy threadpool workers. It has its own pool, separate from the sync one
+# used by ingestion and other background work.
+async_engine = create_async_engine(
+    SYNC_DSN,
+    pool_size=int(os.getenv("DB_ASYNC_POOL_SIZE", "10")),
+    max_overflow=int(os.getenv("DB_ASYNC_MAX_OVERFLOW", "10")),
+    pool_timeout=float(os.getenv("DB_ASYNC_POOL_TIMEOUT", "30")),
+    pool_pre_ping=True,
+    pool_recycle=1800,
+)
+
+@event.listens_for(async_engine.sync_engine, "connect")
+def _register_pgvector_async(dbapi_connection, connection_record) -> None:
+    try:
+        dbapi_connection.run_async(register_vector_async)
+    except Exception as exc:  # noqa: BLE001 - extension is created by the first migration
+        logger.warning("pgvector types not registered on async connection: %s", exc)
+    finally:
+        dbapi_connection.rollback()
+
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+class PoolWaitStats:
+    """Time spent waiting to check a connection out of the async pool."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checkouts": self.count,
+                "avg_wait_ms": round(1000 * self.total_seconds / self.count, 3) if self.count else None,
+                "max_wait_ms": round(1000 * self.max_seconds, 3),
+            }
+
+
+async_pool_wait = PoolWaitStats()
+
 def init_db() -> None:
     return None
 
+async def dispose_db() -> None:
+    await async_engine.dispose()
+
 @contextmanager
 def get_session() -> SQLModelSession:  # type: ignore
     session: SQLModelSession = SessionLocal()
@@ -44,3 +116,41 @@ def get_session() -> SQLModelSession:  # type: ignore
         yield session
     finally:
         session.close()
+
+@contextmanager
+def get_raw_connection():
+    """Yield the pooled psycopg connection for driver-level APIs such as COPY."""
+    pooled = engine.raw_connection()
+    try:
+        yield pooled.driver_connection
+    except Exception:
+        pooled.rollback()
+        raise
+    finally:
+        pooled.close()
+
+@asynccontextmanager
+async def get_async_session() -> AsyncIterator[AsyncSession]:
+    """Async counterpart of get_session; checks out a connection eagerly to time the pool wait."""
+    session: AsyncSession = AsyncSessionLocal()
+    try:
+        start = time.perf_counter()
+        await session.connection()
+        async_pool_wait.record(time.perf_counter() - start)
+        yield session
+    finally:
+        await session.close()
+
+def _pool_status(pool) -> Dict[str, Any]:
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
+
+def pool_status() -> Dict[str, Any]:
+    return {
+        "sync": _pool_status(engine.pool),
+        "async": {**_pool_status(async_engine.pool), **async_pool_wait.snapshot()},
+    }
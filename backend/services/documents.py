@@ -1,46 +1,117 @@
-from typing import Any, Dict, List
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID as PyUUID
+import base64
+import logging
+import numpy as np
 from sqlmodel import select
 from services.models import Document
-from services.db import get_session
-import logging
+from services.db import get_async_session
 
 logger = logging.getLogger(__name__)
 
-def list_documents(skip: int = 0, limit: int = 10) -> List[Dict[str, Any]]:
+_columns = Document.__table__.c
+
+# Listable fields and the documents column each one reads
+DOCUMENT_FIELDS = {
+    "id": _columns["id"],
+    "content": _columns["content"],
+    "metadata": _columns["metadata"],
+    "content_hash": _columns["content_hash"],
+    "embedding_model": _columns["embedding_model"],
+}
+DEFAULT_FIELDS = ("id", "content", "metadata")
+
+def parse_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    """Comma-separated field list -> validated tuple; raises ValueError on unknown names."""
+    if not fields:
+        return DEFAULT_FIELDS
+    names = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [n for n in names if n not in DOCUMENT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown document field(s): {', '.join(unknown)}")
+    return names or DEFAULT_FIELDS
+
+def encode_cursor(doc_id: PyUUID) -> str:
+    return base64.urlsafe_b64encode(doc_id.bytes).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> PyUUID:
+    """Raises ValueError for malformed cursors."""
+    try:
+        return PyUUID(bytes=base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Invalid documents cursor") from exc
+
+def encode_embedding(embedding) -> Optional[str]:
     """
-    Open a single AsyncSession, SELECT * FROM documents, and return
-    a list of plain dicts (id, content, embedding, metadata).
+    Little-endian float32, base64: 4 bytes per dimension instead of ~20 chars
+    of JSON. halfvec columns come back as pgvector HalfVector, which numpy
+    can't convert directly; they are widened to float32 too.
     """
-    try:
-        with get_session() as session:
-            logger.debug("Starting to fetch documents")
-            stmt = select(Document).offset(skip).limit(limit)
-            result = session.exec(stmt)
-            docs = result.all()
-            logger.debug(f"Fetched {len(docs)} documents from DB")
-            documents_list: List[Dict[str, Any]] = []
-            for doc in docs:
-                logger.debug(f"Type of embedding: {type(doc.embedding)}")
-                documents_list.append({
-                    "id": str(doc.id),
-                    "content": doc.content,
-                    "embedding": safe_embedding(doc.embedding),
-                    "metadata": doc.meta,
-                })
-            return documents_list
-    except Exception as e:
-        logger.error(f"Database error in list_documents: {e}")
-        raise
-
-def safe_embedding(embedding) -> list | None:
     if embedding is None:
         return None
-    try:
-        if hasattr(embedding, "tolist"):
-            return embedding.tolist()
-        if isinstance(embedding, (list, tuple)):
-            return list(embedding)
-        return [float(x) for x in embedding]  # fallback
-    except Exception as e:
-        logger.warning(f"Failed to convert embedding: {e}")
-        return None
+    to_numpy = getattr(embedding, "to_numpy", None)
+    values = to_numpy() if callable(to_numpy) else embedding
+    return base64.b64encode(np.asarray(values, dtype="<f4").tobytes()).decode()
+
+def _page_statement(fields: Sequence[str], embedding_format: str, limit: int, after: Optional[PyUUID]):
+    # id is always selected: it is the keyset
+    columns = [_columns["id"]] + [DOCUMENT_FIELDS[f] for f in fields if f != "id"]
+    if embedding_format != "none":
+        columns.append(_columns["embedding"])
+    stmt = select(*columns).order_by(_columns["id"]).limit(limit)
+    if after is not None:
+        stmt = stmt.where(_columns["id"] > after)
+    return stmt
+
+def _to_dict(row, fields: Sequence[str], embedding_format: str) -> Dict[str, Any]:
+    mapping = row._mapping
+    out: Dict[str, Any] = {}
+    for f in fields:
+        value = mapping[DOCUMENT_FIELDS[f]]
+        out[f] = str(value) if f == "id" else value
+    if embedding_format == "base64":
+        out["embedding"] = encode_embedding(mapping[_columns["embedding"]])
+    return out
+
+async def list_documents(
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    fields: Sequence[str] = DEFAULT_FIELDS,
+    embedding_format: str = "none",
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    One page of documents ordered by id (primary key), keyset-paginated so
+    deep pages cost the same as the first. Only the requested columns are
+    selected; embeddings are read only when embedding_format asks for them.
+    Returns the rows and the cursor for the next page (None on the last page).
+    """
+    after = decode_cursor(cursor) if cursor else None
+    stmt = _page_statement(fields, embedding_format, limit + 1, after)
+    async with get_async_session() as session:
+        rows = (await session.exec(stmt)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]._mapping[_columns["id"]])
+    return [_to_dict(r, fields, embedding_format) for r in rows], next_cursor
+
+async def iter_documents(
+    fields: Sequence[str] = DEFAULT_FIELDS,
+    embedding_format: str = "none",
+    batch_size: int = 1000,
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Walk the whole table in keyset batches, each in its own short session,
+    so an export neither holds a long transaction nor buffers the table.
+    """
+    after: Optional[PyUUID] = None
+    while True:
+        stmt = _page_statement(fields, embedding_format, batch_size, after)
+        async with get_async_session() as session:
+            rows = (await session.exec(stmt)).all()
+        if not rows:
+            return
+        yield [_to_dict(r, fields, embedding_format) for r in rows]
+        if len(rows) < batch_size:
+            return
+        after = rows[-1]._mapping[_columns["id"]]
@@ -0,0 +1,72 @@
+from typing import Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+
+from services.metrics import registry
+from services.tei_embeddings import TEIEmbeddings
+
+logger = logging.getLogger(__name__)
+
+batch_size_histogram = registry.histogram(
+    "tei_query_embed_batch_size",
+    "Questions coalesced into one TEI /embed request",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+
+
+class QueryEmbeddingBatcher:
+    """
+    Coalesces concurrent single-question embed calls into one batched /embed
+    request. A batch is sent when max_batch_size callers are waiting or
+    max_wait_ms after the first caller arrived, whichever comes first; each
+    caller then receives its own vector.
+    """
+
+    def __init__(self, embeddings: TEIEmbeddings, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.embeddings = embeddings
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+    async def embed(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        fut: asyncio.Future = loop.create_future()
+        self._pending.append((text, fut))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        # Callers that gave up (client disconnect) don't need a vector
+        batch = [(text, fut) for text, fut in batch if not fut.done()]
+        if not batch:
+            return
+        batch_size_histogram.observe(len(batch))
+        task = asyncio.create_task(self._send(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _send(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        # Identical questions in one window share a single input
+        unique: Dict[str, int] = {}
+        for text, _ in batch:
+            unique.setdefault(text, len(unique))
+        try:
+            vectors = await self.embeddings.aembed_documents(list(unique))
+        except Exception as exc:  # noqa: BLE001 - delivered to every waiting caller
+            logger.warning("Batched query embedding failed for %s question(s): %s", len(batch), exc)
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(exc)
+            return
+        for text, fut in batch:
+            if not fut.done():
+                fut.set_result(vectors[unique[text]])
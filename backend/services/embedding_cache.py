@@ -0,0 +1,80 @@
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import threading
+import time
+
+import numpy as np
+
+
+def normalize_question(text: str) -> str:
+    """Fold case and collapse whitespace so trivially different phrasings share a key."""
+    return " ".join(text.casefold().split())
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU + TTL cache of question embeddings.
+    Keys are (embedding model, normalized question); values are float32 arrays.
+    Thread-safe: it is used from both the event loop and the threadpool.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl_seconds: float = 3600.0):
+        self.maxsize = max(0, maxsize)
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[tuple[str, str], tuple[float, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, model: str, question: str) -> Optional[np.ndarray]:
+        key = (model, normalize_question(question))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, vector = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, model: str, question: str, vector) -> np.ndarray:
+        arr = np.asarray(vector, dtype=np.float32)
+        arr.setflags(write=False)  # shared between requests
+        if self.maxsize == 0:
+            return arr
+        key = (model, normalize_question(question))
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, arr)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return arr
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "bytes": sum(v.nbytes for _, v in self._entries.values()),
+            }
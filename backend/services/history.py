@@ -1,28 +1,182 @@
-from typing import List, Dict
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
 from uuid import UUID as PyUUID
+import asyncio
+import base64
+import logging
+from sqlalchemy import func, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlmodel import select
-from services.db import get_session
-from services.models import ChatHistory
+from config import settings
+from services.db import get_async_session
+from services.history_cache import RecentHistoryCache
+from services.models import ChatHistory, ConversationSummary
+from services.prompting import summarize_turns
 
-def get_history(conversation_id: str) -> List[Dict[str, str]]:
-    """Fetch all prior turns for this conversation, ordered by timestamp."""
-    with get_session() as session:
+logger = logging.getLogger(__name__)
+
+# Newest turns + summary per conversation, updated on append
+history_cache = RecentHistoryCache(
+    max_conversations=settings.history_cache_conversations,
+    max_turns=2 * settings.history_window_turns,
+    ttl_seconds=settings.history_cache_ttl_seconds,
+)
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{row_id}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Raises ValueError for malformed cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (UnicodeDecodeError, ValueError, TypeError) as exc:
+        raise ValueError("Invalid history cursor") from exc
+
+async def get_history_page(
+    conversation_id: str, limit: int, cursor: Optional[str] = None
+) -> Tuple[List[Dict[str, str]], Optional[str]]:
+    """
+    One page of turns in chronological order, keyset-paginated on
+    (created_at, id) via ix_chat_history_conversation_created. Returns the
+    turns and the cursor for the next page (None on the last page).
+    """
+    stmt = (
+        select(ChatHistory.id, ChatHistory.question, ChatHistory.answer, ChatHistory.created_at)
+        .where(ChatHistory.conversation_id == PyUUID(conversation_id))
+        .order_by(ChatHistory.created_at, ChatHistory.id)
+        .limit(limit + 1)
+    )
+    if cursor:
+        stmt = stmt.where(tuple_(ChatHistory.created_at, ChatHistory.id) > tuple_(*decode_cursor(cursor)))
+    async with get_async_session() as session:
+        rows = (await session.exec(stmt)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return [{"question": r.question, "answer": r.answer} for r in rows], next_cursor
+
+async def get_prompt_history(conversation_id: str) -> Tuple[List[Dict[str, str]], Optional[str]]:
+    """
+    History for prompt assembly: the turns not yet folded into the rolling
+    summary (chronological; fewer than 2 * HISTORY_WINDOW_TURNS) plus the
+    summary, if any. Served from history_cache when possible.
+    """
+    cached = history_cache.get(conversation_id)
+    if cached is not None:
+        return cached
+    conv_id = PyUUID(conversation_id)
+    async with get_async_session() as session:
         stmt = (
             select(ChatHistory.question, ChatHistory.answer)
-            .where(ChatHistory.conversation_id == PyUUID(conversation_id))
-            .order_by(ChatHistory.created_at)
+            .where(ChatHistory.conversation_id == conv_id)
+            .order_by(ChatHistory.created_at.desc())
+            .limit(max(0, 2 * settings.history_window_turns))
         )
-        result = session.exec(stmt)
-        rows = result.all()
-    return [{"question": q, "answer": a} for q, a in rows]
+        rows = (await session.exec(stmt)).all()
+        summary = await session.get(ConversationSummary, conv_id)
+        if summary is not None and rows:
+            total = (
+                await session.exec(
+                    select(func.count()).select_from(ChatHistory).where(ChatHistory.conversation_id == conv_id)
+                )
+            ).one()
+            rows = rows[: max(0, total - summary.turns_summarized)]
+    turns = [{"question": q, "answer": a} for q, a in reversed(rows)]
+    summary_text = summary.summary if summary is not None else None
+    history_cache.put(conversation_id, turns, summary_text)
+    return turns, summary_text
 
-def append_history(conversation_id: str, question: str, answer: str) -> None:
+async def append_history(conversation_id: str, question: str, answer: str) -> None:
     """Insert the latest Q&A turn into chat_history."""
-    with get_session() as session:
+    async with get_async_session() as session:
         rec = ChatHistory(
             conversation_id=PyUUID(conversation_id),
             question=question,
             answer=answer,
         )
         session.add(rec)
-        session.commit()
+        await session.commit()
+    history_cache.append(conversation_id, {"question": question, "answer": answer})
+
+async def refresh_summary(conversation_id: str) -> None:
+    """
+    Fold older turns into the conversation's rolling summary once
+    2 * HISTORY_WINDOW_TURNS turns are unsummarized, keeping the newest
+    HISTORY_WINDOW_TURNS verbatim. Folding in blocks rather than every turn
+    keeps the prompt prefix (summary + turns) unchanged between folds, so
+    llama.cpp can reuse its cached prefill.
+    """
+    conv_id = PyUUID(conversation_id)
+    window = max(0, settings.history_window_turns)
+    async with get_async_session() as session:
+        total = (
+            await session.exec(
+                select(func.count()).select_from(ChatHistory).where(ChatHistory.conversation_id == conv_id)
+            )
+        ).one()
+        current = await session.get(ConversationSummary, conv_id)
+        done = current.turns_summarized if current is not None else 0
+        if total - done < 2 * window or total - done == 0:
+            return
+        due = total - window - done
+        stmt = (
+            select(ChatHistory.question, ChatHistory.answer)
+            .where(ChatHistory.conversation_id == conv_id)
+            .order_by(ChatHistory.created_at)
+            .offset(done)
+            .limit(due)
+        )
+        rows = (await session.exec(stmt)).all()
+
+    summary = await summarize_turns(
+        current.summary if current is not None else None,
+        [{"question": q, "answer": a} for q, a in rows],
+    )
+    stmt = pg_insert(ConversationSummary.__table__).values(
+        conversation_id=conv_id,
+        summary=summary,
+        turns_summarized=done + len(rows),
+        updated_at=datetime.utcnow(),
+    )
+    # A concurrent refresh that got further wins
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["conversation_id"],
+        set_={
+            "summary": stmt.excluded.summary,
+            "turns_summarized": stmt.excluded.turns_summarized,
+            "updated_at": stmt.excluded.updated_at,
+        },
+        where=ConversationSummary.__table__.c.turns_summarized < stmt.excluded.turns_summarized,
+    )
+    async with get_async_session() as session:
+        result = await session.execute(stmt)
+        await session.commit()
+    if result.rowcount:
+        history_cache.set_summary(conversation_id, summary, folded=len(rows))
+    logger.info("Summarized %s older turn(s) of conversation %s", len(rows), conversation_id)
+
+_summary_tasks: Dict[str, asyncio.Task] = {}
+
+def schedule_summary_refresh(conversation_id: str) -> None:
+    """Refresh the rolling summary in the background; one refresh per conversation at a time."""
+    if conversation_id in _summary_tasks:
+        return
+
+    async def _run() -> None:
+        try:
+            await refresh_summary(conversation_id)
+        except Exception:
+            logger.exception("Failed to refresh summary for conversation %s", conversation_id)
+        finally:
+            _summary_tasks.pop(conversation_id, None)
+
+    _summary_tasks[conversation_id] = asyncio.create_task(_run())
+
+async def cancel_summary_refreshes() -> None:
+    tasks: Set[asyncio.Task] = set(_summary_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,98 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import threading
+import time
+
+
+@dataclass
+class _Entry:
+    expires_at: float
+    turns: List[Dict[str, str]] = field(default_factory=list)
+    summary: Optional[str] = None
+
+
+class RecentHistoryCache:
+    """
+    Bounded LRU + TTL cache of the unsummarized turns and the rolling summary
+    per conversation. Entries are filled from the database on a miss and then kept
+    current by append()/set_summary(), so the next turn is served from memory.
+    Each replica has its own cache; the TTL bounds staleness when a
+    conversation's turns land on different replicas.
+    """
+
+    def __init__(self, max_conversations: int, max_turns: int, ttl_seconds: float):
+        self.max_conversations = max(0, max_conversations)
+        self.max_turns = max(0, max_turns)
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, conversation_id: str) -> Optional[Tuple[List[Dict[str, str]], Optional[str]]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None or entry.expires_at <= now:
+                if entry is not None:
+                    del self._entries[conversation_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(conversation_id)
+            self.hits += 1
+            return list(entry.turns), entry.summary
+
+    def put(self, conversation_id: str, turns: List[Dict[str, str]], summary: Optional[str]) -> None:
+        if self.max_conversations == 0:
+            return
+        with self._lock:
+            self._entries[conversation_id] = _Entry(
+                expires_at=time.monotonic() + self.ttl_seconds,
+                turns=list(turns)[-self.max_turns:] if self.max_turns else [],
+                summary=summary,
+            )
+            self._entries.move_to_end(conversation_id)
+            while len(self._entries) > self.max_conversations:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def append(self, conversation_id: str, turn: Dict[str, str]) -> None:
+        """Add a turn to a cached conversation; unknown conversations are left to the next miss."""
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                return
+            if self.max_turns:
+                entry.turns.append(turn)
+                del entry.turns[: -self.max_turns]
+            entry.expires_at = time.monotonic() + self.ttl_seconds
+            self._entries.move_to_end(conversation_id)
+
+    def set_summary(self, conversation_id: str, summary: str, folded: int = 0) -> None:
+        """Store a new summary; the oldest `folded` cached turns are now part of it."""
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is not None:
+                entry.summary = summary
+                del entry.turns[:folded]
+
+    def discard(self, conversation_ids: Iterable[str]) -> None:
+        with self._lock:
+            for conversation_id in conversation_ids:
+                self._entries.pop(conversation_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_conversations": self.max_conversations,
+                "max_turns": self.max_turns,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+
+from sqlalchemy import text
+
+from config import settings
+from services.db import get_async_session
+from services.history import history_cache
+
+logger = logging.getLogger(__name__)
+
+# Conversations whose newest turn is older than the cutoff (uses ix_chat_history_created_at
+# for the candidates and ix_chat_history_conversation_created for the NOT EXISTS probe)
+_EXPIRED_CONVERSATIONS_SQL = text(
+    """
+    SELECT DISTINCT h.conversation_id
+    FROM chat_history h
+    WHERE h.created_at < :cutoff
+      AND NOT EXISTS (
+          SELECT 1 FROM chat_history r
+          WHERE r.conversation_id = h.conversation_id AND r.created_at >= :cutoff
+      )
+    LIMIT :batch
+    """
+)
+
+# Only rows older than the cutoff move, so a turn appended mid-batch stays live
+_ARCHIVE_SQL = text(
+    """
+    WITH moved AS (
+        DELETE FROM chat_history
+        WHERE conversation_id = ANY(:ids) AND created_at < :cutoff
+        RETURNING id, conversation_id, question, answer, created_at
+    )
+    INSERT INTO chat_history_archive (id, conversation_id, question, answer, created_at, archived_at)
+    SELECT id, conversation_id, question, answer, created_at, now() FROM moved
+    """
+)
+
+_DELETE_SQL = text("DELETE FROM chat_history WHERE conversation_id = ANY(:ids) AND created_at < :cutoff")
+
+_DELETE_SUMMARIES_SQL = text("DELETE FROM conversation_summaries WHERE conversation_id = ANY(:ids)")
+
+
+async def trim_history_batch(cutoff: datetime, batch_size: int, archive: bool) -> int:
+    """Move (or delete) one batch of expired conversations in its own transaction; returns how many."""
+    async with get_async_session() as session:
+        ids: List[Any] = (
+            await session.execute(_EXPIRED_CONVERSATIONS_SQL, {"cutoff": cutoff, "batch": batch_size})
+        ).scalars().all()
+        if not ids:
+            return 0
+        params = {"ids": list(ids), "cutoff": cutoff}
+        await session.execute(_ARCHIVE_SQL if archive else _DELETE_SQL, params)
+        await session.execute(_DELETE_SUMMARIES_SQL, {"ids": list(ids)})
+        await session.commit()
+    history_cache.discard(str(i) for i in ids)
+    return len(ids)
+
+
+class HistoryRetention:
+    """
+    Background loop that trims conversations idle for more than retention_days,
+    in batches of batch_size conversations per transaction so locks stay short.
+    """
+
+    def __init__(self, retention_days: int, batch_size: int, interval_seconds: float, archive: bool):
+        self.retention_days = retention_days
+        self.batch_size = max(1, batch_size)
+        self.interval_seconds = interval_seconds
+        self.archive = archive
+        self._task: Optional[asyncio.Task] = None
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    async def run_once(self) -> int:
+        cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+        started = datetime.utcnow()
+        total = 0
+        while True:
+            trimmed = await trim_history_batch(cutoff, self.batch_size, self.archive)
+            total += trimmed
+            if trimmed < self.batch_size:
+                break
+            await asyncio.sleep(0)  # let request handlers in between batches
+        self.last_run = {
+            "started_at": started.isoformat(),
+            "cutoff": cutoff.isoformat(),
+            "conversations": total,
+            "archived": self.archive,
+        }
+        if total:
+            logger.info(
+                "%s %s conversation(s) idle since before %s",
+                "Archived" if self.archive else "Deleted", total, cutoff.isoformat(),
+            )
+        return total
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Chat history retention run failed")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self) -> None:
+        if self.retention_days <= 0 or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._loop(), name="history-retention")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+history_retention = HistoryRetention(
+    retention_days=settings.history_retention_days,
+    batch_size=settings.history_retention_batch_size,
+    interval_seconds=settings.history_retention_interval_seconds,
+    archive=settings.history_archive_enabled,
+)
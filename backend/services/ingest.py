@@ -1,65 +1,209 @@
 import os
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from dataclasses import dataclass
+from collections import deque
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Deque, Dict, List, Optional
+from langchain_core.documents import Document as LCDocument
+from fastapi import UploadFile
 from services.vector_store import vector_store
+from services.answer_cache import answer_cache
 from services.models import PdfIngestion
 from services.db import get_session
+from services.metrics import LATENCY_BUCKETS, registry
+from services.pdf_parsing import ParsedShard, get_parse_pool, page_labels, parse_page_range, reset_parse_pool
+from config import settings
 import asyncio
 from starlette.concurrency import run_in_threadpool
 import logging
 
 logger = logging.getLogger(__name__)
 PDF_DIR = os.getenv("PDF_DIR", "pdfs/")
-ASYNC_TIMEOUT_SECONDS = int(os.getenv("INGEST_ADD_DOCS_TIMEOUT", "300"))
 
-async def add_embeddings_with_timeout(chunks, timeout: int = ASYNC_TIMEOUT_SECONDS) -> None:
-    """Persist chunk embeddings in Postgres with timeout protection."""
-    logger.info("Adding embeddings to Postgres vector table...")
+# Marks the end of a stage's output in the pipeline queues
+_END = object()
 
-    task: asyncio.Task[int] = asyncio.create_task(
-        asyncio.to_thread(vector_store.add_documents, chunks)
-    )
-    try:
-        inserted = await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
-        logger.info("Successfully persisted %s chunks to Postgres.", inserted)
-    except asyncio.TimeoutError:
-        logger.warning(
-            "Persisting embeddings exceeded %s seconds; allowing background completion.",
-            timeout,
-        )
-
-        def _done(fut: asyncio.Task[int]) -> None:
-            try:
-                inserted_bg = fut.result()
-                logger.info(
-                    "Background embedding persistence finished successfully (%s chunks).",
-                    inserted_bg,
-                )
-            except Exception as exc:  # noqa: BLE001 - log background failures
-                logger.exception("Background embedding persistence failed: %s", exc)
+_STAGE_HELP = "Ingestion stage latency (parse/split per page, embed/write per batch)"
+stage_seconds = {
+    stage: registry.histogram("ingest_stage_seconds", _STAGE_HELP, LATENCY_BUCKETS, {"stage": stage})
+    for stage in ("parse", "split", "embed", "write")
+}
+ingest_pdf_seconds = registry.histogram(
+    "ingest_pdf_seconds", "End-to-end ingest_pdf duration", LATENCY_BUCKETS + (600, 1800, 3600)
+)
 
-        task.add_done_callback(_done)
 
-async def ingest_pdf(file_path: str) -> int:
-    logger.info("Starting PDF ingestion.")
+@dataclass
+class IngestProgress:
+    """Counters updated by each pipeline stage as work flows through."""
+
+    pages_parsed: int = 0
+    chunks_split: int = 0
+    chunks_embedded: int = 0
+    # Chunks whose content hash was already stored, so no TEI call or new row
+    chunks_reused: int = 0
+    rows_written: int = 0
+    # New (chunk, upload, page) links; reused chunks add these without new rows
+    links_written: int = 0
+
+
+async def spool_upload(upload: UploadFile, path: str) -> int:
+    """Copy an upload to disk in fixed-size chunks instead of reading it whole."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.part"
+    written = 0
+    with open(tmp_path, "wb") as f:
+        while True:
+            chunk = await upload.read(settings.upload_chunk_bytes)
+            if not chunk:
+                break
+            await run_in_threadpool(f.write, chunk)
+            written += len(chunk)
+    os.replace(tmp_path, path)
+    return written
+
+
+def _shard_chunks(shard: ParsedShard, extra_metadata: Optional[Dict[str, Any]]) -> List[List[LCDocument]]:
+    """Worker output -> per-page chunk documents, recording the workers' stage timings."""
+    pages = []
+    for page in shard.pages:
+        stage_seconds["parse"].observe(page.parse_seconds)
+        stage_seconds["split"].observe(page.split_seconds)
+        metadata = {**page.metadata, **(extra_metadata or {})}
+        pages.append([LCDocument(page_content=text, metadata=dict(metadata)) for text in page.chunks])
+    return pages
+
+
+async def run_ingestion_pipeline(
+    file_path: str,
+    progress: Optional[IngestProgress] = None,
+    extra_metadata: Optional[Dict[str, Any]] = None,
+) -> IngestProgress:
     """
-    1) Chunk the PDF & embed/store vectors in Postgres.
-    2) Insert a new row into the Postgres ingestion metadata table via SQLModel.
+    Parse -> embed -> write as three overlapping stages joined by bounded queues.
+    Page ranges are parsed and split in worker processes (INGEST_PARSE_PROCESSES)
+    so the event loop never runs pypdf; at most two shards per process are in
+    flight and results are consumed in page order. Peak memory depends on the
+    batch size and queue depth rather than on the document size; a slow stage
+    applies backpressure to the stages before it. extra_metadata is merged
+    into every chunk.
     """
-    loader = PyPDFLoader(file_path)
-    docs = loader.load()
-    logger.info(f"Loaded {len(docs)} documents from PDF.")
+    progress = progress or IngestProgress()
+    batch_size = max(1, settings.ingest_pipeline_batch_size)
+    embed_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.ingest_pipeline_queue_depth)
+    write_queue: asyncio.Queue = asyncio.Queue(maxsize=settings.ingest_pipeline_queue_depth)
+    pages_per_shard = max(1, settings.ingest_parse_pages_per_shard)
+    max_in_flight = 2 * max(1, settings.ingest_parse_processes)
+
+    async def parse() -> None:
+        loop = asyncio.get_running_loop()
+        pool = get_parse_pool(settings.ingest_parse_processes)
+        starts: List[int] = []
+        labels: List[str] = []
+        shards: Deque[asyncio.Future] = deque()
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = splitter.split_documents(docs)
-    logger.info(f"Split into {len(chunks)} chunks.")
+        def submit_next() -> None:
+            if starts:
+                start = starts.pop()
+                shard_labels = labels[start : start + pages_per_shard]
+                shards.append(
+                    loop.run_in_executor(pool, parse_page_range, file_path, start, shard_labels, 1000, 200)
+                )
+
+        pending: List[LCDocument] = []
+        try:
+            # Chunks never span pages, so splitting page by page in any worker
+            # produces the same chunks as splitting the fully loaded document.
+            labels.extend(await loop.run_in_executor(pool, page_labels, file_path))
+            starts.extend(reversed(range(0, len(labels), pages_per_shard)))
+            for _ in range(max_in_flight):
+                submit_next()
+            while shards:
+                shard = await shards.popleft()
+                submit_next()
+                for chunks in _shard_chunks(shard, extra_metadata):
+                    progress.pages_parsed += 1
+                    progress.chunks_split += len(chunks)
+                    pending.extend(chunks)
+                while len(pending) >= batch_size:
+                    await embed_queue.put(pending[:batch_size])
+                    pending = pending[batch_size:]
+        except BrokenProcessPool:
+            reset_parse_pool()
+            raise
+        finally:
+            for fut in shards:
+                fut.cancel()
+        if pending:
+            await embed_queue.put(pending)
+        await embed_queue.put(_END)
+
+    async def embed() -> None:
+        while (chunks := await embed_queue.get()) is not _END:
+            with stage_seconds["embed"].time():
+                batch = await vector_store.aembed(chunks)
+            progress.chunks_embedded += len(batch.texts)
+            progress.chunks_reused += batch.reused
+            await write_queue.put(batch)
+        await write_queue.put(_END)
+
+    async def write() -> None:
+        while (batch := await write_queue.get()) is not _END:
+            with stage_seconds["write"].time():
+                writing = asyncio.ensure_future(asyncio.to_thread(vector_store.write_batch, batch))
+                try:
+                    inserted = await asyncio.shield(writing)
+                except asyncio.CancelledError:
+                    # The thread can't be interrupted: wait for its commit before the job is released
+                    await asyncio.wait({writing})
+                    raise
+            progress.rows_written += inserted
+            progress.links_written += batch.links_written
+            # Lost a race with a concurrent ingestion of the same chunk
+            progress.chunks_reused += len(batch.texts) - inserted
+
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(parse())
+        tg.create_task(embed())
+        tg.create_task(write())
+
+    logger.info(
+        "Ingestion pipeline finished: %s pages, %s chunks, %s rows written, %s reused.",
+        progress.pages_parsed,
+        progress.chunks_split,
+        progress.rows_written,
+        progress.chunks_reused,
+    )
+    return progress
 
-    # 1) Add embeddings to Postgres-backed vector store with timeout protection
-    await add_embeddings_with_timeout(chunks)
+
+async def ingest_pdf(
+    file_path: str,
+    progress: Optional[IngestProgress] = None,
+    extra_metadata: Optional[Dict[str, Any]] = None,
+) -> IngestProgress:
+    """
+    1) Stream the PDF through the parse/embed/write pipeline into Postgres.
+    2) Insert a new row into the Postgres ingestion metadata table via SQLModel.
+    """
+    logger.info("Starting PDF ingestion.")
+    progress = progress or IngestProgress()
+    try:
+        with ingest_pdf_seconds.time():
+            await run_ingestion_pipeline(file_path, progress, extra_metadata)
+    finally:
+        # New chunks, or new uploads of stored chunks (which filtered queries match), can change answers
+        if progress.rows_written or progress.links_written:
+            answer_cache.invalidate()
 
     # 2) Record ingestion metadata in Postgres
     filename = os.path.basename(file_path)
-    metadata = {"chunks": len(chunks), "path": file_path}
+    metadata = {
+        "chunks": progress.chunks_split,
+        "pages": progress.pages_parsed,
+        "new_chunks": progress.rows_written,
+        "reused_chunks": progress.chunks_reused,
+        "path": file_path,
+    }
 
     # Use sync DB session in a thread so we don't block the loop
     def _insert_ingestion() -> None:
@@ -70,4 +214,4 @@ async def ingest_pdf(file_path: str) -> int:
     await run_in_threadpool(_insert_ingestion)
     logger.info("Inserted ingestion record into database.")
 
-    return len(chunks)
+    return progress
@@ -0,0 +1,269 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from uuid import UUID as PyUUID, uuid4
+import asyncio
+import contextlib
+import logging
+import os
+import socket
+
+from sqlalchemy import update
+from sqlmodel import select
+from starlette.concurrency import run_in_threadpool
+
+from config import settings
+from services.db import get_session
+from services.ingest import IngestProgress, ingest_pdf
+from services.models import IngestionJob
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process as the owner of the jobs it claims
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+
+
+class JobQueueFull(Exception):
+    """Raised when the ingestion backlog is at capacity."""
+
+
+class _JobTimedOut(Exception):
+    """The job's deadline passed (distinct from timeouts raised inside the pipeline)."""
+
+
+def _error_message(exc: BaseException) -> str:
+    """Type and message of the exception that actually failed the job, unwrapping TaskGroup errors."""
+    while isinstance(exc, BaseExceptionGroup) and exc.exceptions:
+        exc = exc.exceptions[0]
+    message = str(exc)
+    return f"{type(exc).__name__}: {message}" if message else type(exc).__name__
+
+
+def _update_job(job_id: PyUUID, **fields: Any) -> None:
+    with get_session() as session:
+        job = session.get(IngestionJob, job_id)
+        if job is None:
+            return
+        for name, value in fields.items():
+            setattr(job, name, value)
+        session.add(job)
+        session.commit()
+
+
+def _progress_fields(progress: IngestProgress) -> Dict[str, int]:
+    return {
+        "pages_parsed": progress.pages_parsed,
+        "chunks_split": progress.chunks_split,
+        "chunks_embedded": progress.chunks_embedded,
+        "chunks_reused": progress.chunks_reused,
+        "rows_written": progress.rows_written,
+    }
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    with get_session() as session:
+        job = session.get(IngestionJob, PyUUID(job_id))
+        return job.model_dump(mode="json") if job is not None else None
+
+
+def _lease_until() -> datetime:
+    return datetime.utcnow() + timedelta(seconds=settings.ingest_job_lease_seconds)
+
+
+def _recover_jobs() -> List[IngestionJob]:
+    """
+    Re-queue jobs whose worker died mid-run, i.e. whose lease expired
+    (chunks already written are skipped by content hash, so resuming is
+    safe) unless they used up their attempts, and return all queued jobs to
+    re-enqueue, oldest first. Jobs another live replica is running keep
+    renewing their lease and are left alone.
+    """
+    with get_session() as session:
+        running = session.exec(
+            select(IngestionJob)
+            .where(
+                IngestionJob.status == "running",
+                (IngestionJob.lease_expires_at.is_(None)) | (IngestionJob.lease_expires_at < datetime.utcnow()),
+            )
+            .with_for_update(skip_locked=True)
+        ).all()
+        for job in running:
+            if job.attempts >= settings.ingest_max_attempts:
+                job.status = "failed"
+                job.error = f"Interrupted by a backend restart after {job.attempts} attempt(s)."
+                job.finished_at = datetime.utcnow()
+            else:
+                job.status = "queued"
+            job.owner = None
+            job.lease_expires_at = None
+            session.add(job)
+        session.commit()
+        queued = session.exec(
+            select(IngestionJob)
+            .where(IngestionJob.status == "queued")
+            .order_by(IngestionJob.created_at)
+        ).all()
+    if running:
+        logger.warning("Recovered %s interrupted ingestion job(s).", len(running))
+    return list(queued)
+
+
+class IngestionJobQueue:
+    """
+    Bounded backlog of ingestion jobs processed by a fixed pool of asyncio workers.
+    Job state and progress counters live in the ingestion_jobs table.
+    """
+
+    def __init__(self, workers: int, max_pending: int, job_timeout: float, progress_interval: float):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.job_timeout = job_timeout
+        self.progress_interval = progress_interval
+        self._queue: "asyncio.Queue[PyUUID]" = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+
+    def is_full(self) -> bool:
+        return self._queue.qsize() >= self.max_pending
+
+    async def start(self) -> None:
+        try:
+            queued = await run_in_threadpool(_recover_jobs)
+        except Exception:
+            logger.exception("Could not recover ingestion jobs; starting with an empty queue")
+            queued = []
+        for job in queued:
+            self._queue.put_nowait(job.id)
+        if queued:
+            logger.info("Re-enqueued %s queued ingestion job(s).", len(queued))
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"ingest-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, job_id: PyUUID, filename: str, path: str) -> IngestionJob:
+        if self.is_full():
+            raise JobQueueFull(f"{self._queue.qsize()} ingestion jobs already pending")
+
+        def _insert() -> IngestionJob:
+            with get_session() as session:
+                job = IngestionJob(id=job_id, filename=filename, path=path)
+                session.add(job)
+                session.commit()
+                return job
+
+        job = await run_in_threadpool(_insert)
+        self._queue.put_nowait(job.id)
+        logger.info("Queued ingestion job %s for %s", job.id, filename)
+        return job
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Ingestion worker %s crashed on job %s", index, job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: PyUUID) -> None:
+        def _claim() -> Optional[IngestionJob]:
+            # One atomic UPDATE: of several workers or replicas holding the id, only one wins
+            with get_session() as session:
+                job = session.execute(
+                    update(IngestionJob)
+                    .where(IngestionJob.id == job_id, IngestionJob.status == "queued")
+                    .values(
+                        status="running",
+                        attempts=IngestionJob.attempts + 1,
+                        started_at=datetime.utcnow(),
+                        owner=WORKER_ID,
+                        lease_expires_at=_lease_until(),
+                    )
+                    .returning(IngestionJob)
+                ).scalars().first()
+                session.commit()
+                return job
+
+        job = await run_in_threadpool(_claim)
+        if job is None:
+            return
+
+        progress = IngestProgress()
+        task = asyncio.create_task(
+            ingest_pdf(job.path, progress, {"ingestion_id": str(job.id), "filename": job.filename})
+        )
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.job_timeout
+        try:
+            while not task.done():
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    task.cancel()
+                    # Let the pipeline unwind (in-flight writes finish) so a retry never overlaps it
+                    with contextlib.suppress(asyncio.CancelledError):
+                        await task
+                    raise _JobTimedOut
+                await asyncio.wait({task}, timeout=min(self.progress_interval, remaining))
+                # Progress flush doubles as the lease heartbeat
+                await run_in_threadpool(
+                    _update_job, job_id, lease_expires_at=_lease_until(), **_progress_fields(progress)
+                )
+            task.result()
+        except asyncio.CancelledError:
+            # Shutdown: hand the job back to _recover_jobs on the next start (chunks
+            # already written are skipped by hash), unless it has no attempts left
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+            if job.attempts >= settings.ingest_max_attempts:
+                await run_in_threadpool(
+                    _update_job, job_id, status="failed",
+                    error=f"Interrupted by shutdown after {job.attempts} attempt(s).",
+                    finished_at=datetime.utcnow(), **_progress_fields(progress),
+                )
+            else:
+                await run_in_threadpool(
+                    _update_job, job_id, status="queued", started_at=None, owner=None,
+                    lease_expires_at=None, **_progress_fields(progress),
+                )
+            raise
+        except _JobTimedOut:
+            logger.error("Ingestion job %s exceeded %ss", job_id, self.job_timeout)
+            await run_in_threadpool(
+                _update_job, job_id, status="failed",
+                error=f"Timed out after {self.job_timeout:.0f}s",
+                finished_at=datetime.utcnow(), **_progress_fields(progress),
+            )
+            return
+        except Exception as exc:
+            logger.exception("Ingestion job %s failed", job_id)
+            await run_in_threadpool(
+                _update_job, job_id, status="failed", error=_error_message(exc)[:2000],
+                finished_at=datetime.utcnow(), **_progress_fields(progress),
+            )
+            return
+
+        await run_in_threadpool(
+            _update_job, job_id, status="succeeded",
+            finished_at=datetime.utcnow(), **_progress_fields(progress),
+        )
+        logger.info(
+            "Ingestion job %s finished (%s new rows, %s reused chunks).",
+            job_id, progress.rows_written, progress.chunks_reused,
+        )
+
+
+ingestion_jobs = IngestionJobQueue(
+    workers=settings.ingest_workers,
+    max_pending=settings.ingest_max_pending_jobs,
+    job_timeout=settings.ingest_job_timeout_seconds,
+    progress_interval=settings.ingest_progress_interval_seconds,
+)
@@ -0,0 +1,155 @@
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import asyncio
+import hashlib
+import logging
+import math
+import time
+
+import httpx
+from openai import AsyncOpenAI
+
+from config import settings
+from services.metrics import LATENCY_BUCKETS, RATE_BUCKETS, TOKEN_BUCKETS, registry
+
+logger = logging.getLogger(__name__)
+
+ttft_seconds = registry.histogram(
+    "llm_time_to_first_token_seconds", "Time from the streaming request to the first content token", LATENCY_BUCKETS
+)
+tokens_per_second = registry.histogram(
+    "llm_tokens_per_second", "Generation speed after the first token (completion tokens / second)", RATE_BUCKETS
+)
+completion_seconds = registry.histogram(
+    "llm_completion_seconds", "Non-streaming chat completion latency", LATENCY_BUCKETS
+)
+prompt_tokens = registry.histogram("llm_prompt_tokens", "Prompt size sent to the LLM", TOKEN_BUCKETS)
+prompt_cached_tokens = registry.histogram(
+    "llm_prompt_cached_tokens", "Prompt tokens served from llama.cpp's KV cache (prefill skipped)", TOKEN_BUCKETS
+)
+prompt_processed_tokens = registry.histogram(
+    "llm_prompt_processed_tokens", "Prompt tokens llama.cpp had to prefill", TOKEN_BUCKETS
+)
+
+
+def request_hints(conversation_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    llama.cpp extensions for chat requests (sent as extra_body). cache_prompt
+    keeps the prompt's KV cache in the slot; with slot affinity, every turn
+    of a conversation goes to the same slot so its shared prefix is reused.
+    """
+    hints: Dict[str, Any] = {"cache_prompt": True}
+    if conversation_id and settings.llm_slot_affinity and settings.llm_max_concurrency > 1:
+        digest = hashlib.blake2b(conversation_id.encode(), digest_size=8).digest()
+        hints["id_slot"] = int.from_bytes(digest, "little") % settings.llm_max_concurrency
+    return hints
+
+
+def observe_prompt_cache(payload: Any, conversation_id: Optional[str] = None) -> Optional[int]:
+    """
+    Record how much of the prompt llama.cpp reused from its cache, from the
+    `timings` it adds to responses (the last chunk when streaming). Returns
+    the cached token count, or None if the server sent no timings.
+    """
+    timings = getattr(payload, "timings", None)
+    if not isinstance(timings, dict) or "prompt_n" not in timings:
+        return None
+    processed = int(timings["prompt_n"])
+    cached = timings.get("cache_n")
+    if cached is None:
+        usage = getattr(payload, "usage", None)
+        total = getattr(usage, "prompt_tokens", None) if usage is not None else None
+        if total is None:
+            return None
+        cached = max(0, int(total) - processed)
+    cached = int(cached)
+    prompt_processed_tokens.observe(processed)
+    prompt_cached_tokens.observe(cached)
+    logger.info(
+        "Prefill: %s prompt tokens processed, %s reused from cache (conversation %s)",
+        processed, cached, conversation_id or "-",
+    )
+    return cached
+
+
+def observe_completion(resp, seconds: float) -> None:
+    """Record a finished non-streaming completion; tokens/sec needs usage from the server."""
+    completion_seconds.observe(seconds)
+    usage = getattr(resp, "usage", None)
+    completion_tokens = getattr(usage, "completion_tokens", None) if usage is not None else None
+    if completion_tokens and seconds > 0:
+        tokens_per_second.observe(completion_tokens / seconds)
+
+# Use generous timeouts for local LLM calls to avoid premature cancellation
+llm_client = AsyncOpenAI(
+    base_url=settings.local_llm_base_url,
+    api_key="dummy-key",
+    timeout=httpx.Timeout(300.0, connect=10.0, read=300.0, write=60.0, pool=300.0),
+)
+
+# Rough chars-per-token ratio used only while /tokenize is unreachable
+_FALLBACK_CHARS_PER_TOKEN = 3.5
+_RETRY_AFTER_FAILURE_SECONDS = 60.0
+
+
+class LLMTokenizer:
+    """
+    Counts tokens with the served model's own tokenizer via the llama.cpp
+    server's POST /tokenize endpoint. Counts are cached per text (history
+    turns and popular chunks recur across requests). If the endpoint fails,
+    a character-based estimate is used for a minute before retrying.
+    """
+
+    def __init__(self, base_url: str, cache_size: int = 4096, timeout: float = 5.0):
+        root = base_url.rstrip("/")
+        if root.endswith("/v1"):
+            root = root[: -len("/v1")]
+        self.url = f"{root}/tokenize"
+        self.cache_size = max(0, cache_size)
+        self.timeout = timeout
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._retry_at = 0.0
+
+    @staticmethod
+    def estimate(text: str) -> int:
+        return math.ceil(len(text) / _FALLBACK_CHARS_PER_TOKEN)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        return self._client
+
+    async def count(self, text: str) -> int:
+        if not text:
+            return 0
+        cached = self._cache.get(text)
+        if cached is not None:
+            self._cache.move_to_end(text)
+            return cached
+        if time.monotonic() < self._retry_at:
+            return self.estimate(text)
+        try:
+            resp = await self._get_client().post(self.url, json={"content": text})
+            resp.raise_for_status()
+            n = len(resp.json()["tokens"])
+        except (httpx.HTTPError, KeyError, ValueError) as exc:
+            logger.warning("Tokenizer endpoint %s failed (%s); estimating token counts", self.url, exc)
+            self._retry_at = time.monotonic() + _RETRY_AFTER_FAILURE_SECONDS
+            return self.estimate(text)
+        if self.cache_size:
+            self._cache[text] = n
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return n
+
+    async def count_many(self, texts: List[str]) -> List[int]:
+        return list(await asyncio.gather(*(self.count(t) for t in texts)))
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+tokenizer = LLMTokenizer(settings.local_llm_base_url)
@@ -0,0 +1,295 @@
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import math
+import time
+
+from config import settings
+from services.llm import llm_client, observe_completion, observe_prompt_cache, request_hints
+from services.metrics import COUNT_BUCKETS, LATENCY_BUCKETS, registry
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first
+PRIORITY_INTERACTIVE = 0  # /v1/query-stream
+PRIORITY_DEFAULT = 1  # /v1/query
+PRIORITY_BATCH = 2  # history summaries and other background work
+_PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_DEFAULT: "default", PRIORITY_BATCH: "batch"}
+
+queue_wait_seconds = {
+    p: registry.histogram(
+        "llm_queue_wait_seconds", "Time a request waited for an LLM slot", LATENCY_BUCKETS, {"priority": name}
+    )
+    for p, name in _PRIORITY_NAMES.items()
+}
+queue_depth = registry.histogram(
+    "llm_queue_depth", "Requests waiting for an LLM slot, observed whenever one is queued", COUNT_BUCKETS
+)
+
+
+class LLMOverloaded(Exception):
+    """No LLM slot: the wait queue is full (429) or the wait timed out (503)."""
+
+    def __init__(self, detail: str, status_code: int, retry_after: int):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class GenerationCancelled(Exception):
+    """A shared generation was cancelled before it finished; followers must not treat it as complete."""
+
+
+class _SharedCompletion:
+    """One in-flight non-streaming completion awaited by every identical caller."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _SharedStream:
+    """
+    One in-flight generation fanned out to every identical caller. Tokens are
+    kept so a caller that joins late replays them before following live.
+    """
+
+    def __init__(self) -> None:
+        self.parts: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Condition()
+
+    async def publish(self, part: Optional[str] = None, error: Optional[BaseException] = None) -> None:
+        async with self._changed:
+            if part is not None:
+                self.parts.append(part)
+            else:
+                self.done = True
+                self.error = error
+            self._changed.notify_all()
+
+    async def follow(self) -> AsyncIterator[str]:
+        sent = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self.done or len(self.parts) > sent)
+                new = self.parts[sent:]
+                finished, error = self.done, self.error
+            for part in new:
+                yield part
+            sent += len(new)
+            if finished and sent >= len(self.parts):
+                if error is not None:
+                    raise error
+                return
+
+
+class LLMScheduler:
+    """
+    Admission control in front of the llama.cpp server. At most
+    max_concurrency requests hold a slot (match the server's parallel slot
+    count); up to max_queue more wait in priority order, each for at most
+    queue_timeout seconds. Identical requests already in flight share one
+    generation instead of occupying another slot.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._completions: Dict[str, _SharedCompletion] = {}
+        self._streams: Dict[str, _SharedStream] = {}
+        # Smoothed slot hold time, used for Retry-After
+        self._hold_seconds = 10.0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.coalesced = 0
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free for a new request."""
+        rounds = (self.queued + 1) / self.max_concurrency
+        return max(1, math.ceil(rounds * self._hold_seconds))
+
+    def check_admission(self) -> None:
+        """Fail fast, before retrieval, when a new request could not even be queued."""
+        if self._active >= self.max_concurrency and self.queued >= self.max_queue:
+            self.rejected += 1
+            raise LLMOverloaded("LLM queue is full", 429, self.retry_after())
+
+    async def _acquire(self, priority: int) -> None:
+        started = time.perf_counter()
+        if self._active < self.max_concurrency and not self.queued:
+            self._active += 1
+            queue_wait_seconds[priority].observe(0.0)
+            return
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise LLMOverloaded("LLM queue is full", 429, self.retry_after())
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        queue_depth.observe(self.queued)
+        try:
+            # A released slot is handed over directly by resolving fut
+            await asyncio.wait_for(fut, self.queue_timeout)
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                # A slot was handed over in the same loop iteration the timeout fired: keep it
+                queue_wait_seconds[priority].observe(time.perf_counter() - started)
+                return
+            self.timed_out += 1
+            raise LLMOverloaded("Timed out waiting for an LLM slot", 503, self.retry_after())
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self._release()
+            raise
+        queue_wait_seconds[priority].observe(time.perf_counter() - started)
+
+    def _release(self) -> None:
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_DEFAULT):
+        await self._acquire(priority)
+        self.admitted += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * (time.perf_counter() - started)
+            self._release()
+
+    @staticmethod
+    def request_key(messages: List[Dict[str, str]], max_tokens: int) -> str:
+        raw = json.dumps([settings.local_llm_model, max_tokens, messages], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def _run_completion(
+        self, messages: List[Dict[str, str]], max_tokens: int, priority: int, conversation_id: Optional[str]
+    ):
+        async with self.slot(priority):
+            started = time.perf_counter()
+            resp = await llm_client.chat.completions.create(
+                model=settings.local_llm_model,
+                messages=messages,
+                max_tokens=max_tokens,
+                stream=False,
+                extra_body=request_hints(conversation_id),
+            )
+            observe_completion(resp, time.perf_counter() - started)
+            observe_prompt_cache(resp, conversation_id)
+            return resp
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        priority: int = PRIORITY_DEFAULT,
+        conversation_id: Optional[str] = None,
+    ) -> Any:
+        """
+        Non-streaming chat completion through a slot; identical concurrent
+        calls share one. conversation_id pins the request to that
+        conversation's llama.cpp slot.
+        """
+        key = self.request_key(messages, max_tokens)
+        shared = self._completions.get(key)
+        if shared is None:
+            shared = self._completions[key] = _SharedCompletion(
+                asyncio.create_task(self._run_completion(messages, max_tokens, priority, conversation_id))
+            )
+            shared.task.add_done_callback(lambda _: self._completions.pop(key, None))
+        else:
+            self.coalesced += 1
+        shared.waiters += 1
+        try:
+            return await asyncio.shield(shared.task)
+        finally:
+            shared.waiters -= 1
+            # Nobody is left to read the answer: stop the generation
+            if shared.waiters == 0 and not shared.task.done():
+                shared.task.cancel()
+
+    async def stream(
+        self,
+        key: str,
+        generate: Callable[[], AsyncIterator[str]],
+        priority: int = PRIORITY_INTERACTIVE,
+    ) -> AsyncIterator[str]:
+        """
+        Run generate() inside a slot and yield its parts. Callers passing the
+        same key while it runs follow the same generation.
+        """
+        shared = self._streams.get(key)
+        if shared is None:
+            shared = self._streams[key] = _SharedStream()
+
+            async def _produce() -> None:
+                try:
+                    async with self.slot(priority):
+                        async for part in generate():
+                            await shared.publish(part)
+                except BaseException as exc:  # noqa: BLE001 - handed to every subscriber
+                    if isinstance(exc, asyncio.CancelledError):
+                        # A cut-off answer is not a complete one
+                        await shared.publish(error=GenerationCancelled("LLM generation was cancelled"))
+                        raise
+                    await shared.publish(error=exc)
+                else:
+                    await shared.publish()
+                finally:
+                    self._streams.pop(key, None)
+
+            shared.task = asyncio.create_task(_produce())
+        else:
+            self.coalesced += 1
+        shared.subscribers += 1
+        try:
+            async for part in shared.follow():
+                yield part
+        finally:
+            shared.subscribers -= 1
+            if shared.subscribers == 0 and shared.task is not None and not shared.task.done():
+                shared.task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self._active,
+            "queued": self.queued,
+            "in_flight_shared": len(self._completions) + len(self._streams),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "coalesced": self.coalesced,
+            "retry_after_seconds": self.retry_after(),
+        }
+
+
+llm_scheduler = LLMScheduler(
+    max_concurrency=settings.llm_max_concurrency,
+    max_queue=settings.llm_max_queue,
+    queue_timeout=settings.llm_queue_timeout_seconds,
+)
@@ -0,0 +1,126 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import bisect
+import threading
+import time
+
+# Seconds; spans sub-millisecond cache-warm SQL up to the LLM's 300s timeout
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+RATE_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 200)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: "Histogram"):
+        self.histogram = histogram
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram (Prometheus semantics) with a lock-protected
+    observe(); cheap enough to leave on in hot paths.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        buckets: Sequence[float],
+        labels: Optional[Dict[str, str]] = None,
+    ):
+        self.name = name
+        self.help = help
+        self.labels = dict(labels or {})
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[idx] += 1
+            self._sum += value
+            self._count += 1
+
+    def time(self) -> _Timer:
+        """Context manager observing the elapsed seconds."""
+        return _Timer(self)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative: Dict[str, int] = {}
+        running = 0
+        for bound, n in zip(list(self.buckets) + [float("inf")], counts):
+            running += n
+            cumulative["+Inf" if bound == float("inf") else repr(bound)] = running
+        return {"help": self.help, "buckets": cumulative, "sum": total, "count": count}
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(labels: Dict[str, str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels.items()) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        buckets: Sequence[float],
+        labels: Optional[Dict[str, str]] = None,
+    ) -> Histogram:
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = self._metrics[key] = Histogram(name, help, buckets, labels)
+            return metric
+
+    def _series(self) -> List[Histogram]:
+        with self._lock:
+            return sorted(self._metrics.values(), key=lambda m: (m.name, sorted(m.labels.items())))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {f"{m.name}{_label_str(m.labels)}": m.snapshot() for m in self._series()}
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines: List[str] = []
+        current = None
+        for m in self._series():
+            if m.name != current:
+                current = m.name
+                lines.append(f"# HELP {m.name} {m.help}")
+                lines.append(f"# TYPE {m.name} histogram")
+            snap = m.snapshot()
+            for le, n in snap["buckets"].items():
+                lines.append(f"{m.name}_bucket{_label_str(m.labels, ('le', le))} {n}")
+            lines.append(f"{m.name}_sum{_label_str(m.labels)} {snap['sum']}")
+            lines.append(f"{m.name}_count{_label_str(m.labels)} {snap['count']}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
@@ -2,9 +2,9 @@ from datetime import datetime
 from typing import Any, Dict, List, Optional
 from uuid import UUID as PyUUID, uuid4
 from sqlmodel import SQLModel, Field
-from sqlalchemy.dialects.postgresql import UUID as PGUUID, JSONB
-from sqlalchemy import JSON, Column
-from pgvector.sqlalchemy import Vector
+from sqlalchemy.dialects.postgresql import UUID as PGUUID, JSONB, TSVECTOR
+from sqlalchemy import JSON, BigInteger, Column, Computed, ForeignKey, Identity, Integer, Text
+from pgvector.sqlalchemy import HALFVEC, Vector
 from config import settings
 
 class PdfIngestion(SQLModel, table=True):
@@ -45,12 +45,48 @@ class Document(SQLModel, table=True):
     # If your embedding column is PGVECTOR, SQLModel won’t know it natively,
     # so you can read it as an ARRAY of floats (or JSONB) if that’s how it’s stored.
     embedding: Optional[List[float]] = Field(
-        sa_column=Column("embedding", Vector(settings.pgvector_dim), nullable=True)
+        sa_column=Column(
+            "embedding",
+            # VECTOR_STORAGE=halfvec stores float16 (migration 20261017_08)
+            HALFVEC(settings.pgvector_dim)
+            if (settings.vector_storage or "vector").lower() == "halfvec"
+            else Vector(settings.pgvector_dim),
+            nullable=True,
+        )
     )
     meta: Dict[str, Any] = Field(
         default_factory=dict,
         sa_column=Column("metadata", JSONB, nullable=False),
     )
+    # sha256(content) + embedding model; unique together so identical chunks are stored once
+    content_hash: Optional[str] = Field(default=None, sa_column=Column("content_hash", Text, nullable=False))
+    embedding_model: Optional[str] = Field(default=None, sa_column=Column("embedding_model", Text, nullable=False))
+    # Generated by Postgres for lexical/hybrid retrieval; never written by the app
+    content_tsv: Optional[str] = Field(
+        default=None,
+        sa_column=Column(
+            "content_tsv",
+            TSVECTOR,
+            Computed(f"to_tsvector('{settings.text_search_config}'::regconfig, content)", persisted=True),
+        ),
+    )
+
+class DocumentIngestion(SQLModel, table=True):
+    """
+    Where a stored chunk occurs: one row per (upload, page). A chunk is
+    stored once per content hash, so a re-upload or revised file adds rows
+    here for the chunks it shares with earlier uploads.
+    """
+    __tablename__ = "document_ingestions"
+
+    id: Optional[int] = Field(default=None, sa_column=Column(BigInteger, Identity(), primary_key=True))
+    document_id: PyUUID = Field(
+        sa_column=Column(PGUUID(as_uuid=True), ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    )
+    ingestion_id: Optional[str] = Field(default=None, sa_column=Column(Text, nullable=True))
+    source: Optional[str] = Field(default=None, sa_column=Column(Text, nullable=True))
+    filename: Optional[str] = Field(default=None, sa_column=Column(Text, nullable=True))
+    page: Optional[int] = Field(default=None, sa_column=Column(Integer, nullable=True))
 
 class ChatHistory(SQLModel, table=True):
     """
@@ -64,3 +100,63 @@ class ChatHistory(SQLModel, table=True):
     question: str
     answer: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ChatHistoryArchive(SQLModel, table=True):
+    """
+    chat_history rows of conversations removed by the retention job,
+    keeping their original ids.
+    """
+    __tablename__ = "chat_history_archive"
+
+    id: int = Field(sa_column=Column(Integer, primary_key=True, autoincrement=False))
+    conversation_id: PyUUID
+    question: str
+    answer: str
+    created_at: datetime
+    archived_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ConversationSummary(SQLModel, table=True):
+    """
+    Rolling summary of the turns that fell out of a conversation's prompt window.
+    turns_summarized counts the oldest chat_history rows already folded in.
+    """
+    __tablename__ = "conversation_summaries"
+
+    conversation_id: PyUUID = Field(
+        sa_column=Column(PGUUID(as_uuid=True), primary_key=True, nullable=False)
+    )
+    summary: str
+    turns_summarized: int = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class IngestionJob(SQLModel, table=True):
+    """
+    A queued or running PDF ingestion, with per-stage progress counters.
+    Persisted so a restart can resume queued jobs and fail interrupted ones.
+    """
+    __tablename__ = "ingestion_jobs"
+
+    id: PyUUID = Field(
+        default_factory=uuid4,
+        sa_column=Column(PGUUID(as_uuid=True), primary_key=True, nullable=False),
+    )
+    filename: str
+    path: str
+    # queued | running | succeeded | failed
+    status: str = Field(default="queued", index=True)
+    attempts: int = 0
+    pages_parsed: int = 0
+    chunks_split: int = 0
+    chunks_embedded: int = 0
+    chunks_reused: int = 0
+    rows_written: int = 0
+    error: Optional[str] = None
+    # Process running the job and until when its claim holds; renewed with every progress flush
+    owner: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
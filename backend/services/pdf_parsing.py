@@ -0,0 +1,117 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+import logging
+import multiprocessing
+import threading
+import time
+
+from pypdf import PdfReader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+logger = logging.getLogger(__name__)
+
+# Imported by worker processes: keep this module free of app state (config, DB, clients)
+
+
+@dataclass
+class ParsedPage:
+    """One page's split chunks and the metadata every chunk of it carries."""
+
+    page: int
+    metadata: Dict[str, Any]
+    chunks: List[str]
+    parse_seconds: float
+    split_seconds: float
+
+
+@dataclass
+class ParsedShard:
+    start: int
+    pages: List[ParsedPage] = field(default_factory=list)
+
+
+_splitters: Dict[tuple, RecursiveCharacterTextSplitter] = {}
+
+
+def _splitter(chunk_size: int, chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    key = (chunk_size, chunk_overlap)
+    if key not in _splitters:
+        _splitters[key] = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return _splitters[key]
+
+
+def page_labels(file_path: str) -> List[str]:
+    """
+    Printed label of every page (its length is the page count). Computing
+    labels walks the whole document, so it is done once per PDF and each
+    shard gets its slice.
+    """
+    return list(PdfReader(file_path).page_labels)
+
+
+def parse_page_range(
+    file_path: str, start: int, labels: List[str], chunk_size: int, chunk_overlap: int
+) -> ParsedShard:
+    """
+    Extract and split pages [start, start + len(labels)) of a PDF. Runs in a
+    worker process; only plain text and metadata cross back, not pypdf or
+    langchain objects. Metadata matches what PyPDFLoader stored (0-based
+    page, page label).
+    """
+    reader = PdfReader(file_path)
+    total = len(reader.pages)
+    splitter = _splitter(chunk_size, chunk_overlap)
+    shard = ParsedShard(start=start)
+    for i in range(start, min(start + len(labels), total)):
+        started = time.perf_counter()
+        text = reader.pages[i].extract_text()
+        parsed = time.perf_counter()
+        chunks = splitter.split_text(text)
+        shard.pages.append(
+            ParsedPage(
+                page=i,
+                metadata={"source": file_path, "total_pages": total, "page": i, "page_label": labels[i - start]},
+                chunks=chunks,
+                parse_seconds=parsed - started,
+                split_seconds=time.perf_counter() - parsed,
+            )
+        )
+    return shard
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_parse_pool(processes: int) -> Optional[ProcessPoolExecutor]:
+    """
+    Shared process pool for PDF parsing, created on first use. None when
+    processes <= 0: callers then parse in the default thread executor.
+    """
+    global _pool
+    if processes <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the app process has running threads and an event loop
+            _pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+            logger.info("Started PDF parse pool with %s processes.", processes)
+        return _pool
+
+
+def reset_parse_pool() -> None:
+    """Drop a broken pool (e.g. a worker was OOM-killed); the next call starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_parse_pool() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,169 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+import logging
+
+from config import settings
+from services.llm import prompt_tokens, tokenizer
+from services.llm_scheduler import PRIORITY_BATCH, llm_scheduler
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = "You are a helpful assistant."
+DOC_SEPARATOR = "\n\n---\n\n"
+
+
+@dataclass
+class BuiltPrompt:
+    # Chat messages: stable prefix (system + summary, history turns) then the volatile
+    # user message (retrieved context + question), so llama.cpp can reuse the prefix's KV cache
+    messages: List[Dict[str, str]]
+    tokens: int
+    budget: int
+    docs_used: int
+    turns_used: int
+    breakdown: Dict[str, int] = field(default_factory=dict)
+
+
+def prompt_budget() -> int:
+    """Tokens available for the prompt once the answer reservation is taken out."""
+    return max(0, settings.llm_context_tokens - settings.llm_max_answer_tokens)
+
+
+def _render_turn(turn: Dict[str, str]) -> str:
+    return f"User: {turn['question']}\nAssistant: {turn['answer']}\n"
+
+
+def _render(
+    question: str,
+    docs: Sequence[str],
+    turns: Optional[Sequence[Dict[str, str]]],
+    summary: Optional[str],
+) -> List[Dict[str, str]]:
+    system = SYSTEM_PROMPT
+    if summary:
+        system += f"\n\nSummary of earlier conversation:\n{summary}"
+    messages = [{"role": "system", "content": system}]
+    for turn in turns or ():
+        messages.append({"role": "user", "content": turn["question"]})
+        messages.append({"role": "assistant", "content": turn["answer"]})
+    messages.append(
+        {"role": "user", "content": f"Context from documents:\n{DOC_SEPARATOR.join(docs)}\n\nQuestion: {question}"}
+    )
+    return messages
+
+
+def _joined(messages: List[Dict[str, str]]) -> str:
+    return "\n\n".join(m["content"] for m in messages)
+
+
+async def build_prompt(
+    question: str,
+    docs: List[Dict[str, Any]],
+    history: Optional[List[Dict[str, str]]] = None,
+    summary: Optional[str] = None,
+) -> BuiltPrompt:
+    """
+    Fit system text, question, conversation summary, unsummarized turns and
+    retrieved chunks into prompt_budget(). The scaffold, question and summary
+    always go in; then the newest turns (the history holds fewer than
+    2 * HISTORY_WINDOW_TURNS, capped at HISTORY_MAX_TOKENS); the remaining
+    budget takes chunks in rank order, skipping any that no longer fit.
+    Pass history=None for single-shot questions without conversation turns.
+    """
+    budget = prompt_budget()
+    max_turns = 2 * settings.history_window_turns
+    window = list(history or [])[-max_turns:] if max_turns > 0 else []
+    turn_texts = [_render_turn(t) for t in window]
+    doc_texts = [d["content"] for d in docs]
+
+    counts = await tokenizer.count_many([_joined(_render(question, [], None, summary))] + turn_texts + doc_texts)
+    fixed, turn_counts, doc_counts = counts[0], counts[1 : 1 + len(turn_texts)], counts[1 + len(turn_texts):]
+    remaining = budget - fixed
+    if remaining < 0:
+        logger.warning("Prompt scaffold alone (%s tokens) exceeds the budget of %s", fixed, budget)
+
+    # Newest turns first, then restore chronological order. Dropping old turns here
+    # changes the cached prefix, so keep HISTORY_MAX_TOKENS generous
+    kept_turns: List[Dict[str, str]] = []
+    history_tokens = 0
+    history_cap = min(settings.history_max_tokens, max(remaining, 0))
+    for turn, n in zip(reversed(window), reversed(turn_counts)):
+        if history_tokens + n > history_cap:
+            break
+        kept_turns.insert(0, turn)
+        history_tokens += n
+    remaining -= history_tokens
+
+    kept_docs: List[str] = []
+    context_tokens = 0
+    sep_tokens = await tokenizer.count(DOC_SEPARATOR) if doc_texts else 0
+    for text, n in zip(doc_texts, doc_counts):
+        cost = n + (sep_tokens if kept_docs else 0)
+        if context_tokens + cost > remaining:
+            continue
+        kept_docs.append(text)
+        context_tokens += cost
+
+    messages = _render(question, kept_docs, kept_turns, summary)
+    total = await tokenizer.count(_joined(messages))
+    prompt_tokens.observe(total)
+    built = BuiltPrompt(
+        messages=messages,
+        tokens=total,
+        budget=budget,
+        docs_used=len(kept_docs),
+        turns_used=len(kept_turns),
+        breakdown={"fixed": fixed, "history": history_tokens, "context": context_tokens},
+    )
+    logger.info(
+        "Prompt tokens=%s budget=%s (fixed=%s history=%s/%s turns context=%s/%s docs)",
+        total, budget, fixed, history_tokens, len(kept_turns), context_tokens, len(kept_docs),
+    )
+    if len(kept_docs) < len(doc_texts) or len(kept_turns) < len(turn_texts):
+        logger.info(
+            "Prompt budget dropped %s doc(s) and %s turn(s)",
+            len(doc_texts) - len(kept_docs), len(turn_texts) - len(kept_turns),
+        )
+    return built
+
+
+_SUMMARY_INSTRUCTIONS = (
+    "Update the running summary of a conversation between a user and an assistant. "
+    "Keep the facts, names, commands and decisions a follow-up question may refer to. "
+    "Reply with the updated summary only."
+)
+
+
+async def summarize_turns(previous: Optional[str], turns: List[Dict[str, str]]) -> str:
+    """
+    Fold turns into the rolling summary. Turns are sent in groups that fit the
+    prompt budget; a single turn larger than the budget is truncated.
+    """
+    summary = previous or ""
+    budget = prompt_budget()
+    pending = list(turns)
+    while pending:
+        scaffold = f"{_SUMMARY_INSTRUCTIONS}\n\nCurrent summary:\n{summary or '(empty)'}\n\nNew turns:\n"
+        room = budget - await tokenizer.count(scaffold) - 16
+        group: List[str] = []
+        used = 0
+        while pending:
+            text = _render_turn(pending[0])
+            n = await tokenizer.count(text)
+            if group and used + n > room:
+                break
+            if n > room:
+                # Keep the start of an oversized turn rather than dropping it
+                text = text[: max(0, int(len(text) * room / n))]
+                n = room
+            group.append(text)
+            used += n
+            pending.pop(0)
+        # Background work: yields LLM slots to interactive requests
+        resp = await llm_scheduler.complete(
+            [{"role": "user", "content": f"{scaffold}{''.join(group)}\nUpdated summary:"}],
+            settings.history_summary_max_tokens,
+            PRIORITY_BATCH,
+        )
+        summary = (resp.choices[0].message.content or "").strip() or summary
+    return summary
@@ -1,206 +1,356 @@
 
-from typing import List, Tuple, Dict, Any, AsyncGenerator
-from fastapi import HTTPException
-from openai import AsyncOpenAI
+from typing import List, Optional, Tuple, Dict, Any, AsyncGenerator
 import httpx
-from sqlalchemy import text
-from services.db import get_session
+from openai import APIConnectionError
+from services.answer_cache import answer_cache
+from services.embedding_batcher import QueryEmbeddingBatcher
+from services.embedding_cache import QueryEmbeddingCache
+from services.llm import (
+    llm_client,
+    observe_completion,
+    observe_prompt_cache,
+    request_hints,
+    tokens_per_second,
+    ttft_seconds,
+)
+from services.llm_scheduler import (
+    PRIORITY_BATCH,
+    PRIORITY_DEFAULT,
+    PRIORITY_INTERACTIVE,
+    LLMOverloaded,
+    llm_scheduler,
+)
+from services.metrics import LATENCY_BUCKETS, registry
+from services.prompting import build_prompt
+from services.retrieval import RetrievalFilters, RetrievalResult, retrieve, retrieve_many
 from services.tei_embeddings import TEIEmbeddings
 from config import settings
-import logging
 import asyncio
-from starlette.concurrency import run_in_threadpool
+import logging
+import time
+import numpy as np
 
 
 logger = logging.getLogger(__name__)
 
 # Use the same embeddings provider as ingestion (TEI) to match vector dimensions
-embedding_model = TEIEmbeddings(base_url=settings.tei_base_url)
+embedding_model = TEIEmbeddings(
+    base_url=settings.tei_base_url,
+    batch_size=settings.tei_batch_size,
+    max_batch_chars=settings.tei_max_batch_chars,
+    max_concurrency=settings.tei_max_concurrency,
+)
 
-# Use generous timeouts for local LLM calls to avoid premature cancellation
-llm_client = AsyncOpenAI(
-    base_url=settings.local_llm_base_url,
-    api_key="dummy-key",
-    timeout=httpx.Timeout(300.0, connect=10.0, read=300.0, write=60.0, pool=300.0),
+# Concurrent cache misses are coalesced into batched /embed requests
+query_embedder = QueryEmbeddingBatcher(
+    embedding_model,
+    max_batch_size=settings.query_embed_batch_max_size,
+    max_wait_ms=settings.query_embed_batch_max_wait_ms,
 )
 
-def to_pgvector_literal(vec: list[float]) -> str:
-    return f"[{','.join(f'{x:.6f}' for x in vec)}]"
-
-async def retrieve_top_docs(question: str, k: int = 5) -> List[Dict[str,Any]]:
-    # Offload sync embedding to a thread
-    q_vec = await run_in_threadpool(embedding_model.embed_query, question)
-    ql = to_pgvector_literal(q_vec)
-    sql = text(
-        """
-        SELECT id, content, metadata, 1 - (embedding <=> :q) AS similarity
-        FROM documents
-        ORDER BY embedding <=> :q
-        LIMIT :k
-        """
-    )
+# Users repeat the same questions; keep their embeddings in-process
+query_embedding_cache = QueryEmbeddingCache(
+    maxsize=settings.query_embedding_cache_size,
+    ttl_seconds=settings.query_embedding_cache_ttl_seconds,
+)
 
-    def _run_query():
-        with get_session() as session:
-            res = session.execute(sql, {"q": ql, "k": k})
-            return res.fetchall()
+query_embed_seconds = registry.histogram(
+    "rag_query_embed_seconds", "Question embedding latency on cache misses (batching wait + TEI)", LATENCY_BUCKETS
+)
 
-    try:
-        rows = await asyncio.wait_for(run_in_threadpool(_run_query), timeout=10.0)
-    except asyncio.TimeoutError:
-        raise HTTPException(504, "DB query timed out")
+stream_duration_seconds = registry.histogram(
+    "rag_stream_duration_seconds", "Total /v1/query-stream response duration, retrieval through last token", LATENCY_BUCKETS
+)
+
+def _source(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Client-facing view of a retrieved chunk (no content)."""
+    return {
+        "id": doc["id"],
+        "similarity": doc["similarity"],
+        "rerank_score": doc.get("rerank_score"),
+        "metadata": doc["metadata"],
+    }
 
-    return [
-        {"content": r.content, "metadata": r.metadata, "similarity": float(r.similarity)}
-        for r in rows
+async def embed_question(question: str) -> np.ndarray:
+    """Embed a user question, served from the LRU/TTL cache when possible."""
+    cached = query_embedding_cache.get(settings.embedding_model, question)
+    if cached is not None:
+        return cached
+    with query_embed_seconds.time():
+        vector = await query_embedder.embed(question)
+    return query_embedding_cache.put(settings.embedding_model, question, vector)
+
+async def embed_questions(questions: List[str]) -> List[np.ndarray]:
+    """Embed a batch of questions: cache hits are reused, the misses go to TEI in one batch."""
+    vectors: List[Optional[np.ndarray]] = [
+        query_embedding_cache.get(settings.embedding_model, q) for q in questions
     ]
+    missing = list(dict.fromkeys(q for q, v in zip(questions, vectors) if v is None))
+    if missing:
+        with query_embed_seconds.time():
+            embedded = await embedding_model.aembed_documents(missing)
+        fresh = {
+            q: query_embedding_cache.put(settings.embedding_model, q, v) for q, v in zip(missing, embedded)
+        }
+        vectors = [v if v is not None else fresh[q] for q, v in zip(questions, vectors)]
+    return vectors
 
-async def stream_answer(
+async def retrieve_top_docs(
     question: str,
-    history: List[Dict[str,str]],
-) -> AsyncGenerator[str,None]:
+    k: Optional[int] = None,
+    mode: Optional[str] = None,
+    filters: Optional[RetrievalFilters] = None,
+) -> RetrievalResult:
+    mode = (mode or settings.retrieval_mode).lower()
+    # Lexical-only retrieval doesn't need the question embedding
+    q_vec = await embed_question(question) if mode != "lexical" else None
+    return await retrieve(question, k or settings.top_k, mode, q_vec, filters)
+
+# Upstream streaming is skipped for this long after a broken SSE stream
+_STREAM_RETRY_AFTER_FAILURE_SECONDS = 60.0
+_stream_retry_at = 0.0
+
+# Errors that mean the llama.cpp SSE stream broke, not that the request was bad
+_BROKEN_STREAM_ERRORS = (httpx.RemoteProtocolError, httpx.ReadError, httpx.ReadTimeout, APIConnectionError)
+
+def _streaming_available() -> bool:
+    return settings.local_llm_streaming and time.monotonic() >= _stream_retry_at
+
+def _mark_stream_broken() -> None:
+    global _stream_retry_at
+    _stream_retry_at = time.monotonic() + _STREAM_RETRY_AFTER_FAILURE_SECONDS
+
+async def _complete_remainder(
+    messages: List[Dict[str, str]], sent: str, conversation_id: Optional[str] = None
+) -> str:
     """
-    1. retrieve top docs
-    2. build prompt including history
-    3. fire off local LLM streaming chat
-    4. yield each token as soon as it arrives
+    Non-streaming completion of whatever the client has not received yet.
+    With a partial answer, it is passed as a trailing assistant message so
+    llama.cpp continues it; if the server regenerates from scratch instead,
+    the already-sent prefix is stripped.
     """
-    logger.info("Embedding & retrieving docs")
-    docs = await retrieve_top_docs(question)
-    ctx = "\n\n---\n\n".join(d["content"] for d in docs)
-
-    # build history block
-    hist_block = ""
-    if history:
-        for turn in history:
-            hist_block += f"User: {turn['question']}\nAssistant: {turn['answer']}\n"
-    else:
-        hist_block = "(no prior context)\n"
-
-    prompt = (
-        f"You are a helpful assistant.\n\n"
-        f"Conversation so far:\n{hist_block}\n"
-        f"Context from documents:\n{ctx}\n\n"
-        f"Question: {question}\n"
-        f"Answer:"
+    if sent:
+        messages = messages + [{"role": "assistant", "content": sent}]
+    started = time.perf_counter()
+    resp = await llm_client.chat.completions.create(
+        model=settings.local_llm_model,
+        messages=messages,
+        max_tokens=settings.llm_max_answer_tokens,
+        stream=False,
+        extra_body=request_hints(conversation_id),
     )
+    observe_completion(resp, time.perf_counter() - started)
+    observe_prompt_cache(resp, conversation_id)
+    text = resp.choices[0].message.content or ""
+    if sent and text.startswith(sent):
+        text = text[len(sent):]
+    return text
 
-    full_answer = ""
-
-    if settings.local_llm_streaming:
-        # Try true upstream streaming (may be unstable with some llama.cpp builds)
-        stream = await llm_client.chat.completions.create(
-            model=settings.local_llm_model,
-            messages=[{"role": "user", "content": prompt}],
-            stream=True,
-        )
+async def _generate(
+    messages: List[Dict[str, str]], conversation_id: Optional[str] = None
+) -> AsyncGenerator[str, None]:
+    """
+    Answer text for the chat messages as it is generated. If the upstream SSE stream
+    breaks (before or after the first token), the rest is fetched with a
+    non-streaming completion that continues from the text already yielded,
+    so no token is yielded twice. Runs inside an LLM scheduler slot.
+    """
+    # Tokens already yielded; joined only when a fallback needs them
+    sent_parts: List[str] = []
 
+    if _streaming_available():
+        started = time.perf_counter()
+        first_token_at = None
+        n_tokens = 0
+        stream = None
         try:
+            stream = await llm_client.chat.completions.create(
+                model=settings.local_llm_model,
+                messages=messages,
+                max_tokens=settings.llm_max_answer_tokens,
+                stream=True,
+                extra_body=request_hints(conversation_id),
+            )
             async for chunk in stream:
+                # llama.cpp attaches prompt/cache timings to the final chunk
+                if getattr(chunk, "timings", None):
+                    observe_prompt_cache(chunk, conversation_id)
+                if not chunk.choices:
+                    continue
                 content_delta = chunk.choices[0].delta.content  # may be None
                 if content_delta:
-                    full_answer += content_delta
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        ttft_seconds.observe(first_token_at - started)
+                    # llama.cpp sends one token per chunk
+                    n_tokens += 1
+                    sent_parts.append(content_delta)
                     yield content_delta
-        except asyncio.CancelledError:
-            logger.warning("Streaming cancelled by downstream client")
-            return
-        except (httpx.RemoteProtocolError, httpx.ReadError, httpx.ReadTimeout) as e:
-            logger.warning(f"Upstream stream ended unexpectedly: {e}")
-            return
-        except Exception:
-            logger.exception("Unexpected error while streaming from LLM")
             return
+        except _BROKEN_STREAM_ERRORS as e:
+            logger.warning(
+                "Upstream stream broke after %d tokens (%s); completing without streaming", n_tokens, e
+            )
+            _mark_stream_broken()
         finally:
-            close = getattr(stream, "aclose", None)
+            if first_token_at is not None and n_tokens > 1:
+                tokens_per_second.observe((n_tokens - 1) / max(time.perf_counter() - first_token_at, 1e-6))
+            close = getattr(stream, "close", None)
             if callable(close):
                 try:
                     await close()
                 except Exception:
                     pass
-    else:
-        # Fallback: non-streaming request to LLM, then chunk to client to simulate streaming
-        try:
-            resp = await llm_client.chat.completions.create(
-                model=settings.local_llm_model,
-                messages=[{"role": "user", "content": prompt}],
-                stream=False,
-            )
-            text = resp.choices[0].message.content or ""
-            full_answer = text
-            # Yield in small chunks to avoid huge single write
-            chunk_size = 200
-            for i in range(0, len(text), chunk_size):
-                yield text[i:i+chunk_size]
-        except asyncio.CancelledError:
-            logger.warning("Non-stream request cancelled by downstream client")
-            return
-        except Exception:
-            logger.exception("Error during non-streaming LLM request")
-            return
 
-async def answer_question(question: str) -> Tuple[str, List[Dict[str, Any]]]:
-    logger.info("✅ Starting to embed query")
-    # Step 1: Embed the question (offload to thread)
-    q_vector = await run_in_threadpool(embedding_model.embed_query, question)
-    logger.info("✅ Finished embedding query")
-    # Step 2: Query top-5 similar documents from Postgres
-    sql = text("""
-        SELECT id, content, metadata, 1 - (embedding <=> :q) AS similarity
-        FROM documents
-        ORDER BY embedding <=> :q
-        LIMIT 5
-    """)
-
-    q_vector_str = to_pgvector_literal(q_vector)
+    # Non-streaming request for everything not yet sent, chunked to avoid one huge write
+    text = await _complete_remainder(messages, "".join(sent_parts), conversation_id)
+    chunk_size = 200
+    for i in range(0, len(text), chunk_size):
+        yield text[i:i+chunk_size]
 
-    logger.info("✅ Starting to fetch documents from DB")
-    def _run_query2():
-        with get_session() as session:
-            result = session.execute(sql, {"q": q_vector_str})
-            return result.fetchall()
+async def stream_answer(
+    question: str,
+    history: List[Dict[str,str]],
+    mode: Optional[str] = None,
+    filters: Optional[RetrievalFilters] = None,
+    summary: Optional[str] = None,
+    conversation_id: Optional[str] = None,
+) -> AsyncGenerator[Tuple[str, Any], None]:
+    """
+    1. retrieve top docs and yield ("sources", [...])
+    2. build token-budgeted chat messages: stable prefix (system + summary,
+       history turns), then the retrieved context and question
+    3. wait for an interactive LLM slot and stream the answer, pinned to the
+       conversation's llama.cpp slot so the prefix's KV cache is reused
+    4. yield ("token", text) for each token as soon as it arrives
 
-    try:
-        rows = await asyncio.wait_for(run_in_threadpool(_run_query2), timeout=10.0)
-    except asyncio.TimeoutError:
-        logger.error("Database query timed out — connection may be stale.")
-        raise HTTPException(status_code=504, detail="Database query timed out.")
+    Concurrent requests with an identical prompt share one generation.
+    Raises LLMOverloaded if no slot frees up in time.
+    """
+    logger.info("Embedding & retrieving docs")
+    docs = (await retrieve_top_docs(question, mode=mode, filters=filters)).docs
+    yield "sources", [_source(d) for d in docs]
+    messages = (await build_prompt(question, docs, history=history, summary=summary)).messages
 
-    logger.info("✅ Fetched documents from DB")
+    key = llm_scheduler.request_key(messages, settings.llm_max_answer_tokens)
+    async for part in llm_scheduler.stream(
+        key, lambda: _generate(messages, conversation_id), PRIORITY_INTERACTIVE
+    ):
+        yield "token", part
 
-    # Step 3: Construct context string for the LLM
-    context_blocks = []
-    top_docs = []
+def _answer_cache_scope(mode: str, filters: Optional[RetrievalFilters]) -> str:
+    # Answers are only reused for the same retrieval mode and filters
+    return f"{mode}|{filters.cache_key()}" if filters else mode
 
-    for row in rows:
-        context_blocks.append(row.content)
-        top_docs.append({
-            "id": str(row.id),
-            "similarity": float(row.similarity),
-            "metadata": row.metadata
-        })
+async def answer_question(
+    question: str,
+    mode: Optional[str] = None,
+    filters: Optional[RetrievalFilters] = None,
+) -> Tuple[str, List[Dict[str, Any]], Dict[str, float]]:
+    mode = (mode or settings.retrieval_mode).lower()
+    cache_scope = _answer_cache_scope(mode, filters)
+    generation = answer_cache.generation
+    q_vector = None
+    if mode != "lexical":
+        logger.info("✅ Starting to embed query")
+        # Step 1: Embed the question (cached)
+        q_vector = await embed_question(question)
+        logger.info("✅ Finished embedding query")
 
-    logger.info("✅ Constructed context block")
+        # A semantically equivalent question was answered recently: skip retrieval and the LLM
+        cached = answer_cache.lookup(q_vector, scope=cache_scope)
+        if cached is not None:
+            logger.info("✅ Answer cache hit (similarity %.4f)", cached.similarity)
+            return cached.answer, cached.sources, {}
 
-    context = "\n\n---\n\n".join(context_blocks)
-    prompt = f"Use the following context to answer the question:\n\n{context}\n\nQuestion: {question}\nAnswer:"
+    # Step 2: Query the TOP_K most relevant documents from Postgres (re-ranked when configured)
+    logger.info("✅ Starting to fetch documents from DB")
+    result = await retrieve(question, settings.top_k, mode, q_vector, filters)
+    logger.info("✅ Fetched documents from DB")
 
-    # Step 4: Generate answer via local LLM client (same client used in streaming path)
-    logger.info("✅ Prompt ready, calling local LLM client")
+    # Step 3: Fit the retrieved context into the prompt token budget
+    top_docs = [_source(d) for d in result.docs]
+    messages = (await build_prompt(question, result.docs)).messages
 
-    async def run_completion(prompt_text: str, timeout: float = 60.0):
-        try:
-            resp = await llm_client.chat.completions.create(
-                model=settings.local_llm_model,
-                messages=[{"role": "user", "content": prompt_text}],
-                stream=False,
-            )
-            return resp
-        except asyncio.TimeoutError:
-            raise HTTPException(status_code=504, detail="LLM request timed out")
+    logger.info("✅ Constructed context block")
+
+    # Step 4: Generate answer via local LLM client, admitted by the LLM scheduler
+    logger.info("✅ Prompt ready, calling local LLM client")
 
-    response = await run_completion(prompt)
+    # Waits for a slot behind interactive streams; identical in-flight prompts share one completion
+    response = await llm_scheduler.complete(messages, settings.llm_max_answer_tokens, PRIORITY_DEFAULT)
     logger.info("✅ Got response from local LLM")
     answer = response.choices[0].message.content or ""
     answer = answer.strip()
 
-    return answer, top_docs
+    if answer and q_vector is not None:
+        answer_cache.put(q_vector, question, answer, top_docs, generation, scope=cache_scope)
+
+    return answer, top_docs, result.timings_ms
+
+async def answer_questions(
+    questions: List[str],
+    mode: Optional[str] = None,
+    filters: Optional[RetrievalFilters] = None,
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Answer a batch of questions, yielding one result per question as soon as
+    it is ready (completion order, tagged with its index):
+    1. embed every question in one TEI batch (cached embeddings are reused)
+    2. yield answer-cache hits immediately
+    3. retrieve for the rest with one LATERAL statement per retrieval leg
+    4. generate up to QUERY_BATCH_CONCURRENCY answers at a time, at batch
+       priority so interactive requests keep their LLM slots
+
+    A failed question yields {"index", "error", "status_code"} instead of
+    ending the batch.
+    """
+    mode = (mode or settings.retrieval_mode).lower()
+    cache_scope = _answer_cache_scope(mode, filters)
+    generation = answer_cache.generation
+    q_vecs = await embed_questions(questions) if mode != "lexical" else None
+
+    todo: List[int] = []
+    for i in range(len(questions)):
+        cached = answer_cache.lookup(q_vecs[i], scope=cache_scope) if q_vecs is not None else None
+        if cached is not None:
+            yield {"index": i, "answer": cached.answer, "source_docs": cached.sources, "retrieval_ms": {}}
+        else:
+            todo.append(i)
+    if not todo:
+        return
+
+    results = await retrieve_many(
+        [questions[i] for i in todo],
+        settings.top_k,
+        mode,
+        [q_vecs[i] for i in todo] if q_vecs is not None else None,
+        filters,
+    )
+    generating = asyncio.Semaphore(max(1, settings.query_batch_concurrency))
+
+    async def _answer(i: int, result: RetrievalResult) -> Dict[str, Any]:
+        sources = [_source(d) for d in result.docs]
+        try:
+            async with generating:
+                messages = (await build_prompt(questions[i], result.docs)).messages
+                # Identical questions in the batch share one completion
+                response = await llm_scheduler.complete(messages, settings.llm_max_answer_tokens, PRIORITY_BATCH)
+        except LLMOverloaded as e:
+            return {"index": i, "error": e.detail, "status_code": e.status_code, "retry_after": e.retry_after}
+        except Exception as e:
+            logger.exception("Batch question %s failed", i)
+            return {"index": i, "error": str(e) or type(e).__name__, "status_code": 500}
+        answer = (response.choices[0].message.content or "").strip()
+        if answer and q_vecs is not None:
+            answer_cache.put(q_vecs[i], questions[i], answer, sources, generation, scope=cache_scope)
+        return {"index": i, "answer": answer, "source_docs": sources, "retrieval_ms": result.timings_ms}
+
+    tasks = [asyncio.create_task(_answer(i, result)) for i, result in zip(todo, results)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Client went away: stop generating answers nobody will read
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,64 @@
+from typing import Any, Dict, List, Optional
+import logging
+
+import httpx
+
+from config import settings
+from services.metrics import LATENCY_BUCKETS, registry
+
+logger = logging.getLogger(__name__)
+
+rerank_seconds = registry.histogram(
+    "rag_rerank_seconds", "Cross-encoder /rerank latency for retrieval candidates", LATENCY_BUCKETS
+)
+
+
+class TEIReranker:
+    """
+    Scores (question, chunk) pairs with a cross-encoder served by TEI's
+    POST /rerank (e.g. BAAI/bge-reranker-base). Scores are TEI's sigmoid
+    outputs in [0, 1], so one relevance cutoff works across questions.
+    """
+
+    def __init__(self, base_url: str, timeout: float = 10.0, max_chars: int = 2000):
+        self.base_url = base_url
+        self.timeout = timeout
+        # Texts are truncated client-side too, so a long chunk can't trip TEI's payload limit
+        self.max_chars = max(1, max_chars)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout)
+        return self._client
+
+    async def scores(self, query: str, texts: List[str]) -> List[float]:
+        """One relevance score per text, in input order."""
+        if not texts:
+            return []
+        payload: Dict[str, Any] = {
+            "query": query,
+            "texts": [t[: self.max_chars] for t in texts],
+            "truncate": True,
+        }
+        with rerank_seconds.time():
+            r = await self._get_client().post("/rerank", json=payload)
+        r.raise_for_status()
+        # TEI returns [{"index": i, "score": s}, ...] sorted by score
+        out = [0.0] * len(texts)
+        for item in r.json():
+            out[int(item["index"])] = float(item["score"])
+        return out
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# None unless RERANKER_BASE_URL points at a TEI instance serving a re-ranker model
+reranker: Optional[TEIReranker] = (
+    TEIReranker(settings.reranker_base_url, timeout=settings.rerank_timeout_seconds)
+    if settings.reranker_base_url
+    else None
+)
@@ -0,0 +1,468 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import time
+
+import httpx
+import numpy as np
+from fastapi import HTTPException
+from sqlalchemy import text
+
+from config import settings
+from services.db import get_async_session
+from services.metrics import COUNT_BUCKETS, LATENCY_BUCKETS, registry
+from services.reranker import reranker
+from services.vector_index import (
+    apply_search_settings,
+    binary_index_expression,
+    embedding_sql_type,
+    quantization,
+    storage_type,
+)
+
+logger = logging.getLogger(__name__)
+
+sql_seconds = {
+    leg: registry.histogram("rag_search_sql_seconds", "Retrieval SQL latency per leg", LATENCY_BUCKETS, {"leg": leg})
+    for leg in ("vector", "lexical")
+}
+rows_returned = {
+    leg: registry.histogram("rag_search_rows", "Rows returned by retrieval SQL per leg", COUNT_BUCKETS, {"leg": leg})
+    for leg in ("vector", "lexical")
+}
+
+RETRIEVAL_MODES = ("vector", "lexical", "hybrid")
+
+# The query vector is bound once as a native pgvector parameter (float32 ndarray,
+# binary protocol via the adapters registered in services.db); the distance is
+# computed once and used for both ranking and the returned similarity.
+_VECTOR_SQL = """
+    SELECT id, content, metadata, embedding <=> {q} AS distance
+    FROM documents
+    {where}
+    ORDER BY distance
+    LIMIT :k
+"""
+
+# Binary quantization: oversampled Hamming-distance candidates from the bit index,
+# re-ranked by exact cosine distance on the stored embeddings.
+_BINARY_VECTOR_SQL = """
+    WITH candidates AS MATERIALIZED (
+        SELECT id, content, metadata, embedding
+        FROM documents
+        {where}
+        ORDER BY {bit_expr} <~> binary_quantize({q})
+        LIMIT :candidates
+    )
+    SELECT id, content, metadata, embedding <=> {q} AS distance
+    FROM candidates
+    ORDER BY distance
+    LIMIT :k
+"""
+
+# Iterative scans with relaxed_order may return slightly out-of-order rows;
+# materialize the candidates and sort them exactly.
+_FILTERED_VECTOR_SQL = """
+    WITH candidates AS MATERIALIZED ({inner})
+    SELECT * FROM candidates ORDER BY distance
+"""
+
+# Batch retrieval: each element of the :qs array drives its own top-k
+# subquery (the same index-ordered scan as a single question) through a
+# LATERAL join, so a batch costs one statement on one connection.
+_MULTI_SQL = """
+    SELECT q.idx, d.*
+    FROM unnest(CAST(:qs AS {elem_type}[])) WITH ORDINALITY AS q(val, idx)
+    CROSS JOIN LATERAL ({inner}) AS d
+    ORDER BY q.idx, {order}
+"""
+
+# _BINARY_VECTOR_SQL as a subquery that can sit under LATERAL
+_BINARY_VECTOR_INNER_SQL = """
+    SELECT id, content, metadata, embedding <=> {q} AS distance
+    FROM (
+        SELECT id, content, metadata, embedding
+        FROM documents
+        {where}
+        ORDER BY {bit_expr} <~> binary_quantize({q})
+        LIMIT :candidates
+    ) AS candidates
+    ORDER BY distance
+    LIMIT :k
+"""
+
+# content_tsv is a generated tsvector column with a GIN index (migration 20261017_04)
+_LEXICAL_SQL = """
+    SELECT id, content, metadata, ts_rank_cd(content_tsv, query) AS rank
+    FROM documents, websearch_to_tsquery(CAST(:config AS regconfig), {q}) AS query
+    WHERE content_tsv @@ query {and_filters}
+    ORDER BY rank DESC
+    LIMIT :k
+"""
+
+
+@dataclass(frozen=True)
+class RetrievalFilters:
+    """
+    Restrict retrieval to chunks that occur in the given uploads/pages.
+    Chunks are stored once per content hash, so the filter reads
+    document_ingestions (one row per upload and page a chunk occurs in,
+    migration 20261017_09) rather than the metadata of the first upload.
+    All conditions must hold for the same occurrence; the planner can drive
+    the query from that table's indexes or check candidates of an iterative
+    ANN scan against it.
+    """
+
+    sources: Tuple[str, ...] = ()
+    filenames: Tuple[str, ...] = ()
+    page_min: Optional[int] = None
+    page_max: Optional[int] = None
+    ingestion_id: Optional[str] = None
+
+    @property
+    def empty(self) -> bool:
+        return (
+            not self.sources
+            and not self.filenames
+            and self.page_min is None
+            and self.page_max is None
+            and not self.ingestion_id
+        )
+
+    def cache_key(self) -> str:
+        if self.empty:
+            return ""
+        return f"{sorted(self.sources)}|{sorted(self.filenames)}|{self.page_min}|{self.page_max}|{self.ingestion_id}"
+
+    def conditions(self) -> Tuple[List[str], Dict[str, Any]]:
+        if self.empty:
+            return [], {}
+        occurrence: List[str] = ["di.document_id = documents.id"]
+        params: Dict[str, Any] = {}
+        if self.sources:
+            occurrence.append("di.source = ANY(:f_sources)")
+            params["f_sources"] = list(self.sources)
+        if self.filenames:
+            occurrence.append("di.filename = ANY(:f_filenames)")
+            params["f_filenames"] = list(self.filenames)
+        if self.page_min is not None:
+            occurrence.append("di.page >= :f_page_min")
+            params["f_page_min"] = self.page_min
+        if self.page_max is not None:
+            occurrence.append("di.page <= :f_page_max")
+            params["f_page_max"] = self.page_max
+        if self.ingestion_id:
+            occurrence.append("di.ingestion_id = :f_ingestion_id")
+            params["f_ingestion_id"] = self.ingestion_id
+        clause = "EXISTS (SELECT 1 FROM document_ingestions di WHERE {})".format(" AND ".join(occurrence))
+        return [clause], params
+
+
+@dataclass
+class RetrievalResult:
+    docs: List[Dict[str, Any]]
+    mode: str
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+
+
+async def _timed_query(
+    sql, params: Dict[str, Any], leg: str, filtered: bool = False, candidates: int = 0
+) -> List[Any]:
+    async def _run_query():
+        async with get_async_session() as session:
+            if leg == "vector":
+                await apply_search_settings(session, filtered=filtered, candidates=candidates)
+            with sql_seconds[leg].time():
+                res = await session.execute(sql, params)
+                rows = res.fetchall()
+            rows_returned[leg].observe(len(rows))
+            return rows
+
+    try:
+        return await asyncio.wait_for(_run_query(), timeout=10.0)
+    except asyncio.TimeoutError:
+        logger.error("Database query timed out — connection may be stale.")
+        raise HTTPException(status_code=504, detail="Database query timed out.")
+
+
+def _vector_query(
+    k: int, q_expr: str, filters: Optional[RetrievalFilters], batch: bool = False
+) -> Tuple[str, Dict[str, Any], int]:
+    """
+    SQL, extra params and ANN candidate count (rows the index scan must
+    return, at least k) for a nearest-chunks query against q_expr. With
+    batch=True the SQL is the per-question subquery of _MULTI_SQL (exact
+    ordering is left to the outer ORDER BY).
+    """
+    clauses, params = filters.conditions() if filters else ([], {})
+    where = "WHERE " + " AND ".join(clauses) if clauses else ""
+    # The query vector is bound as float32 vector; halfvec storage needs a cast to use its operators
+    q = "CAST({} AS {})".format(q_expr, embedding_sql_type()) if storage_type() != "vector" else q_expr
+    # The ANN scan must yield k rows (more with binary re-rank); ef_search is raised to match
+    candidates = k
+    if quantization() == "binary":
+        candidates = k * max(1, settings.vector_rerank_oversample)
+        template = _BINARY_VECTOR_INNER_SQL if batch else _BINARY_VECTOR_SQL
+        sql = template.format(where=where, q=q, bit_expr=binary_index_expression())
+        params["candidates"] = candidates
+    elif clauses and not batch:
+        sql = _FILTERED_VECTOR_SQL.format(inner=_VECTOR_SQL.format(where=where, q=q))
+    else:
+        sql = _VECTOR_SQL.format(where=where, q=q)
+    return sql, params, candidates
+
+
+def _filtered(filters: Optional[RetrievalFilters]) -> bool:
+    return bool(filters and not filters.empty)
+
+
+def _vector_doc(r) -> Dict[str, Any]:
+    return {
+        "id": str(r.id),
+        "content": r.content,
+        "metadata": r.metadata,
+        "similarity": 1.0 - float(r.distance),
+    }
+
+
+def _lexical_doc(r) -> Dict[str, Any]:
+    return {
+        "id": str(r.id),
+        "content": r.content,
+        "metadata": r.metadata,
+        "similarity": None,
+        "text_rank": float(r.rank),
+    }
+
+
+def _group_by_question(rows: List[Any], n: int, to_doc) -> List[List[Dict[str, Any]]]:
+    grouped: List[List[Dict[str, Any]]] = [[] for _ in range(n)]
+    for r in rows:
+        # WITH ORDINALITY is 1-based
+        grouped[r.idx - 1].append(to_doc(r))
+    return grouped
+
+
+async def vector_search(
+    q_vec: np.ndarray, k: int, filters: Optional[RetrievalFilters] = None
+) -> List[Dict[str, Any]]:
+    """
+    Nearest chunks to q_vec by cosine distance, optionally restricted by metadata.
+    With binary quantization, k * VECTOR_RERANK_OVERSAMPLE Hamming candidates
+    are re-ranked exactly.
+    """
+    sql, params, candidates = _vector_query(k, ":q", filters)
+    rows = await _timed_query(
+        text(sql), {"q": q_vec, "k": k, **params}, "vector", filtered=_filtered(filters), candidates=candidates
+    )
+    return [_vector_doc(r) for r in rows]
+
+
+async def vector_search_many(
+    q_vecs: List[np.ndarray], k: int, filters: Optional[RetrievalFilters] = None
+) -> List[List[Dict[str, Any]]]:
+    """vector_search for several query vectors in one statement; one ranked list per vector."""
+    if not q_vecs:
+        return []
+    inner, params, candidates = _vector_query(k, "q.val", filters, batch=True)
+    sql = text(_MULTI_SQL.format(elem_type="vector", inner=inner, order="d.distance"))
+    rows = await _timed_query(
+        sql, {"qs": list(q_vecs), "k": k, **params}, "vector", filtered=_filtered(filters), candidates=candidates
+    )
+    return _group_by_question(rows, len(q_vecs), _vector_doc)
+
+
+def _lexical_query(q_expr: str, filters: Optional[RetrievalFilters]) -> Tuple[str, Dict[str, Any]]:
+    clauses, params = filters.conditions() if filters else ([], {})
+    sql = _LEXICAL_SQL.format(q=q_expr, and_filters="".join(f" AND {c}" for c in clauses))
+    return sql, {"config": settings.text_search_config, **params}
+
+
+async def lexical_search(
+    question: str, k: int, filters: Optional[RetrievalFilters] = None
+) -> List[Dict[str, Any]]:
+    """Full-text matches for the question, ranked by ts_rank_cd."""
+    sql, params = _lexical_query(":q", filters)
+    rows = await _timed_query(text(sql), {"q": question, "k": k, **params}, "lexical")
+    return [_lexical_doc(r) for r in rows]
+
+
+async def lexical_search_many(
+    questions: List[str], k: int, filters: Optional[RetrievalFilters] = None
+) -> List[List[Dict[str, Any]]]:
+    """lexical_search for several questions in one statement; one ranked list per question."""
+    if not questions:
+        return []
+    inner, params = _lexical_query("q.val", filters)
+    sql = text(_MULTI_SQL.format(elem_type="text", inner=inner, order="d.rank DESC"))
+    rows = await _timed_query(sql, {"qs": list(questions), "k": k, **params}, "lexical")
+    return _group_by_question(rows, len(questions), _lexical_doc)
+
+
+def reciprocal_rank_fusion(
+    ranked_lists: List[List[Dict[str, Any]]], k: int, rrf_k: int
+) -> List[Dict[str, Any]]:
+    """Fuse ranked lists by sum(1 / (rrf_k + rank)); a doc found by several legs keeps all its fields."""
+    fused: Dict[str, Dict[str, Any]] = {}
+    for docs in ranked_lists:
+        for rank, doc in enumerate(docs, start=1):
+            entry = fused.get(doc["id"])
+            if entry is None:
+                entry = fused[doc["id"]] = {**doc, "rrf_score": 0.0}
+            else:
+                for key, value in doc.items():
+                    if entry.get(key) is None:
+                        entry[key] = value
+            entry["rrf_score"] += 1.0 / (rrf_k + rank)
+    return sorted(fused.values(), key=lambda d: d["rrf_score"], reverse=True)[:k]
+
+
+def cap_context(docs: List[Dict[str, Any]], max_chars: int) -> List[Dict[str, Any]]:
+    """Keep docs in rank order while their content fits in max_chars (0 = no cap); the first always stays."""
+    if max_chars <= 0:
+        return docs
+    kept: List[Dict[str, Any]] = []
+    used = 0
+    for doc in docs:
+        size = len(doc["content"] or "")
+        if kept and used + size > max_chars:
+            continue
+        kept.append(doc)
+        used += size
+    return kept
+
+
+async def rerank(question: str, docs: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+    """
+    Order candidates by cross-encoder score and keep at most k scoring
+    >= RERANK_MIN_SCORE; the best-scored candidate is always kept, since
+    relevant paraphrases can score low. If the re-ranker fails, the first k
+    candidates are kept in retrieval order.
+    """
+    try:
+        scores = await asyncio.wait_for(
+            reranker.scores(question, [d["content"] for d in docs]), timeout=settings.rerank_timeout_seconds
+        )
+    except (asyncio.TimeoutError, httpx.HTTPError, KeyError, ValueError) as exc:
+        logger.warning("Re-ranking failed (%s); using retrieval order", exc)
+        return docs[:k]
+    ranked = sorted(
+        ({**d, "rerank_score": s} for d, s in zip(docs, scores)),
+        key=lambda d: d["rerank_score"],
+        reverse=True,
+    )
+    kept = [d for d in ranked if d["rerank_score"] >= settings.rerank_min_score][:k] or ranked[:1]
+    logger.info(
+        "Re-ranked %s candidates: %s above %.2f (best %.3f)",
+        len(docs), len(kept), settings.rerank_min_score, ranked[0]["rerank_score"] if ranked else 0.0,
+    )
+    return kept
+
+
+async def _timed(coro, timings: Dict[str, float], name: str):
+    start = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        timings[name] = round(1000 * (time.perf_counter() - start), 2)
+
+
+async def _finish(question: str, docs: List[Dict[str, Any]], k: int, timings: Dict[str, float]) -> List[Dict[str, Any]]:
+    """Re-rank (when configured) and cap the fused candidates for one question."""
+    if reranker is not None and docs:
+        docs = await _timed(rerank(question, docs, k), timings, "rerank")
+    return cap_context(docs, settings.context_max_chars)
+
+
+def _check_mode(mode: Optional[str]) -> str:
+    mode = (mode or settings.retrieval_mode).lower()
+    if mode not in RETRIEVAL_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown retrieval mode: {mode}")
+    return mode
+
+
+def _candidate_count(k: int) -> int:
+    return max(k, settings.rerank_candidates) if reranker is not None else k
+
+
+async def retrieve(
+    question: str,
+    k: int,
+    mode: Optional[str] = None,
+    q_vec: Optional[np.ndarray] = None,
+    filters: Optional[RetrievalFilters] = None,
+) -> RetrievalResult:
+    """
+    Retrieve k chunks with the requested mode. `vector` and `hybrid` need q_vec.
+    Hybrid runs the vector and lexical top-N legs concurrently and fuses them with RRF.
+    Metadata filters apply to every leg. With a re-ranker configured,
+    RERANK_CANDIDATES chunks are fetched and re-scored by the cross-encoder
+    first. The result is capped at CONTEXT_MAX_CHARS of content.
+    """
+    mode = _check_mode(mode)
+    timings: Dict[str, float] = {}
+    n = _candidate_count(k)
+
+    if mode == "vector":
+        docs = await _timed(vector_search(q_vec, n, filters), timings, "vector")
+    elif mode == "lexical":
+        docs = await _timed(lexical_search(question, n, filters), timings, "lexical")
+    else:
+        legs_n = max(n, settings.hybrid_candidates)
+        vector_docs, lexical_docs = await asyncio.gather(
+            _timed(vector_search(q_vec, legs_n, filters), timings, "vector"),
+            _timed(lexical_search(question, legs_n, filters), timings, "lexical"),
+        )
+        docs = reciprocal_rank_fusion([vector_docs, lexical_docs], n, settings.rrf_k)
+
+    docs = await _finish(question, docs, k, timings)
+
+    logger.info(
+        "Retrieved %s docs (mode=%s, filtered=%s, timings_ms=%s)",
+        len(docs), mode, _filtered(filters), timings,
+    )
+    return RetrievalResult(docs=docs, mode=mode, timings_ms=timings)
+
+
+async def retrieve_many(
+    questions: List[str],
+    k: int,
+    mode: Optional[str] = None,
+    q_vecs: Optional[List[np.ndarray]] = None,
+    filters: Optional[RetrievalFilters] = None,
+) -> List[RetrievalResult]:
+    """
+    retrieve() for a batch of questions: each leg is one LATERAL statement
+    over all of them (q_vecs aligned with questions), then fusion, re-ranking
+    and the context cap run per question. Leg timings are for the whole batch.
+    """
+    mode = _check_mode(mode)
+    if not questions:
+        return []
+    timings: Dict[str, float] = {}
+    n = _candidate_count(k)
+
+    if mode == "vector":
+        per_question = await _timed(vector_search_many(q_vecs, n, filters), timings, "vector")
+    elif mode == "lexical":
+        per_question = await _timed(lexical_search_many(questions, n, filters), timings, "lexical")
+    else:
+        legs_n = max(n, settings.hybrid_candidates)
+        vector_lists, lexical_lists = await asyncio.gather(
+            _timed(vector_search_many(q_vecs, legs_n, filters), timings, "vector"),
+            _timed(lexical_search_many(questions, legs_n, filters), timings, "lexical"),
+        )
+        per_question = [
+            reciprocal_rank_fusion([v, lx], n, settings.rrf_k) for v, lx in zip(vector_lists, lexical_lists)
+        ]
+
+    question_timings = [dict(timings) for _ in questions]
+    finished = await asyncio.gather(
+        *(_finish(q, docs, k, t) for q, docs, t in zip(questions, per_question, question_timings))
+    )
+    logger.info(
+        "Retrieved docs for %s questions (mode=%s, filtered=%s, timings_ms=%s)",
+        len(questions), mode, _filtered(filters), timings,
+    )
+    return [RetrievalResult(docs=d, mode=mode, timings_ms=t) for d, t in zip(finished, question_timings)]
@@ -0,0 +1,46 @@
+from typing import Any, AsyncIterator, Optional
+import asyncio
+import json
+
+# Comment line: keeps proxies and clients from timing out during LLM prefill
+SSE_HEARTBEAT = ": ping\n\n"
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    # Disable response buffering in nginx / ingress-nginx so events flush immediately
+    "X-Accel-Buffering": "no",
+}
+
+
+def sse_event(event: str, data: Any) -> str:
+    """Frame one Server-Sent Event; data is JSON-encoded so newlines in tokens are safe."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def with_heartbeats(source: AsyncIterator[Any], interval: float) -> AsyncIterator[Optional[Any]]:
+    """
+    Re-yield items from source, yielding None whenever nothing arrived for
+    `interval` seconds. The pending __anext__ is never cancelled by the
+    timeout, so the source generator is not disturbed.
+    """
+    iterator = source.__aiter__()
+    pending: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            done, _ = await asyncio.wait({pending}, timeout=interval)
+            if not done:
+                yield None
+                continue
+            try:
+                item = pending.result()
+            except StopAsyncIteration:
+                return
+            finally:
+                pending = None
+            yield item
+    finally:
+        if pending is not None:
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
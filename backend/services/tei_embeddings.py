@@ -1,12 +1,26 @@
 # pip install httpx langchain
-from typing import List, Optional
+from typing import Iterator, List, Optional
+import asyncio
 import httpx
 from langchain.embeddings.base import Embeddings
 import time
 import logging
 
+from services.metrics import LATENCY_BUCKETS, registry
+
 logger = logging.getLogger(__name__)
 
+embed_request_seconds = registry.histogram(
+    "tei_embed_request_seconds", "TEI /embed HTTP request latency (each attempt)", LATENCY_BUCKETS
+)
+
+# Status codes worth retrying: TEI is overloaded or still warming up
+_RETRYABLE_STATUS = {429, 502, 503, 504}
+
+
+class PayloadTooLarge(Exception):
+    """TEI rejected a batch with 413; the caller should split it."""
+
 
 class TEIEmbeddings(Embeddings):
     def __init__(
@@ -15,26 +29,46 @@ class TEIEmbeddings(Embeddings):
         api_key: Optional[str] = None,
         timeout: float = 60.0,
         batch_size: int = 32,
+        max_batch_chars: int = 32_000,
+        max_concurrency: int = 4,
     ):
         headers = {"Content-Type": "application/json"}
         if api_key:
             headers["Authorization"] = f"Bearer {api_key}"
+        self.headers = headers
+        self.timeout = timeout
         self.client = httpx.Client(base_url=base_url, headers=headers, timeout=timeout)
         # Send to TEI in smaller requests to avoid 413s
         self.batch_size = max(1, batch_size)
+        # Cap on total characters per request; lowered automatically after a 413
+        self.max_batch_chars = max(1, max_batch_chars)
+        self.max_concurrency = max(1, max_concurrency)
         self.base_url = base_url
         self.max_retries = 5
         self.retry_delay = 2
+        # Async client and semaphore are created lazily on the running event loop
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _should_retry(self, exc: httpx.HTTPError) -> bool:
+        if isinstance(exc, httpx.HTTPStatusError):
+            return exc.response.status_code in _RETRYABLE_STATUS
+        return True
+
+    def _check_response(self, r: httpx.Response) -> List[List[float]]:
+        if r.status_code == 413:
+            raise PayloadTooLarge(f"TEI rejected batch with 413 ({len(r.request.content)} bytes)")
+        r.raise_for_status()
+        return self._extract_embeddings(r.json())
 
     def _post_embed(self, batch: List[str]) -> List[List[float]]:
         for attempt in range(self.max_retries):
             try:
-                r = self.client.post("/embed", json={"inputs": batch})
-                r.raise_for_status()
-                payload = r.json()
-                return self._extract_embeddings(payload)
+                with embed_request_seconds.time():
+                    r = self.client.post("/embed", json={"inputs": batch})
+                return self._check_response(r)
             except (httpx.ConnectError, httpx.HTTPError) as e:
-                if attempt < self.max_retries - 1:
+                if attempt < self.max_retries - 1 and self._should_retry(e):
                     wait_time = self.retry_delay * (attempt + 1)
                     logger.warning(
                         f"TEI service connection failed (attempt {attempt + 1}/{self.max_retries}). "
@@ -42,7 +76,26 @@ class TEIEmbeddings(Embeddings):
                     )
                     time.sleep(wait_time)
                 else:
-                    logger.error(f"TEI service unavailable after {self.max_retries} attempts")
+                    logger.error(f"TEI service unavailable after {attempt + 1} attempts")
+                    raise
+
+    async def _apost_embed(self, batch: List[str]) -> List[List[float]]:
+        client = self._get_async_client()
+        for attempt in range(self.max_retries):
+            try:
+                with embed_request_seconds.time():
+                    r = await client.post("/embed", json={"inputs": batch})
+                return self._check_response(r)
+            except (httpx.ConnectError, httpx.HTTPError) as e:
+                if attempt < self.max_retries - 1 and self._should_retry(e):
+                    wait_time = self.retry_delay * (attempt + 1)
+                    logger.warning(
+                        f"TEI service connection failed (attempt {attempt + 1}/{self.max_retries}). "
+                        f"Retrying in {wait_time}s... Error: {e}"
+                    )
+                    await asyncio.sleep(wait_time)
+                else:
+                    logger.error(f"TEI service unavailable after {attempt + 1} attempts")
                     raise
 
     def _extract_embeddings(self, payload) -> List[List[float]]:
@@ -68,16 +121,94 @@ class TEIEmbeddings(Embeddings):
             return payload
         raise ValueError("Unexpected TEI embeddings response format")
 
+    def _iter_batches(self, texts: List[str]) -> Iterator[List[str]]:
+        """Split texts into batches bounded by both item count and total characters."""
+        batch: List[str] = []
+        chars = 0
+        for t in texts:
+            if batch and (len(batch) >= self.batch_size or chars + len(t) > self.max_batch_chars):
+                yield batch
+                batch, chars = [], 0
+            batch.append(t)
+            chars += len(t)
+        if batch:
+            yield batch
+
+    def _shrink_after_413(self, batch: List[str]) -> None:
+        chars = sum(len(t) for t in batch)
+        new_limit = max(1, chars // 2)
+        if new_limit < self.max_batch_chars:
+            logger.warning(
+                "TEI returned 413 for %s texts (%s chars); lowering max_batch_chars %s -> %s",
+                len(batch), chars, self.max_batch_chars, new_limit,
+            )
+            self.max_batch_chars = new_limit
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        try:
+            return self._post_embed(batch)
+        except PayloadTooLarge:
+            if len(batch) == 1:
+                raise
+            self._shrink_after_413(batch)
+            mid = len(batch) // 2
+            return self._embed_batch(batch[:mid]) + self._embed_batch(batch[mid:])
+
+    async def _aembed_batch(self, batch: List[str]) -> List[List[float]]:
+        try:
+            async with self._get_semaphore():
+                return await self._apost_embed(batch)
+        except PayloadTooLarge:
+            if len(batch) == 1:
+                raise
+            self._shrink_after_413(batch)
+            mid = len(batch) // 2
+            left, right = await asyncio.gather(
+                self._aembed_batch(batch[:mid]), self._aembed_batch(batch[mid:])
+            )
+            return left + right
+
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         # Batch requests to avoid exceeding server request size limits
         if not texts:
             return []
         all_embeddings: List[List[float]] = []
-        for i in range(0, len(texts), self.batch_size):
-            batch = texts[i : i + self.batch_size]
-            embeddings = self._post_embed(batch)
-            all_embeddings.extend(embeddings)
+        for batch in self._iter_batches(texts):
+            all_embeddings.extend(self._embed_batch(batch))
         return all_embeddings
 
     def embed_query(self, text: str) -> List[float]:
         return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts with up to max_concurrency batches in flight; results keep input order."""
+        if not texts:
+            return []
+        results = await asyncio.gather(
+            *(self._aembed_batch(batch) for batch in self._iter_batches(texts))
+        )
+        return [vec for batch in results for vec in batch]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_concurrency * 2),
+            )
+        return self._async_client
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def aclose(self) -> None:
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        self._semaphore = None
@@ -0,0 +1,218 @@
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+from sqlalchemy import text
+
+from config import settings
+from services.db import get_session
+
+logger = logging.getLogger(__name__)
+
+# Index names managed by the Alembic migrations; queries use cosine distance (<=>),
+# so both indexes are built with vector_cosine_ops (halfvec_cosine_ops for halfvec storage).
+HNSW_INDEX_NAME = "ix_documents_embedding_hnsw"
+IVFFLAT_INDEX_NAME = "ix_documents_embedding_ivfflat"
+# With binary quantization the ANN index is over binary_quantize(embedding) (Hamming, <~>)
+BINARY_HNSW_INDEX_NAME = "ix_documents_embedding_bit_hnsw"
+BINARY_IVFFLAT_INDEX_NAME = "ix_documents_embedding_bit_ivfflat"
+
+VECTOR_STORAGE_TYPES = ("vector", "halfvec")
+VECTOR_QUANTIZATIONS = ("none", "binary")
+
+
+def storage_type() -> str:
+    storage = (settings.vector_storage or "vector").lower()
+    if storage not in VECTOR_STORAGE_TYPES:
+        raise ValueError(f"Unknown VECTOR_STORAGE: {settings.vector_storage}")
+    return storage
+
+
+def quantization() -> str:
+    quant = (settings.vector_quantization or "none").lower()
+    if quant not in VECTOR_QUANTIZATIONS:
+        raise ValueError(f"Unknown VECTOR_QUANTIZATION: {settings.vector_quantization}")
+    return quant
+
+
+def embedding_sql_type() -> str:
+    """SQL type of documents.embedding, e.g. 'halfvec(768)'; query vectors are cast to it."""
+    return f"{storage_type()}({int(settings.pgvector_dim)})"
+
+
+def binary_index_expression() -> str:
+    """Indexed expression for binary quantization; queries must repeat it verbatim to use the index."""
+    return f"(binary_quantize(embedding)::bit({int(settings.pgvector_dim)}))"
+
+_SET_LOCAL = text("SELECT set_config(:name, :value, true)")
+# pgvector rejects larger hnsw.ef_search values
+HNSW_MAX_EF_SEARCH = 1000
+
+# Iterative scan modes each index type accepts (pgvector >= 0.8)
+ITERATIVE_SCAN_MODES = {
+    "hnsw": ("off", "strict_order", "relaxed_order"),
+    "ivfflat": ("off", "relaxed_order"),
+}
+_ITERATIVE_SCAN_MIN_VERSION = (0, 8)
+_PGVECTOR_VERSION_SQL = text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+
+# Set by detect_pgvector_version() at startup; None = not probed yet
+_pgvector_version: Optional[Tuple[int, ...]] = None
+
+
+def _parse_version(value: str) -> Tuple[int, ...]:
+    parts = []
+    for part in value.split("."):
+        digits = "".join(ch for ch in part if ch.isdigit())
+        parts.append(int(digits) if digits else 0)
+    return tuple(parts)
+
+
+def detect_pgvector_version() -> Optional[Tuple[int, ...]]:
+    """
+    Read the installed pgvector version once (sync; call at startup). Iterative
+    scans are disabled on versions older than 0.8, or when the probe fails.
+    """
+    global _pgvector_version
+    try:
+        with get_session() as session:
+            value = session.execute(_PGVECTOR_VERSION_SQL).scalar()
+    except Exception as exc:
+        logger.warning("Could not read the pgvector version (%s); iterative scans disabled", exc)
+        _pgvector_version = (0,)
+        return None
+    _pgvector_version = _parse_version(value) if value else (0,)
+    configured = (settings.vector_iterative_scan or "off").lower()
+    if _pgvector_version < _ITERATIVE_SCAN_MIN_VERSION and configured != "off":
+        logger.warning(
+            "pgvector %s does not support iterative scans; ignoring VECTOR_ITERATIVE_SCAN=%s",
+            value, settings.vector_iterative_scan,
+        )
+    return _pgvector_version
+
+
+def iterative_scan_mode(index_type: Optional[str] = None) -> str:
+    """
+    VECTOR_ITERATIVE_SCAN validated for the index type: ivfflat has no
+    strict_order and falls back to relaxed_order, unknown values and
+    pgvector < 0.8 turn it off.
+    """
+    index_type = (index_type or settings.vector_index_type or "none").lower()
+    allowed = ITERATIVE_SCAN_MODES.get(index_type)
+    if allowed is None:
+        return "off"
+    if _pgvector_version is not None and _pgvector_version < _ITERATIVE_SCAN_MIN_VERSION:
+        return "off"
+    mode = (settings.vector_iterative_scan or "off").lower()
+    if mode in allowed:
+        return mode
+    if mode == "strict_order":
+        return "relaxed_order"
+    return "off"
+
+
+def search_settings(filtered: bool = False, candidates: int = 0) -> Dict[str, str]:
+    """
+    Query-time recall knobs for the configured ANN index type. Filtered
+    queries also enable iterative scans, so the index keeps producing
+    candidates until enough rows pass the WHERE clause. HNSW returns at
+    most ef_search rows, so it is raised to the requested candidate count,
+    up to pgvector's limit of 1000.
+    """
+    index_type = (settings.vector_index_type or "none").lower()
+    iterative = iterative_scan_mode(index_type)
+    if index_type == "hnsw":
+        ef_search = min(max(settings.hnsw_ef_search, candidates), HNSW_MAX_EF_SEARCH)
+        values = {"hnsw.ef_search": str(ef_search)}
+    elif index_type == "ivfflat":
+        values = {"ivfflat.probes": str(settings.ivfflat_probes)}
+    else:
+        return {}
+    if filtered and iterative != "off":
+        values[f"{index_type}.iterative_scan"] = iterative
+    return values
+
+
+async def apply_search_settings(session, filtered: bool = False, candidates: int = 0) -> None:
+    """
+    Apply ANN search settings to the async session's current transaction.
+    Uses set_config(..., is_local=true) so the values are scoped to the
+    transaction and never leak to other users of the pooled connection.
+    """
+    for name, value in search_settings(filtered, candidates).items():
+        await session.execute(_SET_LOCAL, {"name": name, "value": value})
+
+
+_INDEX_SQL = text(
+    """
+    SELECT c.relname AS name,
+           am.amname AS method,
+           i.indisvalid AS valid,
+           i.indisready AS ready,
+           pg_relation_size(c.oid) AS size_bytes,
+           pg_size_pretty(pg_relation_size(c.oid)) AS size,
+           pg_get_indexdef(c.oid) AS definition
+    FROM pg_index i
+    JOIN pg_class c ON c.oid = i.indexrelid
+    JOIN pg_am am ON am.oid = c.relam
+    WHERE i.indrelid = 'documents'::regclass
+      AND am.amname IN ('hnsw', 'ivfflat')
+    ORDER BY c.relname
+    """
+)
+
+_PROGRESS_SQL = text(
+    """
+    SELECT p.pid,
+           c.relname AS index_name,
+           p.command,
+           p.phase,
+           p.blocks_total,
+           p.blocks_done,
+           p.tuples_total,
+           p.tuples_done
+    FROM pg_stat_progress_create_index p
+    LEFT JOIN pg_class c ON c.oid = p.index_relid
+    WHERE p.relid = 'documents'::regclass
+    """
+)
+
+_TABLE_SQL = text(
+    """
+    SELECT c.reltuples::bigint AS estimated_rows,
+           pg_total_relation_size(c.oid) AS total_bytes,
+           pg_size_pretty(pg_total_relation_size(c.oid)) AS total_size
+    FROM pg_class c
+    WHERE c.oid = 'documents'::regclass
+    """
+)
+
+
+def _percent(done: Any, total: Any) -> float | None:
+    if not total:
+        return None
+    return round(100.0 * float(done or 0) / float(total), 2)
+
+
+def get_index_status() -> Dict[str, Any]:
+    """Report ANN indexes on documents.embedding, their size, and any in-progress builds."""
+    with get_session() as session:
+        indexes = [dict(r._mapping) for r in session.execute(_INDEX_SQL).fetchall()]
+        progress_rows = session.execute(_PROGRESS_SQL).fetchall()
+        table = session.execute(_TABLE_SQL).fetchone()
+
+    builds: List[Dict[str, Any]] = []
+    for r in progress_rows:
+        row = dict(r._mapping)
+        row["blocks_percent"] = _percent(row["blocks_done"], row["blocks_total"])
+        row["tuples_percent"] = _percent(row["tuples_done"], row["tuples_total"])
+        builds.append(row)
+
+    return {
+        "configured_index_type": settings.vector_index_type,
+        "storage": embedding_sql_type(),
+        "quantization": quantization(),
+        "search_settings": search_settings(),
+        "table": dict(table._mapping) if table is not None else None,
+        "indexes": indexes,
+        "builds_in_progress": builds,
+    }
@@ -1,13 +1,21 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Iterable
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from uuid import uuid4
+import asyncio
+import hashlib
 import logging
 
+import numpy as np
+from psycopg.types.json import Jsonb
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
 from config import settings
 from services.tei_embeddings import TEIEmbeddings
 from services.models import Document
-from services.db import get_session
+from services.db import get_raw_connection, get_session
 
 logger = logging.getLogger(__name__)
 
@@ -28,42 +36,272 @@ def _extract_metadata(doc: object) -> dict:
     raise TypeError(f"Unsupported document payload: {type(doc)!r}")
 
 
+def _check_count(texts: Sequence[str], vectors: Sequence[object]) -> None:
+    if len(vectors) != len(texts):
+        raise RuntimeError(
+            f"Embedding count mismatch: expected {len(texts)}, got {len(vectors)}"
+        )
+
+
+def content_hash(content: str) -> str:
+    """SHA-256 of the chunk text; matches encode(sha256(convert_to(content, 'UTF8')), 'hex')."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+# Binary COPY uses pgvector's binary encoding for the embedding column; the
+# vector type is registered on every pooled connection in services.db.
+# Rows land in a per-connection temp table first so duplicates can be skipped
+# with ON CONFLICT, which COPY itself does not support.
+_STAGING_DDL = (
+    "CREATE TEMP TABLE IF NOT EXISTS documents_staging ("
+    "id uuid, content text, embedding vector, metadata jsonb, "
+    "content_hash text, embedding_model text"
+    ") ON COMMIT DELETE ROWS"
+)
+_COPY_SQL = (
+    "COPY documents_staging (id, content, embedding, metadata, content_hash, embedding_model) "
+    "FROM STDIN WITH (FORMAT BINARY)"
+)
+_COPY_TYPES: List[str] = ["uuid", "text", "vector", "jsonb", "text", "text"]
+_MERGE_SQL = (
+    "INSERT INTO documents (id, content, embedding, metadata, content_hash, embedding_model) "
+    "SELECT id, content, embedding, metadata, content_hash, embedding_model FROM documents_staging "
+    "ON CONFLICT (embedding_model, content_hash) DO NOTHING"
+)
+
+# Every chunk of a batch, stored now or earlier, is linked to the upload and
+# page it came from, so metadata filters also match chunks a later upload reused
+_LINK_SQL = text(
+    "INSERT INTO document_ingestions (document_id, ingestion_id, source, filename, page) "
+    "SELECT d.id, o.ingestion_id, o.source, o.filename, o.page "
+    "FROM unnest(CAST(:hashes AS text[]), CAST(:ingestion_ids AS text[]), CAST(:sources AS text[]), "
+    "CAST(:filenames AS text[]), CAST(:pages AS int[])) "
+    "AS o(content_hash, ingestion_id, source, filename, page) "
+    "JOIN documents d ON d.embedding_model = :model AND d.content_hash = o.content_hash "
+    "ON CONFLICT DO NOTHING "
+    "RETURNING document_id"
+)
+
+_EXISTING_HASHES = text(
+    "SELECT content_hash FROM documents "
+    "WHERE embedding_model = :model AND content_hash IN :hashes"
+).bindparams(bindparam("hashes", expanding=True))
+
+
+@dataclass
+class EmbeddedBatch:
+    """Chunks that have been embedded but not yet written."""
+
+    texts: List[str]
+    metadatas: List[dict]
+    vectors: List[Sequence[float]]
+    hashes: List[str] = field(default_factory=list)
+    # Chunks dropped before embedding because their hash is already stored
+    reused: int = 0
+    # (hash, metadata) of every chunk in the batch, including the reused ones
+    occurrences: List[Tuple[str, dict]] = field(default_factory=list)
+    # New document_ingestions rows, set by write_batch
+    links_written: int = 0
+
+
 @dataclass
 class PostgresVectorStore:
     """Embed documents with TEI and persist them in the local Postgres table."""
 
     embeddings: TEIEmbeddings
+    embedding_model: str = settings.embedding_model
 
     def add_documents(self, docs: Iterable[object]) -> int:
-        items = list(docs)
-        if not items:
-            logger.info("No documents to add to vector store; skipping")
+        batch = self._dedupe(docs)
+        if not batch.texts:
+            logger.info("No new documents to add to vector store; recording reused chunks only")
+            return self.write_batch(batch)
+
+        logger.debug("Embedding %s chunks via TEI", len(batch.texts))
+        batch.vectors = self.embeddings.embed_documents(batch.texts)
+        _check_count(batch.texts, batch.vectors)
+        return self.write_batch(batch)
+
+    async def aadd_documents(self, docs: Iterable[object]) -> int:
+        """Async variant: concurrent TEI batches, then the blocking write in a thread."""
+        batch = await self.aembed(docs)
+        if not batch.texts:
+            logger.info("No new documents to add to vector store; recording reused chunks only")
+        return await asyncio.to_thread(self.write_batch, batch)
+
+    async def aembed(self, docs: Iterable[object]) -> EmbeddedBatch:
+        """Embed the chunks not already stored (first half of aadd_documents)."""
+        batch = await asyncio.to_thread(self._dedupe, docs)
+        if not batch.texts:
+            return batch
+        logger.debug(
+            "Embedding %s chunks via TEI (async), reusing %s", len(batch.texts), batch.reused
+        )
+        batch.vectors = await self.embeddings.aembed_documents(batch.texts)
+        _check_count(batch.texts, batch.vectors)
+        return batch
+
+    def write_batch(self, batch: EmbeddedBatch) -> int:
+        """
+        Persist a batch returned by aembed (second half of aadd_documents),
+        then link all of its chunks, new and reused, to their upload.
+        """
+        inserted = 0
+        if batch.texts:
+            inserted = self.write(batch.texts, batch.metadatas, batch.vectors, hashes=batch.hashes)
+        batch.links_written = self.link_occurrences(batch.occurrences)
+        return inserted
+
+    def link_occurrences(self, occurrences: Sequence[Tuple[str, dict]]) -> int:
+        """Record the upload/page of already-stored chunks in document_ingestions; returns new rows."""
+        if not occurrences:
             return 0
 
-        texts = [_extract_content(doc) for doc in items]
-        metadatas = [_extract_metadata(doc) for doc in items]
-        logger.debug("Embedding %s chunks via TEI", len(texts))
-        vectors = self.embeddings.embed_documents(texts)
-        if len(vectors) != len(texts):
-            raise RuntimeError(
-                f"Embedding count mismatch: expected {len(texts)}, got {len(vectors)}"
-            )
+        def _text(value) -> Optional[str]:
+            return None if value is None else str(value)
+
+        params = {
+            "model": self.embedding_model,
+            "hashes": [h for h, _ in occurrences],
+            "ingestion_ids": [_text(m.get("ingestion_id")) for _, m in occurrences],
+            "sources": [_text(m.get("source")) for _, m in occurrences],
+            "filenames": [_text(m.get("filename")) for _, m in occurrences],
+            "pages": [m.get("page") if isinstance(m.get("page"), int) else None for _, m in occurrences],
+        }
+        with get_session() as session:
+            linked = len(session.execute(_LINK_SQL, params).all())
+            session.commit()
+        return linked
+
+    def _dedupe(self, docs: Iterable[object]) -> EmbeddedBatch:
+        """Drop chunks whose content hash is repeated in the batch or already stored for this model."""
+        unique: Dict[str, object] = {}
+        occurrences: List[Tuple[str, dict]] = []
+        for doc in docs:
+            digest = content_hash(_extract_content(doc))
+            occurrences.append((digest, _extract_metadata(doc)))
+            unique.setdefault(digest, doc)
+
+        existing = self.existing_hashes(list(unique))
+        fresh = [(h, doc) for h, doc in unique.items() if h not in existing]
+        return EmbeddedBatch(
+            texts=[_extract_content(doc) for _, doc in fresh],
+            metadatas=[_extract_metadata(doc) for _, doc in fresh],
+            vectors=[],
+            hashes=[h for h, _ in fresh],
+            reused=len(occurrences) - len(fresh),
+            occurrences=occurrences,
+        )
+
+    def existing_hashes(self, hashes: Sequence[str]) -> set[str]:
+        if not hashes:
+            return set()
+        with get_session() as session:
+            rows = session.execute(
+                _EXISTING_HASHES, {"model": self.embedding_model, "hashes": list(hashes)}
+            ).fetchall()
+        return {r.content_hash for r in rows}
+
+    def write(
+        self,
+        texts: Sequence[str],
+        metadatas: Sequence[dict],
+        vectors: Sequence[Sequence[float]],
+        use_copy: Optional[bool] = None,
+        hashes: Optional[Sequence[str]] = None,
+    ) -> int:
+        """
+        Persist already-embedded chunks, via binary COPY unless disabled.
+        Returns the number of rows inserted; chunks whose hash already exists
+        for this embedding model are skipped.
+        """
+        if use_copy is None:
+            use_copy = settings.ingest_use_copy
+        if not hashes:
+            hashes = [content_hash(t) for t in texts]
+        logger.debug(
+            "Persisting %s embedded chunks to Postgres (%s)",
+            len(texts),
+            "COPY" if use_copy else "ORM",
+        )
+        if use_copy:
+            return self._write_copy(texts, metadatas, vectors, hashes)
+        return self._write_orm(texts, metadatas, vectors, hashes)
 
-        logger.debug("Persisting %s embedded chunks to Postgres", len(vectors))
+    def _write_orm(
+        self,
+        texts: Sequence[str],
+        metadatas: Sequence[dict],
+        vectors: Sequence[Sequence[float]],
+        hashes: Sequence[str],
+    ) -> int:
+        inserted = 0
+        table = Document.__table__
         with get_session() as session:
-            for content, metadata, embedding in zip(texts, metadatas, vectors):
-                record = Document(
-                    content=content,
-                    embedding=embedding,
-                    meta=metadata,
+            for content, metadata, embedding, digest in zip(texts, metadatas, vectors, hashes):
+                stmt = (
+                    pg_insert(table)
+                    .values(
+                        id=uuid4(),
+                        content=content,
+                        embedding=embedding,
+                        metadata=metadata,
+                        content_hash=digest,
+                        embedding_model=self.embedding_model,
+                    )
+                    .on_conflict_do_nothing(index_elements=["embedding_model", "content_hash"])
+                    .returning(table.c.id)
                 )
-                session.add(record)
+                # rowcount is -1 for INSERT .. ON CONFLICT; a skipped duplicate returns no row
+                inserted += len(session.execute(stmt).all())
             session.commit()
-        return len(items)
+        return inserted
+
+    def _write_copy(
+        self,
+        texts: Sequence[str],
+        metadatas: Sequence[dict],
+        vectors: Sequence[Sequence[float]],
+        hashes: Sequence[str],
+    ) -> int:
+        rows = list(zip(texts, metadatas, vectors, hashes))
+        batch_size = max(1, settings.ingest_write_batch_size)
+        inserted = 0
+        with get_raw_connection() as conn:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start : start + batch_size]
+                with conn.cursor() as cur:
+                    cur.execute(_STAGING_DDL)
+                    with cur.copy(_COPY_SQL) as copy:
+                        copy.set_types(_COPY_TYPES)
+                        for content, metadata, embedding, digest in batch:
+                            copy.write_row(
+                                (
+                                    uuid4(),
+                                    content,
+                                    np.asarray(embedding, dtype=np.float32),
+                                    Jsonb(metadata),
+                                    digest,
+                                    self.embedding_model,
+                                )
+                            )
+                    cur.execute(_MERGE_SQL)
+                    inserted += max(cur.rowcount, 0)
+                conn.commit()
+                logger.debug(
+                    "Committed COPY batch (%s/%s rows, %s inserted)",
+                    start + len(batch), len(rows), inserted,
+                )
+        return inserted
 
 
 vector_store = PostgresVectorStore(
-    embeddings=TEIEmbeddings(base_url=settings.tei_base_url)
+    embeddings=TEIEmbeddings(
+        base_url=settings.tei_base_url,
+        batch_size=settings.tei_batch_size,
+        max_batch_chars=settings.tei_max_batch_chars,
+        max_concurrency=settings.tei_max_concurrency,
+    )
 )
 
-__all__ = ["vector_store", "PostgresVectorStore"]
+__all__ = ["vector_store", "PostgresVectorStore", "EmbeddedBatch", "content_hash"]
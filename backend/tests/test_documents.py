@@ -0,0 +1,27 @@
+import base64
+
+import numpy as np
+import pytest
+
+from services.documents import encode_embedding
+
+pgvector = pytest.importorskip("pgvector")
+
+
+def _decode(encoded: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(encoded), "<f4")
+
+
+def test_encode_embedding_float32():
+    values = np.array([0.25, -1.5, 3.0], dtype=np.float32)
+    assert np.array_equal(_decode(encode_embedding(values)), values)
+
+
+def test_encode_embedding_halfvec():
+    # VECTOR_STORAGE=halfvec: the column is read back as a pgvector HalfVector
+    values = [0.5, -2.0, 1.25]
+    assert np.array_equal(_decode(encode_embedding(pgvector.HalfVector(values))), np.array(values, dtype=np.float32))
+
+
+def test_encode_embedding_none():
+    assert encode_embedding(None) is None
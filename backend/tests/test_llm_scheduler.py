@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from services import llm_scheduler as scheduler_module
+from services.llm_scheduler import GenerationCancelled, LLMScheduler
+
+
+def test_slot_handed_over_as_wait_times_out_is_kept(monkeypatch):
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=4, queue_timeout=0.01)
+        real_wait_for = asyncio.wait_for
+
+        async def racing_wait_for(fut, timeout):
+            # The holder releases (handing its slot to fut) in the same iteration the timeout fires
+            scheduler._release()
+            await asyncio.sleep(0)
+            raise asyncio.TimeoutError
+
+        await scheduler._acquire(0)  # the holder
+        monkeypatch.setattr(scheduler_module.asyncio, "wait_for", racing_wait_for)
+        try:
+            await scheduler._acquire(0)  # admitted with the handed-over slot, not LLMOverloaded
+        finally:
+            monkeypatch.setattr(scheduler_module.asyncio, "wait_for", real_wait_for)
+        assert scheduler._active == 1
+        assert scheduler.timed_out == 0
+
+        scheduler._release()
+        assert scheduler._active == 0
+        # No slot was lost: a new request is admitted at once
+        async with scheduler.slot():
+            assert scheduler._active == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_shared_stream_is_an_error_for_followers():
+    async def scenario():
+        scheduler = LLMScheduler(max_concurrency=1, max_queue=4, queue_timeout=1)
+        started = asyncio.Event()
+
+        async def generate():
+            yield "partial"
+            started.set()
+            await asyncio.sleep(3600)
+            yield "never"
+
+        async def follow():
+            return [part async for part in scheduler.stream("key", generate)]
+
+        follower = asyncio.create_task(follow())
+        await started.wait()
+        scheduler._streams["key"].task.cancel()
+        with pytest.raises(GenerationCancelled):
+            await follower
+
+    asyncio.run(scenario())
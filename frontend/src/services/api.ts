@@ -3,7 +3,8 @@ import { http } from "./http";
 
 export interface UploadResponse {
   message: string;
-  inserted_count: number;
+  job_id: string;
+  status: string;
 }
 
 export interface QueryResponse {
@@ -26,8 +27,11 @@ export const uploadPdf = (file: File) => {
   });
 };
 
-export const listDocuments = (skip = 0, limit = 10) =>
-  http.get<any[]>(`/v1/documents?skip=${skip}&limit=${limit}`);
+// Pass the previous response's X-Next-Cursor header to fetch the next page
+export const listDocuments = (limit = 10, cursor?: string) =>
+  http.get<any[]>("/v1/documents", {
+    params: cursor ? { limit, cursor } : { limit },
+  });
 
 export const ask = (question: string, conversationId?: string) =>
   http.post<QueryResponse>("/v1/query", {
@@ -55,15 +59,42 @@ export const askStream = async (
     throw new Error(`HTTP ${res.status}: ${await res.text()}`);
   }
 
+  // Server-Sent Events: "sources", "token" ({text}), "done" or "error"; ": ping" heartbeats are ignored
   const reader = res.body!.getReader();
   const decoder = new TextDecoder();
-  let answer = "";
+  const parts: string[] = [];
+  let buffer = "";
+  let failed: string | undefined;
+
+  const handleEvent = (block: string) => {
+    let event = "message";
+    const data: string[] = [];
+    for (const line of block.split("\n")) {
+      if (line.startsWith("event:")) event = line.slice(6).trim();
+      else if (line.startsWith("data:")) data.push(line.slice(5).trimStart());
+    }
+    if (!data.length) return;
+    const payload = JSON.parse(data.join("\n"));
+    if (event === "token") parts.push(payload.text);
+    else if (event === "error") failed = payload.detail;
+  };
 
   while (true) {
     const { value, done } = await reader.read();
     if (done) break;
-    answer += decoder.decode(value, { stream: true });
+    buffer += decoder.decode(value, { stream: true });
+    let boundary = buffer.indexOf("\n\n");
+    while (boundary !== -1) {
+      handleEvent(buffer.slice(0, boundary));
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf("\n\n");
+    }
+  }
+
+  if (failed) {
+    throw new Error(failed);
   }
+  const answer = parts.join("");
 
   return {
     answer,
@@ -72,7 +103,21 @@ export const askStream = async (
   };
 };
 
-export const fetchHistory = (conversationId: string) =>
-  http.get<{ question: string; answer: string }[]>(
-    `/v1/history/${conversationId}`
-  );
+export interface HistoryTurn {
+  question: string;
+  answer: string;
+}
+
+// Follows X-Next-Cursor until the whole conversation is loaded
+export const fetchHistory = async (conversationId: string) => {
+  const turns: HistoryTurn[] = [];
+  let cursor: string | undefined;
+  do {
+    const res = await http.get<HistoryTurn[]>(`/v1/history/${conversationId}`, {
+      params: cursor ? { cursor } : undefined,
+    });
+    turns.push(...res.data);
+    cursor = res.headers["x-next-cursor"] || undefined;
+  } while (cursor);
+  return { data: turns };
+};